@@ -0,0 +1,102 @@
+# File: bench_import
+# Author: Haozhou Wang
+# Organization: UTOkyo FieldPhenomics Lab
+# Description:
+#     Import time of the core geometry package (fieldimagepy) in fresh interpreters,
+#     checked against a time budget and for Qt / QGIS / GDAL modules loaded at import
+# Dependencies:
+#     - Python 3.x
+#     - NumPy
+# License: MIT
+# Usage:
+#     python benchmarks/bench_import.py
+#     python benchmarks/bench_import.py --repeat 20 --budget 50 --output import.json
+#
+#     QGIS中NumPy在启动时已经加载, 因此预算针对预先导入NumPy后的核心模块导入时间;
+#     同时给出包含NumPy的冷启动时间作为参考
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+_pyscripts_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                              "pyscripts")
+
+REPEAT = 10
+BUDGET_MS = 50.0
+MODULES = ("fieldimagepy", "fieldimagepy.grid", "fieldimagepy.minrect", "fieldimagepy.batch")
+# 核心模块导入时不应加载的模块(界面, QGIS, GDAL, 进程池)
+FORBIDDEN = ("qgis", "PyQt5", "PyQt6", "osgeo", "multiprocessing", "fieldimagepy.i18n")
+
+_PROBE = """
+import sys, time, json
+preload = {preload!r}
+if preload:
+    import numpy
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+loaded = sorted({{m.split(".")[0] if not m.startswith("fieldimagepy") else m
+                  for m in sys.modules}})
+print(json.dumps(dict(seconds=seconds, modules=loaded)))
+"""
+
+
+def probe(module, preload):
+    """在新的解释器中导入module一次, 返回(耗时秒, 已加载的模块)"""
+    env = dict(os.environ, PYTHONPATH=_pyscripts_dir)
+    out = subprocess.run([sys.executable, "-c", _PROBE.format(module=module, preload=preload)],
+                         env=env, capture_output=True, text=True, check=True).stdout
+    report = json.loads(out)
+    return report["seconds"], report["modules"]
+
+
+def forbidden_modules(loaded):
+    return sorted(m for m in loaded if m.split(".")[0] in FORBIDDEN or m in FORBIDDEN)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the import time of fieldimagepy")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="fresh interpreters per module")
+    parser.add_argument("--budget", type=float, default=BUDGET_MS,
+                        help="fail when the median import (NumPy preloaded) exceeds this (ms)")
+    parser.add_argument("--output", help="write results to this JSON file")
+    args = parser.parse_args(argv)
+
+    # 第一次运行生成字节码缓存, 不计入结果
+    probe(MODULES[0], True)
+
+    results = []
+    status = 0
+    for module in MODULES:
+        for preload in (True, False):
+            times, loaded = [], []
+            for _ in range(args.repeat):
+                seconds, loaded = probe(module, preload)
+                times.append(seconds)
+            median = statistics.median(times) * 1000
+            bad = forbidden_modules(loaded)
+            over = preload and median > args.budget
+            results.append(dict(module=module, numpy_preloaded=preload, median_ms=median,
+                                min_ms=min(times) * 1000, repeat=len(times),
+                                forbidden=bad, over_budget=over))
+            label = "numpy preloaded" if preload else "cold (incl. numpy)"
+            flag = "  OVER BUDGET" if over else ""
+            flag += f"  loads {', '.join(bad)}" if bad else ""
+            print(f"{module:<22} {label:<20} {median:8.1f} ms (min {min(times) * 1000:.1f}){flag}")
+            if over or bad:
+                status = 1
+
+    print(f"budget: {args.budget:g} ms with NumPy preloaded -> {'FAIL' if status else 'OK'}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(dict(budget_ms=args.budget, python=sys.version.split()[0],
+                           results=results), f, indent=1)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,279 @@
+# File: bench_pipeline
+# Author: Haozhou Wang
+# Organization: UTOkyo FieldPhenomics Lab
+# Description:
+#     Benchmarks of the subplot division pipeline on synthetic field layouts,
+#     timed per stage and written as JSON, with a regression check against a baseline
+# Dependencies:
+#     - Python 3.x
+#     - NumPy
+#     - QGIS 3.x (optional, for the transform, feature and writer stages)
+# License: MIT
+# Usage:
+#     python benchmarks/bench_pipeline.py --output bench.json
+#     python benchmarks/bench_pipeline.py --sizes 10 100 --compare bench.json --threshold 1.25
+#
+#     QGIS的Python环境中(如OSGeo4W shell或qgis_process的python)运行时, 坐标转换,
+#     要素生成和写出阶段使用qgis绑定; 否则使用纯NumPy的替代实现, 写出阶段被跳过
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+# fieldimagepy位于../pyscripts
+_pyscripts_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                              "pyscripts")
+if _pyscripts_dir not in sys.path:
+    sys.path.insert(0, _pyscripts_dir)
+
+from fieldimagepy import (BlockSpec, QuadGrid, SubplotGrid, cells_to_wkb, convex_hull,
+                          divide_blocks)
+from fieldimagepy.minrect import min_area_rectangle
+
+SIZES = (10, 100, 1000)
+# 写出阶段的最大网格边长, 1000×1000(一百万个要素)写出需要数分钟
+MAX_WRITE_SIZE = 300
+DRIVERS = (".shp", ".gpkg", ".fgb")
+THRESHOLD = 1.25
+# 比较时忽略差值小于该值(秒)的阶段, 亚毫秒级的阶段受计时噪声影响
+MIN_DELTA = 0.001
+
+
+# ---------- 合成的边界 ----------
+
+def rotated_rectangle(width=120.0, height=60.0, angle=23.0, origin=(500000.0, 3950000.0)):
+    """旋转的矩形边界(4, 2), 投影坐标(米)"""
+    a = np.radians(angle)
+    x_axis = np.array([np.cos(a), np.sin(a)])
+    y_axis = np.array([-np.sin(a), np.cos(a)])
+    o = np.asarray(origin)
+    return np.array([o, o + width * x_axis, o + width * x_axis + height * y_axis,
+                     o + height * y_axis])
+
+
+def rtk_trace(n=20000, noise=0.02, seed=0, **kwargs):
+    """沿矩形边界步行记录的RTK轨迹(n, 2), 带厘米级噪声"""
+    rect = rotated_rectangle(**kwargs)
+    rng = np.random.default_rng(seed)
+    closed = np.vstack([rect, rect[:1]])
+    lengths = np.hypot(*np.diff(closed, axis=0).T)
+    t = np.sort(rng.random(n)) * lengths.sum()
+    edge = np.searchsorted(np.cumsum(lengths), t, side="right")
+    local = (t - np.concatenate([[0], np.cumsum(lengths)[:-1]])[edge]) / lengths[edge]
+    points = closed[edge] + local[:, None] * (closed[edge + 1] - closed[edge])
+    return points + rng.normal(0, noise, points.shape)
+
+
+def multi_block(n_blocks=400, rows=8, cols=4):
+    """试验田中排列的多个区块(BlockSpec列表), 每个区块为稍有旋转的矩形"""
+    side = int(np.ceil(np.sqrt(n_blocks)))
+    blocks = []
+    for i in range(n_blocks):
+        origin = (500000.0 + (i % side) * 30.0, 3950000.0 + (i // side) * 50.0)
+        hull = rotated_rectangle(25.0, 45.0, angle=2.0 + 0.01 * i, origin=origin)
+        blocks.append(BlockSpec(i, hull, rows, cols, 0.3, 0.5))
+    return blocks
+
+
+# ---------- 计时 ----------
+
+def timeit(func, repeat):
+    """运行repeat次, 返回各次耗时(秒)"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+class Recorder:
+
+    """记录每个(案例, 阶段)的耗时"""
+
+    def __init__(self, repeat):
+        self.repeat = repeat
+        self.results = []
+
+    def run(self, case, stage, func, repeat=None, **info):
+        times = timeit(func, repeat or self.repeat)
+        self.results.append(dict(case=case, stage=stage, seconds=statistics.median(times),
+                                 min=min(times), repeat=len(times), **info))
+        print(f"{case:<28} {stage:<22} {statistics.median(times) * 1000:10.2f} ms")
+
+    def skip(self, case, stage, reason):
+        self.results.append(dict(case=case, stage=stage, seconds=None, skipped=reason))
+        print(f"{case:<28} {stage:<22} {'skipped':>13} ({reason})")
+
+
+# ---------- QGIS ----------
+
+def init_qgis():
+    """无界面初始化QGIS, 不可用时返回None"""
+    try:
+        from qgis.core import QgsApplication
+    except ImportError:
+        return None
+    app = QgsApplication.instance()
+    if app is None:
+        app = QgsApplication([], False)
+        app.initQgis()
+    return app
+
+
+def qgis_stages(recorder, case, grid, out_dir, write):
+    """坐标转换, 要素生成和各输出格式的写出"""
+    from qgis.core import QgsCoordinateReferenceSystem, QgsCoordinateTransformContext
+    from fieldimagepy import api
+    from fieldimagepy.batch import BlockResult
+
+    src = QgsCoordinateReferenceSystem("EPSG:32654")
+    dst = QgsCoordinateReferenceSystem("EPSG:6677")
+    transform = api.crs_transform(src, dst, QgsCoordinateTransformContext())
+    recorder.run(case, "crs_transform", lambda: api.grid_cells(grid, transform))
+
+    fields = api.subplot_fields()
+    results = [BlockResult(None, None, grid)]
+    recorder.run(case, "features", lambda: sum(
+        len(chunk) for chunk in api.iter_subplot_features(fields, results)), repeat=1)
+
+    for ext in DRIVERS:
+        stage = f"write{ext}"
+        if not write:
+            recorder.skip(case, stage, f"larger than {MAX_WRITE_SIZE}x{MAX_WRITE_SIZE}")
+            continue
+        path = os.path.join(out_dir, f"subplots{ext}")
+
+        def write_output():
+            for name in os.listdir(out_dir):
+                os.remove(os.path.join(out_dir, name))
+            api.write_subplots(fields, api.iter_subplot_features(fields, results), src, path)
+
+        recorder.run(case, stage, write_output, repeat=1)
+
+
+def numpy_stages(recorder, case, grid):
+    """不使用QGIS时的替代: 格网点的仿射变换和WKB编码"""
+    matrix = np.array([[0.9996, 0.0012], [-0.0012, 0.9996]])
+    offset = np.array([-4.5e5, -3.9e6])
+    recorder.run(case, "crs_transform", lambda: grid.cells(
+        lattice=grid.lattice() @ matrix.T + offset), backend="numpy")
+    recorder.run(case, "features", lambda: cells_to_wkb(grid.cells()), backend="numpy")
+    for ext in DRIVERS:
+        recorder.skip(case, f"write{ext}", "requires QGIS")
+
+
+# ---------- 基准 ----------
+
+def run_benchmarks(sizes, repeat, use_qgis):
+    recorder = Recorder(repeat)
+    rect = rotated_rectangle()
+    # 梯形区块(四边形模式): 上边比下边短20%
+    quad = rect.copy()
+    quad[2:] += np.array([[-0.1], [0.1]]) * (rect[1] - rect[0])
+    trace = rtk_trace()
+    blocks = multi_block()
+
+    # 凸包和最小面积外接矩形
+    recorder.run("rotated_rectangle", "hull_rect", lambda: min_area_rectangle(rect))
+    recorder.run("rtk_trace_20000", "hull", lambda: convex_hull(trace))
+    hull = convex_hull(trace)
+    recorder.run("rtk_trace_20000", "rect", lambda: min_area_rectangle(hull, is_hull=True))
+    recorder.run(f"multi_block_{len(blocks)}", "divide_blocks",
+                 lambda: divide_blocks(blocks, is_hull=False))
+
+    out_dir = tempfile.mkdtemp(prefix="fieldimagepy_bench_")
+    try:
+        for n in sizes:
+            case = f"grid_{n}x{n}"
+            grid = SubplotGrid.from_rectangle(rect, n, n, 0.05, 0.05)
+            recorder.run(case, "grid", lambda: SubplotGrid.from_rectangle(
+                rect, n, n, 0.05, 0.05).cells(), subplots=n * n)
+            recorder.run(case, "grid_quad", lambda: QuadGrid.from_quad(
+                quad, n, n, 0.05, 0.05).cells(), subplots=n * n)
+            if use_qgis:
+                qgis_stages(recorder, case, grid, out_dir, n <= MAX_WRITE_SIZE)
+            else:
+                numpy_stages(recorder, case, grid)
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+    return recorder.results
+
+
+def environment(use_qgis):
+    info = {
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+        "backend": "qgis" if use_qgis else "numpy",
+    }
+    if use_qgis:
+        from qgis.core import Qgis
+        info["qgis"] = Qgis.QGIS_VERSION
+    return info
+
+
+def compare(results, baseline, threshold, min_delta=MIN_DELTA):
+    """与基准结果比较各阶段的最短耗时, 返回超过阈值(耗时比)的阶段列表"""
+    reference = {(r["case"], r["stage"]): r for r in baseline["results"]
+                 if r.get("seconds") is not None}
+    regressions = []
+    for r in results:
+        ref = reference.get((r["case"], r["stage"]))
+        if ref is None or r.get("seconds") is None or ref["min"] <= 0:
+            continue
+        r["baseline"] = ref["min"]
+        r["ratio"] = r["min"] / ref["min"]
+        if r["ratio"] > threshold and r["min"] - ref["min"] > min_delta:
+            regressions.append(r)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the subplot division pipeline")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES),
+                        help="grid sizes n (n x n subplots)")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per stage (median is kept)")
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file to check for regressions")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                        help="fail when a stage is slower than threshold x baseline")
+    parser.add_argument("--no-qgis", action="store_true", help="use the pure NumPy stand-ins")
+    args = parser.parse_args(argv)
+
+    use_qgis = not args.no_qgis and init_qgis() is not None
+    results = run_benchmarks(args.sizes, args.repeat, use_qgis)
+    report = {"environment": environment(use_qgis), "threshold": args.threshold,
+              "results": results}
+
+    status = 0
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        report["regressions"] = [(r["case"], r["stage"], r["ratio"]) for r in regressions]
+        for r in regressions:
+            print(f"REGRESSION {r['case']} {r['stage']}: {r['min'] * 1000:.2f} ms "
+                  f"vs {r['baseline'] * 1000:.2f} ms ({r['ratio']:.2f}x)")
+        status = 1 if regressions else 0
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+# File: canopyCover
+# Author: Haozhou Wang
+# Organization: UTOkyo FieldPhenomics Lab
+# Description:
+#     Processing algorithm of per-subplot canopy cover: vegetation / soil classification
+#     of an index with a global Otsu threshold, reduced tile by tile
+# Dependencies:
+#     - Python 3.x
+#     - NumPy
+#     - QGIS 3.x
+# License: MIT
+# Usage: add this folder to "Processing > Options > Scripts > Scripts folder(s)",
+#     then run from the toolbox or with
+#     qgis_process run script:subplotcanopycover -- INPUT=subplots.gpkg RASTER=dom.tif OUTPUT=cover.gpkg
+
+import os
+import sys
+
+from qgis.PyQt.QtCore import QCoreApplication
+from qgis.core import (QgsCoordinateTransform, QgsFeature, QgsFeatureSink, QgsFields,
+                       QgsProcessing, QgsProcessingAlgorithm, QgsProcessingException,
+                       QgsProcessingParameterBand, QgsProcessingParameterEnum,
+                       QgsProcessingParameterFeatureSink, QgsProcessingParameterFeatureSource,
+                       QgsProcessingParameterNumber, QgsProcessingParameterRasterDestination,
+                       QgsProcessingParameterRasterLayer, QgsProcessingParameterString)
+
+# fieldimagepy位于上一级目录(pyscripts)
+_pyscripts_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _pyscripts_dir not in sys.path:
+    sys.path.insert(0, _pyscripts_dir)
+
+from fieldimagepy import api
+from fieldimagepy.cover import COVER_NAMES, canopy_cover
+from fieldimagepy.errors import FieldShapeError
+from fieldimagepy.indices import INDICES
+
+CUSTOM = "Custom expression"
+VEGETATION = ["Automatic (HUE below, other indices above)", "Above threshold", "Below threshold"]
+
+
+class CanopyCoverAlgorithm(QgsProcessingAlgorithm):
+
+    """按植被指数阈值将像素分为植被和土壤, 计算每个子地块的植被覆盖度"""
+
+    INPUT = "INPUT"
+    RASTER = "RASTER"
+    INDEX = "INDEX"
+    EXPRESSION = "EXPRESSION"
+    RED = "RED"
+    GREEN = "GREEN"
+    BLUE = "BLUE"
+    NIR = "NIR"
+    REDEDGE = "REDEDGE"
+    THRESHOLD = "THRESHOLD"
+    VEGETATION = "VEGETATION"
+    THREADS = "THREADS"
+    OUTPUT = "OUTPUT"
+    MASK = "MASK"
+
+    def tr(self, string):
+        return QCoreApplication.translate("Processing", string)
+
+    def createInstance(self):
+        return CanopyCoverAlgorithm()
+
+    def name(self):
+        return "subplotcanopycover"
+
+    def displayName(self):
+        return self.tr("Subplot canopy cover")
+
+    def group(self):
+        return self.tr("FIELDimagePy")
+
+    def groupId(self):
+        return "fieldimagepy"
+
+    def shortHelpString(self):
+        return self.tr("Classifies DOM pixels into vegetation and soil by thresholding a vegetation "
+                       "index (ExG, HUE, ... or a custom expression) and reports per subplot the "
+                       "canopy cover (vegetated fraction), the vegetated and the valid pixel counts. "
+                       "Without a threshold, a global Otsu threshold is computed from a subsampled "
+                       "histogram read from the raster overviews, so no full pass over the mosaic "
+                       "is needed to pick it. Pixels are classified tile by tile on a thread pool "
+                       "and the counts are accumulated per subplot; the classification mask is "
+                       "only written when requested.")
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(QgsProcessingParameterFeatureSource(
+            self.INPUT, self.tr("Subplot layer"), [QgsProcessing.TypeVectorPolygon]))
+        self.addParameter(QgsProcessingParameterRasterLayer(
+            self.RASTER, self.tr("DOM raster")))
+        self.addParameter(QgsProcessingParameterEnum(
+            self.INDEX, self.tr("Index"), options=list(INDICES) + [CUSTOM],
+            defaultValue=list(INDICES).index("ExG")))
+        self.addParameter(QgsProcessingParameterString(
+            self.EXPRESSION, self.tr("Custom expression"), defaultValue="", optional=True))
+        for name, description, default in [
+                (self.RED, "Red band", 1), (self.GREEN, "Green band", 2),
+                (self.BLUE, "Blue band", 3), (self.NIR, "NIR band", None),
+                (self.REDEDGE, "Red edge band", None)]:
+            self.addParameter(QgsProcessingParameterBand(
+                name, self.tr(description), default, parentLayerParameterName=self.RASTER,
+                optional=True))
+        self.addParameter(QgsProcessingParameterNumber(
+            self.THRESHOLD, self.tr("Threshold (Otsu if empty)"),
+            QgsProcessingParameterNumber.Double, optional=True))
+        self.addParameter(QgsProcessingParameterEnum(
+            self.VEGETATION, self.tr("Vegetation pixels"), options=VEGETATION, defaultValue=0))
+        self.addParameter(QgsProcessingParameterNumber(
+            self.THREADS, self.tr("Worker threads (0 = automatic)"),
+            QgsProcessingParameterNumber.Integer, 0, minValue=0))
+        self.addParameter(QgsProcessingParameterFeatureSink(
+            self.OUTPUT, self.tr("Subplots with canopy cover"), QgsProcessing.TypeVectorPolygon))
+        self.addParameter(QgsProcessingParameterRasterDestination(
+            self.MASK, self.tr("Vegetation mask (1 vegetation, 0 soil)"),
+            optional=True, createByDefault=False))
+
+    def processAlgorithm(self, parameters, context, feedback):
+        source = self.parameterAsSource(parameters, self.INPUT, context)
+        if source is None:
+            raise QgsProcessingException(self.invalidSourceError(parameters, self.INPUT))
+        raster_layer = self.parameterAsRasterLayer(parameters, self.RASTER, context)
+        try:
+            path = api.raster_path(raster_layer)
+        except FieldShapeError as e:
+            raise QgsProcessingException(str(e))
+
+        options = list(INDICES) + [CUSTOM]
+        expression = options[self.parameterAsEnum(parameters, self.INDEX, context)]
+        if expression == CUSTOM:
+            expression = self.parameterAsString(parameters, self.EXPRESSION, context)
+
+        band_map = {}
+        for name, key in [(self.RED, "R"), (self.GREEN, "G"), (self.BLUE, "B"),
+                          (self.NIR, "NIR"), (self.REDEDGE, "RE")]:
+            band = self.parameterAsInt(parameters, name, context)
+            if band:
+                band_map[key] = band
+
+        threshold = None
+        if parameters.get(self.THRESHOLD) not in (None, ""):
+            threshold = self.parameterAsDouble(parameters, self.THRESHOLD, context)
+        vegetation_above = [None, True, False][
+            self.parameterAsEnum(parameters, self.VEGETATION, context)]
+        mask_path = self.parameterAsOutputLayer(parameters, self.MASK, context) or None
+        threads = self.parameterAsInt(parameters, self.THREADS, context) or None
+
+        # 第一遍: 读取子地块几何并转换到栅格坐标系
+        transform = QgsCoordinateTransform(source.sourceCrs(), raster_layer.crs(),
+                                           context.transformContext())
+        polygons = []
+        for feature in source.getFeatures():
+            geom = feature.geometry()
+            geom.transform(transform)
+            polygons.append(api.geometry_rings(geom))
+
+        def progress(fraction):
+            feedback.setProgress(100 * fraction)
+            return not feedback.isCanceled()
+
+        feedback.pushInfo(self.tr("Computing canopy cover of {} subplots").format(len(polygons)))
+        try:
+            values, threshold = canopy_cover(path, polygons, expression, band_map, threshold,
+                                             vegetation_above, mask_path, max_workers=threads,
+                                             progress=progress)
+        except ValueError as e:
+            raise QgsProcessingException(str(e))
+        feedback.pushInfo(self.tr("Threshold: {}").format(threshold))
+        if feedback.isCanceled():
+            return {}
+
+        # 第二遍: 复制要素并附加覆盖度
+        fields = QgsFields(source.fields())
+        for field in api.zonal_fields(COVER_NAMES):
+            fields.append(field)
+
+        sink, dest_id = self.parameterAsSink(parameters, self.OUTPUT, context, fields,
+                                             source.wkbType(), source.sourceCrs())
+        if sink is None:
+            raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT))
+
+        chunk = []
+        for i, feature in enumerate(source.getFeatures()):
+            if feedback.isCanceled():
+                break
+            out = QgsFeature(fields)
+            out.setGeometry(feature.geometry())
+            out.setAttributes(feature.attributes() + api.attribute_values(values[i]))
+            chunk.append(out)
+            if len(chunk) >= api.CHUNK_SIZE:
+                sink.addFeatures(chunk, QgsFeatureSink.FastInsert)
+                chunk = []
+        sink.addFeatures(chunk, QgsFeatureSink.FastInsert)
+
+        outputs = {self.OUTPUT: dest_id}
+        if mask_path:
+            outputs[self.MASK] = mask_path
+        return outputs
@@ -0,0 +1,214 @@
+# File: plantHeight
+# Author: Haozhou Wang
+# Organization: UTOkyo FieldPhenomics Lab
+# Description:
+#     Processing algorithm of per-subplot plant height (DSM minus DTM or minus the soil
+#     baseline of the surrounding alleys), streamed into mergeable histogram sketches
+# Dependencies:
+#     - Python 3.x
+#     - NumPy
+#     - QGIS 3.x
+# License: MIT
+# Usage: add this folder to "Processing > Options > Scripts > Scripts folder(s)",
+#     then run from the toolbox or with
+#     qgis_process run script:subplotplantheight -- INPUT=subplots.gpkg DSM=dsm.tif OUTPUT=height.gpkg
+
+import os
+import sys
+
+from qgis.PyQt.QtCore import QCoreApplication
+from qgis.core import (QgsCoordinateTransform, QgsFeature, QgsFeatureSink, QgsFields,
+                       QgsProcessing, QgsProcessingAlgorithm, QgsProcessingException,
+                       QgsProcessingParameterFeatureSink, QgsProcessingParameterFeatureSource,
+                       QgsProcessingParameterNumber, QgsProcessingParameterRasterLayer,
+                       QgsProcessingParameterString, QgsSpatialIndex)
+
+# fieldimagepy位于上一级目录(pyscripts)
+_pyscripts_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _pyscripts_dir not in sys.path:
+    sys.path.insert(0, _pyscripts_dir)
+
+from fieldimagepy import api
+from fieldimagepy.errors import FieldShapeError
+from fieldimagepy.height import (BIN_WIDTH, HEIGHT_RANGE, HEIGHT_STATISTICS, height_names,
+                                 plant_height, soil_baseline)
+
+
+class PlantHeightAlgorithm(QgsProcessingAlgorithm):
+
+    """计算每个子地块的株高统计(DSM减DTM, 或减去周围走道的土壤基准)"""
+
+    INPUT = "INPUT"
+    DSM = "DSM"
+    DTM = "DTM"
+    ALLEY_WIDTH = "ALLEY_WIDTH"
+    BASELINE_PERCENTILE = "BASELINE_PERCENTILE"
+    PERCENTILES = "PERCENTILES"
+    BIN_WIDTH = "BIN_WIDTH"
+    MAX_HEIGHT = "MAX_HEIGHT"
+    THREADS = "THREADS"
+    OUTPUT = "OUTPUT"
+
+    def tr(self, string):
+        return QCoreApplication.translate("Processing", string)
+
+    def createInstance(self):
+        return PlantHeightAlgorithm()
+
+    def name(self):
+        return "subplotplantheight"
+
+    def displayName(self):
+        return self.tr("Subplot plant height")
+
+    def group(self):
+        return self.tr("FIELDimagePy")
+
+    def groupId(self):
+        return "fieldimagepy"
+
+    def shortHelpString(self):
+        return self.tr("Computes the canopy height of each subplot as count, mean, min, max and "
+                       "high percentiles (e.g. p90 / p95 / p99) of DSM minus DTM. Without a DTM, "
+                       "the soil baseline of each subplot is a percentile of the DSM in the alley "
+                       "around it (a band of the given width, excluding all subplots). The DSM is "
+                       "streamed in fixed-size tiles on a thread pool; every subplot keeps a "
+                       "fixed-bin height histogram that is merged across tiles, so memory does not "
+                       "grow with the number of pixels. Percentiles are accurate to one bin width. The "
+                       "height range is taken from the DSM / DTM statistics unless a maximum "
+                       "height is given; pixels outside it are counted and reported.")
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(QgsProcessingParameterFeatureSource(
+            self.INPUT, self.tr("Subplot layer"), [QgsProcessing.TypeVectorPolygon]))
+        self.addParameter(QgsProcessingParameterRasterLayer(
+            self.DSM, self.tr("DSM raster")))
+        self.addParameter(QgsProcessingParameterRasterLayer(
+            self.DTM, self.tr("DTM raster (soil baseline from the alleys if empty)"),
+            optional=True))
+        self.addParameter(QgsProcessingParameterNumber(
+            self.ALLEY_WIDTH, self.tr("Alley width around each subplot for the soil baseline (m)"),
+            QgsProcessingParameterNumber.Double, 0.3, minValue=0.0))
+        self.addParameter(QgsProcessingParameterNumber(
+            self.BASELINE_PERCENTILE, self.tr("Soil baseline percentile of the alley DSM"),
+            QgsProcessingParameterNumber.Double, 50.0, minValue=0.0, maxValue=100.0))
+        self.addParameter(QgsProcessingParameterString(
+            self.PERCENTILES, self.tr("Height percentiles (comma separated)"),
+            defaultValue="90,95,99"))
+        self.addParameter(QgsProcessingParameterNumber(
+            self.BIN_WIDTH, self.tr("Histogram bin width (m)"),
+            QgsProcessingParameterNumber.Double, BIN_WIDTH, minValue=0.001))
+        self.addParameter(QgsProcessingParameterNumber(
+            self.MAX_HEIGHT, self.tr("Maximum plant height (m, 0 = from the raster statistics)"),
+            QgsProcessingParameterNumber.Double, 0.0, minValue=0.0))
+        self.addParameter(QgsProcessingParameterNumber(
+            self.THREADS, self.tr("Worker threads (0 = automatic)"),
+            QgsProcessingParameterNumber.Integer, 0, minValue=0))
+        self.addParameter(QgsProcessingParameterFeatureSink(
+            self.OUTPUT, self.tr("Subplots with plant height"), QgsProcessing.TypeVectorPolygon))
+
+    def alley_rings(self, geometries, width):
+        """每个子地块外扩width的区域减去所有与其相交的子地块, 即周围的走道"""
+        index = QgsSpatialIndex()
+        for i, geom in enumerate(geometries):
+            index.addFeature(i, geom.boundingBox())
+
+        rings = []
+        for geom in geometries:
+            alley = geom.buffer(width, 1)
+            for j in index.intersects(alley.boundingBox()):
+                if alley.intersects(geometries[j]):
+                    alley = alley.difference(geometries[j])
+            rings.append(alley)
+        return rings
+
+    def processAlgorithm(self, parameters, context, feedback):
+        source = self.parameterAsSource(parameters, self.INPUT, context)
+        if source is None:
+            raise QgsProcessingException(self.invalidSourceError(parameters, self.INPUT))
+        dsm_layer = self.parameterAsRasterLayer(parameters, self.DSM, context)
+        dtm_layer = self.parameterAsRasterLayer(parameters, self.DTM, context)
+
+        text = self.parameterAsString(parameters, self.PERCENTILES, context)
+        try:
+            percentiles = [float(p) for p in text.replace(" ", "").split(",") if p]
+        except ValueError:
+            raise QgsProcessingException(self.tr("Invalid percentiles: {}").format(text))
+
+        try:
+            dsm_path = api.raster_path(dsm_layer)
+            dtm_path = api.raster_path(dtm_layer) if dtm_layer is not None else None
+        except FieldShapeError as e:
+            raise QgsProcessingException(str(e))
+        threads = self.parameterAsInt(parameters, self.THREADS, context) or None
+        alley_width = self.parameterAsDouble(parameters, self.ALLEY_WIDTH, context)
+        if dtm_path is None and alley_width <= 0:
+            raise QgsProcessingException(str(FieldShapeError("errNoAlley")))
+
+        def progress(fraction):
+            feedback.setProgress(100 * fraction)
+            return not feedback.isCanceled()
+
+        # 第一遍: 读取子地块几何(走道在子地块的坐标系中计算), 转换到DSM坐标系
+        transform = QgsCoordinateTransform(source.sourceCrs(), dsm_layer.crs(),
+                                           context.transformContext())
+        geometries = [feature.geometry() for feature in source.getFeatures()]
+        baselines = None
+        if dtm_path is None:
+            feedback.pushInfo(self.tr("Computing the soil baseline from the alleys"))
+            alleys = []
+            for alley in self.alley_rings(geometries, alley_width):
+                alley.transform(transform)
+                alleys.append(api.geometry_rings(alley))
+            feedback.setProgressText(self.tr("Soil baseline"))
+            baselines = soil_baseline(
+                dsm_path, alleys, self.parameterAsDouble(parameters, self.BASELINE_PERCENTILE, context),
+                max_workers=threads, progress=progress)
+            if feedback.isCanceled():
+                return {}
+
+        polygons = []
+        for geom in geometries:
+            geom.transform(transform)
+            polygons.append(api.geometry_rings(geom))
+
+        feedback.setProgressText(self.tr("Plant height"))
+        feedback.pushInfo(self.tr("Computing plant height of {} subplots").format(len(polygons)))
+        max_height = self.parameterAsDouble(parameters, self.MAX_HEIGHT, context)
+        height_range = (HEIGHT_RANGE[0], max_height) if max_height > 0 else None
+        values, clipped = plant_height(dsm_path, polygons, dtm_path, baselines, HEIGHT_STATISTICS,
+                                       percentiles, height_range,
+                                       self.parameterAsDouble(parameters, self.BIN_WIDTH, context),
+                                       max_workers=threads, progress=progress)
+        if feedback.isCanceled():
+            return {}
+        if clipped.any():
+            feedback.reportError(self.tr("{} pixels in {} subplots are outside the height range, "
+                                         "percentiles saturate at its ends; increase the maximum "
+                                         "plant height").format(int(clipped.sum()),
+                                                                int((clipped > 0).sum())))
+
+        # 第二遍: 复制要素并附加株高
+        fields = QgsFields(source.fields())
+        for field in api.zonal_fields(height_names(HEIGHT_STATISTICS, percentiles)):
+            fields.append(field)
+
+        sink, dest_id = self.parameterAsSink(parameters, self.OUTPUT, context, fields,
+                                             source.wkbType(), source.sourceCrs())
+        if sink is None:
+            raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT))
+
+        chunk = []
+        for i, feature in enumerate(source.getFeatures()):
+            if feedback.isCanceled():
+                break
+            out = QgsFeature(fields)
+            out.setGeometry(feature.geometry())
+            out.setAttributes(feature.attributes() + api.attribute_values(values[i]))
+            chunk.append(out)
+            if len(chunk) >= api.CHUNK_SIZE:
+                sink.addFeatures(chunk, QgsFeatureSink.FastInsert)
+                chunk = []
+        sink.addFeatures(chunk, QgsFeatureSink.FastInsert)
+
+        return {self.OUTPUT: dest_id}
@@ -0,0 +1,244 @@
+# File: subplotDivision
+# Author: Haozhou Wang
+# Organization: UTOkyo FieldPhenomics Lab
+# Description:
+#     Processing algorithm of the subplot division tool (fieldShape),
+#     runs headless in models, batch processing and qgis_process
+# Dependencies:
+#     - Python 3.x
+#     - QGIS 3.x
+# License: MIT
+# Usage: add this folder to "Processing > Options > Scripts > Scripts folder(s)",
+#     then run from the toolbox or with
+#     qgis_process run script:subplotdivision -- INPUT=plot.shp ROWS=10 COLS=4 OUTPUT=subplots.gpkg
+
+import os
+import sys
+
+from qgis.PyQt.QtCore import QCoreApplication
+from qgis.core import (QgsFeatureSink, QgsProcessing, QgsProcessingAlgorithm,
+                       QgsProcessingException, QgsProcessingParameterBoolean,
+                       QgsProcessingParameterCrs, QgsProcessingParameterEnum,
+                       QgsProcessingParameterFeatureSink, QgsProcessingParameterFeatureSource,
+                       QgsProcessingParameterField, QgsProcessingParameterFile,
+                       QgsProcessingParameterNumber, QgsProcessingParameterString,
+                       QgsWkbTypes)
+
+# fieldimagepy位于上一级目录(pyscripts)
+_pyscripts_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _pyscripts_dir not in sys.path:
+    sys.path.insert(0, _pyscripts_dir)
+
+from fieldimagepy import api
+from fieldimagepy.errors import FieldShapeError
+from fieldimagepy.fieldbook import ORDERS, START_CORNERS
+from fieldimagepy.grid import parse_lengths
+
+
+class SubplotDivisionAlgorithm(QgsProcessingAlgorithm):
+
+    """在样地边界内创建子地块, 批量模式下每个要素为一个区块"""
+
+    INPUT = "INPUT"
+    ROWS = "ROWS"
+    COLS = "COLS"
+    X_BUFFER = "X_BUFFER"
+    Y_BUFFER = "Y_BUFFER"
+    PLOT_WIDTH = "PLOT_WIDTH"
+    PLOT_LENGTH = "PLOT_LENGTH"
+    QUAD = "QUAD"
+    BATCH = "BATCH"
+    ID_FIELD = "ID_FIELD"
+    ROWS_FIELD = "ROWS_FIELD"
+    COLS_FIELD = "COLS_FIELD"
+    X_BUFFER_FIELD = "X_BUFFER_FIELD"
+    Y_BUFFER_FIELD = "Y_BUFFER_FIELD"
+    TARGET_CRS = "TARGET_CRS"
+    FIELD_BOOK = "FIELD_BOOK"
+    ORDER = "ORDER"
+    START = "START"
+    SERPENTINE = "SERPENTINE"
+    ALLOW_MISMATCH = "ALLOW_MISMATCH"
+    OUTPUT = "OUTPUT"
+
+    def tr(self, string):
+        return QCoreApplication.translate("Processing", string)
+
+    def createInstance(self):
+        return SubplotDivisionAlgorithm()
+
+    def name(self):
+        return "subplotdivision"
+
+    def displayName(self):
+        return self.tr("Subplot division")
+
+    def group(self):
+        return self.tr("FIELDimagePy")
+
+    def groupId(self):
+        return "fieldimagepy"
+
+    def shortHelpString(self):
+        return self.tr("Divides the minimum area bounding rectangle of the plot boundary into "
+                       "rows x columns subplots. Columns run along the first edge of the rectangle. "
+                       "In batch mode every feature is divided as a separate block, "
+                       "and rows, columns and spacings can be read from attribute fields. "
+                       "With a plot width and length the plots are laid out at that size "
+                       "instead (rows / columns 0 = as many as fit, lists such as "
+                       "'2, 10*1.5, 2' give per-column / per-row sizes), and the leftover "
+                       "margin is reported. "
+                       "An optional field book (CSV or XLSX, one row per subplot in planting "
+                       "order) is joined to the subplots by row / column order, serpentine "
+                       "and start corner; blocks are numbered one after another.")
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(QgsProcessingParameterFeatureSource(
+            self.INPUT, self.tr("Plot boundary polygon layer"), [QgsProcessing.TypeVectorPolygon]))
+        self.addParameter(QgsProcessingParameterNumber(
+            self.COLS, self.tr("Horizontal divisions (columns)"),
+            QgsProcessingParameterNumber.Integer, 5, minValue=0))
+        self.addParameter(QgsProcessingParameterNumber(
+            self.ROWS, self.tr("Vertical divisions (rows)"),
+            QgsProcessingParameterNumber.Integer, 5, minValue=0))
+        self.addParameter(QgsProcessingParameterNumber(
+            self.X_BUFFER, self.tr("Row spacing (m), negative for overlap"),
+            QgsProcessingParameterNumber.Double, 0.0))
+        self.addParameter(QgsProcessingParameterNumber(
+            self.Y_BUFFER, self.tr("Column spacing (m), negative for overlap"),
+            QgsProcessingParameterNumber.Double, 0.0))
+        self.addParameter(QgsProcessingParameterString(
+            self.PLOT_WIDTH, self.tr("Fixed plot width along the columns (m), or a list"),
+            optional=True))
+        self.addParameter(QgsProcessingParameterString(
+            self.PLOT_LENGTH, self.tr("Fixed plot length along the rows (m), or a list"),
+            optional=True))
+        self.addParameter(QgsProcessingParameterBoolean(
+            self.QUAD, self.tr("Fill the quadrilateral itself (bilinear grid for trapezoids)"),
+            False))
+        self.addParameter(QgsProcessingParameterBoolean(
+            self.BATCH, self.tr("Batch mode: divide every feature in the layer"), False))
+
+        for name, description, field_type in [
+                (self.ID_FIELD, "Block ID field", QgsProcessingParameterField.Any),
+                (self.COLS_FIELD, "Columns field", QgsProcessingParameterField.Numeric),
+                (self.ROWS_FIELD, "Rows field", QgsProcessingParameterField.Numeric),
+                (self.X_BUFFER_FIELD, "Row spacing field", QgsProcessingParameterField.Numeric),
+                (self.Y_BUFFER_FIELD, "Column spacing field", QgsProcessingParameterField.Numeric)]:
+            self.addParameter(QgsProcessingParameterField(
+                name, self.tr(description), parentLayerParameterName=self.INPUT,
+                type=field_type, optional=True))
+
+        self.addParameter(QgsProcessingParameterCrs(
+            self.TARGET_CRS, self.tr("Output CRS (default: CRS of the boundary layer)"),
+            optional=True))
+        self.addParameter(QgsProcessingParameterFile(
+            self.FIELD_BOOK, self.tr("Field book (CSV / XLSX, one row per subplot)"),
+            fileFilter="Field books (*.csv *.txt *.tsv *.xlsx *.xls *.ods)", optional=True))
+        self.addParameter(QgsProcessingParameterEnum(
+            self.ORDER, self.tr("Field book order"),
+            [self.tr("Row by row"), self.tr("Column by column")], defaultValue=0))
+        self.addParameter(QgsProcessingParameterEnum(
+            self.START, self.tr("Field book start corner"),
+            [self.tr("Row 1, column 1"), self.tr("Row 1, last column"),
+             self.tr("Last row, column 1"), self.tr("Last row, last column")], defaultValue=0))
+        self.addParameter(QgsProcessingParameterBoolean(
+            self.SERPENTINE, self.tr("Serpentine field book order"), False))
+        self.addParameter(QgsProcessingParameterBoolean(
+            self.ALLOW_MISMATCH,
+            self.tr("Allow field book rows and subplots to differ (extra subplots stay empty)"),
+            False))
+        self.addParameter(QgsProcessingParameterFeatureSink(
+            self.OUTPUT, self.tr("Subplots"), QgsProcessing.TypeVectorPolygon))
+
+    def processAlgorithm(self, parameters, context, feedback):
+        source = self.parameterAsSource(parameters, self.INPUT, context)
+        if source is None:
+            raise QgsProcessingException(self.invalidSourceError(parameters, self.INPUT))
+
+        def field(name):
+            return self.parameterAsString(parameters, name, context) or None
+
+        target_crs = self.parameterAsCrs(parameters, self.TARGET_CRS, context)
+        if not target_crs.isValid():
+            target_crs = source.sourceCrs()
+
+        # 固定子地块尺寸: 宽度和长度都给出时启用
+        plot_size = None
+        plot_width = field(self.PLOT_WIDTH)
+        plot_length = field(self.PLOT_LENGTH)
+        if plot_width or plot_length:
+            try:
+                plot_size = parse_lengths(plot_width), parse_lengths(plot_length)
+            except (TypeError, ValueError) as e:
+                raise QgsProcessingException(
+                    self.tr("Invalid plot width / length: {}").format(e))
+
+        try:
+            api.check_target_crs(target_crs)
+            fields, results = api.prepare_subplots(
+                source,
+                self.parameterAsInt(parameters, self.ROWS, context),
+                self.parameterAsInt(parameters, self.COLS, context),
+                self.parameterAsDouble(parameters, self.X_BUFFER, context),
+                self.parameterAsDouble(parameters, self.Y_BUFFER, context),
+                batch=self.parameterAsBoolean(parameters, self.BATCH, context),
+                id_field=field(self.ID_FIELD),
+                rows_field=field(self.ROWS_FIELD),
+                cols_field=field(self.COLS_FIELD),
+                x_buffer_field=field(self.X_BUFFER_FIELD),
+                y_buffer_field=field(self.Y_BUFFER_FIELD),
+                plot_size=plot_size,
+                quad=self.parameterAsBoolean(parameters, self.QUAD, context),
+            )
+        except FieldShapeError as e:
+            raise QgsProcessingException(str(e))
+
+        for result in results:
+            fit = result.grid.layout
+            if fit is not None:
+                feedback.pushInfo(self.tr(
+                    "Block {}: {} rows x {} columns fit, leftover margin {:.2f} m x {:.2f} m"
+                ).format(result.block_id, fit.rows, fit.cols, fit.x_margin, fit.y_margin))
+
+        # 田间记录本: 行数在创建输出之前核对
+        count = sum(len(result.grid) for result in results)
+        records = None
+        fieldbook_path = self.parameterAsFile(parameters, self.FIELD_BOOK, context)
+        if fieldbook_path:
+            try:
+                fieldbook = api.fieldbook_config(
+                    fieldbook_path, fields,
+                    order=ORDERS[self.parameterAsEnum(parameters, self.ORDER, context)],
+                    serpentine=self.parameterAsBoolean(parameters, self.SERPENTINE, context),
+                    start=START_CORNERS[self.parameterAsEnum(parameters, self.START, context)])
+                api.check_fieldbook(fieldbook, count)
+            except FieldShapeError as e:
+                if e.key != "errFieldBookCount" or not self.parameterAsBoolean(
+                        parameters, self.ALLOW_MISMATCH, context):
+                    raise QgsProcessingException(str(e))
+                feedback.reportError(str(e))
+            for book_field in api.fieldbook_fields(fieldbook):
+                fields.append(book_field)
+            records = api.results_fieldbook(results, fieldbook)
+
+        sink, dest_id = self.parameterAsSink(parameters, self.OUTPUT, context, fields,
+                                             QgsWkbTypes.Polygon, target_crs)
+        if sink is None:
+            raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT))
+
+        feedback.pushInfo(self.tr("Creating {} subplots, estimated size {}").format(
+            count, api.format_size(api.estimate_output_size(count, fields.count()))))
+
+        # 按格网点批量转换坐标系, 逐批写入
+        transform = api.crs_transform(source.sourceCrs(), target_crs, context.transformContext())
+        count = 0
+        for chunk in api.iter_subplot_features(fields, results, transform=transform,
+                                               records=records):
+            if feedback.isCanceled():
+                break
+            sink.addFeatures(chunk, QgsFeatureSink.FastInsert)
+            count += len(chunk)
+        feedback.pushInfo(self.tr("{} subplots created").format(count))
+
+        return {self.OUTPUT: dest_id}
@@ -0,0 +1,185 @@
+# File: timeSeriesStatistics
+# Author: Haozhou Wang
+# Organization: UTOkyo FieldPhenomics Lab
+# Description:
+#     Processing algorithm of per-subplot zonal statistics over a time series of orthomosaics,
+#     written as one long-format table (plot id, date, band, statistics)
+# Dependencies:
+#     - Python 3.x
+#     - QGIS 3.x
+# License: MIT
+# Usage: add this folder to "Processing > Options > Scripts > Scripts folder(s)",
+#     then run from the toolbox or with
+#     qgis_process run script:subplottimeseries -- INPUT=subplots.gpkg RASTERS=dom_0601.tif RASTERS=dom_0615.tif OUTPUT=series.csv
+
+import os
+import sys
+
+from qgis.PyQt.QtCore import QCoreApplication, QVariant
+from qgis.core import (QgsFeature, QgsFeatureSink, QgsField, QgsFields, QgsGeometry,
+                       QgsProcessing, QgsProcessingAlgorithm, QgsProcessingException,
+                       QgsProcessingParameterEnum, QgsProcessingParameterFeatureSink,
+                       QgsProcessingParameterFeatureSource, QgsProcessingParameterField,
+                       QgsProcessingParameterMultipleLayers, QgsProcessingParameterNumber,
+                       QgsProcessingParameterString, QgsWkbTypes)
+
+# fieldimagepy位于上一级目录(pyscripts)
+_pyscripts_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _pyscripts_dir not in sys.path:
+    sys.path.insert(0, _pyscripts_dir)
+
+from fieldimagepy import api
+from fieldimagepy.errors import FieldShapeError
+from fieldimagepy.zonal import STATISTICS, long_format, zonal_time_series
+
+
+class TimeSeriesStatisticsAlgorithm(QgsProcessingAlgorithm):
+
+    """对多期DOM计算同一组子地块的统计值, 输出长表"""
+
+    INPUT = "INPUT"
+    RASTERS = "RASTERS"
+    ID_FIELD = "ID_FIELD"
+    BANDS = "BANDS"
+    STATISTICS = "STATISTICS"
+    PERCENTILES = "PERCENTILES"
+    THREADS = "THREADS"
+    OUTPUT = "OUTPUT"
+
+    def tr(self, string):
+        return QCoreApplication.translate("Processing", string)
+
+    def createInstance(self):
+        return TimeSeriesStatisticsAlgorithm()
+
+    def name(self):
+        return "subplottimeseries"
+
+    def displayName(self):
+        return self.tr("Subplot time series statistics")
+
+    def group(self):
+        return self.tr("FIELDimagePy")
+
+    def groupId(self):
+        return "fieldimagepy"
+
+    def shortHelpString(self):
+        return self.tr("Applies one set of subplots to a time series of co-registered "
+                       "orthomosaics and writes a long-format table with one row per subplot, "
+                       "date and band. Dates on the same raster grid (geotransform and size) are "
+                       "read tile by tile together, so pixel windows and masks are computed once "
+                       "and applied to every date; tiles are processed in parallel. The date "
+                       "column is the raster layer name.")
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(QgsProcessingParameterFeatureSource(
+            self.INPUT, self.tr("Subplot layer"), [QgsProcessing.TypeVectorPolygon]))
+        self.addParameter(QgsProcessingParameterMultipleLayers(
+            self.RASTERS, self.tr("DOM rasters (one per date)"), QgsProcessing.TypeRaster))
+        self.addParameter(QgsProcessingParameterField(
+            self.ID_FIELD, self.tr("Plot ID field (feature id if empty)"),
+            parentLayerParameterName=self.INPUT, optional=True))
+        self.addParameter(QgsProcessingParameterString(
+            self.BANDS, self.tr("Bands (comma separated, all non-alpha bands if empty)"),
+            defaultValue="", optional=True))
+        self.addParameter(QgsProcessingParameterEnum(
+            self.STATISTICS, self.tr("Statistics"), options=list(STATISTICS),
+            allowMultiple=True, defaultValue=list(range(len(STATISTICS)))))
+        self.addParameter(QgsProcessingParameterString(
+            self.PERCENTILES, self.tr("Percentiles (comma separated, e.g. 10,90)"),
+            defaultValue="", optional=True))
+        self.addParameter(QgsProcessingParameterNumber(
+            self.THREADS, self.tr("Worker threads (0 = automatic)"),
+            QgsProcessingParameterNumber.Integer, 0, minValue=0))
+        self.addParameter(QgsProcessingParameterFeatureSink(
+            self.OUTPUT, self.tr("Time series table"), QgsProcessing.TypeVector))
+
+    def parse_numbers(self, parameters, name, context, cast):
+        text = self.parameterAsString(parameters, name, context)
+        try:
+            return [cast(v) for v in text.replace(" ", "").split(",") if v]
+        except ValueError:
+            raise QgsProcessingException(self.tr("Invalid list: {}").format(text))
+
+    def processAlgorithm(self, parameters, context, feedback):
+        source = self.parameterAsSource(parameters, self.INPUT, context)
+        if source is None:
+            raise QgsProcessingException(self.invalidSourceError(parameters, self.INPUT))
+        rasters = self.parameterAsLayerList(parameters, self.RASTERS, context)
+        try:
+            paths = [api.raster_path(layer) for layer in rasters]
+        except FieldShapeError as e:
+            raise QgsProcessingException(str(e))
+
+        statistics = [STATISTICS[i] for i in self.parameterAsEnums(parameters, self.STATISTICS, context)]
+        percentiles = self.parse_numbers(parameters, self.PERCENTILES, context, float)
+        bands = self.parse_numbers(parameters, self.BANDS, context, int) or None
+        threads = self.parameterAsInt(parameters, self.THREADS, context) or None
+        id_field = self.parameterAsString(parameters, self.ID_FIELD, context)
+
+        # 读取子地块一次, 每个栅格坐标系只转换一次
+        ids = []
+        geometries = []
+        for feature in source.getFeatures():
+            ids.append(api.feature_value(feature, id_field, feature.id()))
+            geometries.append(QgsGeometry(feature.geometry()))
+
+        polygon_sets = {}
+        polygons = []
+        for layer in rasters:
+            authid = layer.crs().toWkt()
+            if authid not in polygon_sets:
+                transform = api.crs_transform(source.sourceCrs(), layer.crs(),
+                                              context.transformContext())
+                rings = []
+                for geom in geometries:
+                    geom = QgsGeometry(geom)
+                    if transform is not None:
+                        geom.transform(transform)
+                    rings.append(api.geometry_rings(geom))
+                polygon_sets[authid] = rings
+            polygons.append(polygon_sets[authid])
+
+        def progress(fraction):
+            feedback.setProgress(100 * fraction)
+            return not feedback.isCanceled()
+
+        feedback.pushInfo(self.tr("Computing statistics of {} subplots on {} dates")
+                          .format(len(ids), len(paths)))
+        results = zonal_time_series(paths, polygons, bands, statistics, percentiles,
+                                    max_workers=threads, progress=progress)
+
+        # 长表: 子地块id, 日期, 波段, 统计值
+        fields = QgsFields()
+        if id_field:
+            id_def = QgsField(source.fields().field(id_field))
+            id_def.setName("plot_id")
+            fields.append(id_def)
+        else:
+            fields.append(QgsField("plot_id", QVariant.LongLong))
+        fields.append(QgsField("date", QVariant.String))
+        fields.append(QgsField("band", QVariant.Int))
+        for name in statistics + [f"p{p:g}" for p in percentiles]:
+            fields.append(QgsField(name, QVariant.Double))
+
+        sink, dest_id = self.parameterAsSink(parameters, self.OUTPUT, context, fields,
+                                             QgsWkbTypes.NoGeometry, source.sourceCrs())
+        if sink is None:
+            raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT))
+
+        for layer, result in zip(rasters, results):
+            if result is None or feedback.isCanceled():
+                break
+            date_bands, values = result
+            chunk = []
+            for i, band, row in long_format(values, date_bands, statistics, percentiles):
+                feature = QgsFeature(fields)
+                feature.setAttributes([ids[i], layer.name(), int(band)] + api.attribute_values(row))
+                chunk.append(feature)
+                if len(chunk) >= api.CHUNK_SIZE:
+                    sink.addFeatures(chunk, QgsFeatureSink.FastInsert)
+                    chunk = []
+            sink.addFeatures(chunk, QgsFeatureSink.FastInsert)
+
+        return {self.OUTPUT: dest_id}
@@ -0,0 +1,132 @@
+# File: vegetationIndex
+# Author: Haozhou Wang
+# Organization: UTOkyo FieldPhenomics Lab
+# Description:
+#     Processing algorithm of vegetation indices (NGRDI, ExG, VARI, GLI, NDVI, ...)
+#     and band math expressions, streamed over the orthomosaic in tiles
+# Dependencies:
+#     - Python 3.x
+#     - QGIS 3.x
+# License: MIT
+# Usage: add this folder to "Processing > Options > Scripts > Scripts folder(s)",
+#     then run from the toolbox or with
+#     qgis_process run script:vegetationindex -- INPUT=dom.tif INDEX=0 OUTPUT=ngrdi.tif
+
+import os
+import sys
+
+from qgis.PyQt.QtCore import QCoreApplication
+from qgis.core import (QgsProcessingAlgorithm, QgsProcessingException,
+                       QgsProcessingParameterBand, QgsProcessingParameterEnum,
+                       QgsProcessingParameterNumber, QgsProcessingParameterRasterDestination,
+                       QgsProcessingParameterRasterLayer, QgsProcessingParameterString)
+
+# fieldimagepy位于上一级目录(pyscripts)
+_pyscripts_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _pyscripts_dir not in sys.path:
+    sys.path.insert(0, _pyscripts_dir)
+
+from fieldimagepy import api
+from fieldimagepy.errors import FieldShapeError
+from fieldimagepy.indices import INDICES, index_raster
+
+CUSTOM = "Custom expression"
+
+
+class VegetationIndexAlgorithm(QgsProcessingAlgorithm):
+
+    """按瓦片计算植被指数或波段运算表达式, 输出分块压缩的GeoTIFF"""
+
+    INPUT = "INPUT"
+    INDEX = "INDEX"
+    EXPRESSION = "EXPRESSION"
+    RED = "RED"
+    GREEN = "GREEN"
+    BLUE = "BLUE"
+    NIR = "NIR"
+    REDEDGE = "REDEDGE"
+    THREADS = "THREADS"
+    OUTPUT = "OUTPUT"
+
+    def tr(self, string):
+        return QCoreApplication.translate("Processing", string)
+
+    def createInstance(self):
+        return VegetationIndexAlgorithm()
+
+    def name(self):
+        return "vegetationindex"
+
+    def displayName(self):
+        return self.tr("Vegetation index")
+
+    def group(self):
+        return self.tr("FIELDimagePy")
+
+    def groupId(self):
+        return "fieldimagepy"
+
+    def shortHelpString(self):
+        formulas = "\n".join(f"{name}: {expr}" for name, expr in INDICES.items())
+        return self.tr("Computes a vegetation index or a custom band math expression tile by tile, "
+                       "without loading the whole orthomosaic. Expressions may use R, G, B, NIR, RE "
+                       "(mapped to the selected bands), b1, b2, ... and numpy functions such as "
+                       "sqrt, log, abs, minimum, maximum, where. The output is a tiled, compressed "
+                       "GeoTIFF with overviews, pixel-aligned with the input.\n\n") + formulas
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(QgsProcessingParameterRasterLayer(
+            self.INPUT, self.tr("DOM raster")))
+        self.addParameter(QgsProcessingParameterEnum(
+            self.INDEX, self.tr("Index"), options=list(INDICES) + [CUSTOM], defaultValue=0))
+        self.addParameter(QgsProcessingParameterString(
+            self.EXPRESSION, self.tr("Custom expression"), defaultValue="", optional=True))
+        for name, description, default in [
+                (self.RED, "Red band", 1), (self.GREEN, "Green band", 2),
+                (self.BLUE, "Blue band", 3), (self.NIR, "NIR band", None),
+                (self.REDEDGE, "Red edge band", None)]:
+            self.addParameter(QgsProcessingParameterBand(
+                name, self.tr(description), default, parentLayerParameterName=self.INPUT,
+                optional=True))
+        self.addParameter(QgsProcessingParameterNumber(
+            self.THREADS, self.tr("Worker threads (0 = automatic)"),
+            QgsProcessingParameterNumber.Integer, 0, minValue=0))
+        self.addParameter(QgsProcessingParameterRasterDestination(
+            self.OUTPUT, self.tr("Index raster")))
+
+    def processAlgorithm(self, parameters, context, feedback):
+        raster_layer = self.parameterAsRasterLayer(parameters, self.INPUT, context)
+        try:
+            path = api.raster_path(raster_layer)
+        except FieldShapeError as e:
+            raise QgsProcessingException(str(e))
+
+        options = list(INDICES) + [CUSTOM]
+        index = options[self.parameterAsEnum(parameters, self.INDEX, context)]
+        if index == CUSTOM:
+            expression = self.parameterAsString(parameters, self.EXPRESSION, context)
+        else:
+            expression = INDICES[index]
+
+        band_map = {}
+        for name, key in [(self.RED, "R"), (self.GREEN, "G"), (self.BLUE, "B"),
+                          (self.NIR, "NIR"), (self.REDEDGE, "RE")]:
+            band = self.parameterAsInt(parameters, name, context)
+            if band:
+                band_map[key] = band
+
+        output = self.parameterAsOutputLayer(parameters, self.OUTPUT, context)
+        threads = self.parameterAsInt(parameters, self.THREADS, context) or None
+
+        def progress(fraction):
+            feedback.setProgress(fraction * 100)
+            return not feedback.isCanceled()
+
+        feedback.pushInfo(self.tr("Expression: {}").format(expression))
+        try:
+            index_raster(path, output, expression, band_map, max_workers=threads,
+                         progress=progress)
+        except ValueError as e:
+            raise QgsProcessingException(str(e))
+
+        return {self.OUTPUT: output}
@@ -0,0 +1,157 @@
+# File: zonalStatistics
+# Author: Haozhou Wang
+# Organization: UTOkyo FieldPhenomics Lab
+# Description:
+#     Processing algorithm of per-subplot zonal statistics,
+#     reads only block-aligned raster windows intersecting the subplots
+# Dependencies:
+#     - Python 3.x
+#     - QGIS 3.x
+# License: MIT
+# Usage: add this folder to "Processing > Options > Scripts > Scripts folder(s)",
+#     then run from the toolbox or with
+#     qgis_process run script:subplotzonalstatistics -- INPUT=subplots.gpkg RASTER=dom.tif OUTPUT=stats.gpkg
+
+import os
+import sys
+
+from qgis.PyQt.QtCore import QCoreApplication
+from qgis.core import (QgsCoordinateTransform, QgsFeature, QgsFeatureSink, QgsFields,
+                       QgsProcessing, QgsProcessingAlgorithm, QgsProcessingException,
+                       QgsProcessingParameterBand, QgsProcessingParameterEnum,
+                       QgsProcessingParameterFeatureSink, QgsProcessingParameterFeatureSource,
+                       QgsProcessingParameterNumber, QgsProcessingParameterRasterLayer,
+                       QgsProcessingParameterString)
+
+# fieldimagepy位于上一级目录(pyscripts)
+_pyscripts_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _pyscripts_dir not in sys.path:
+    sys.path.insert(0, _pyscripts_dir)
+
+from fieldimagepy import api
+from fieldimagepy.errors import FieldShapeError
+from fieldimagepy.raster import RasterInfo
+from fieldimagepy.zonal import STATISTICS, stat_names, zonal_statistics
+
+
+class ZonalStatisticsAlgorithm(QgsProcessingAlgorithm):
+
+    """计算每个子地块内DOM各波段的统计值"""
+
+    INPUT = "INPUT"
+    RASTER = "RASTER"
+    BANDS = "BANDS"
+    STATISTICS = "STATISTICS"
+    PERCENTILES = "PERCENTILES"
+    THREADS = "THREADS"
+    OUTPUT = "OUTPUT"
+
+    def tr(self, string):
+        return QCoreApplication.translate("Processing", string)
+
+    def createInstance(self):
+        return ZonalStatisticsAlgorithm()
+
+    def name(self):
+        return "subplotzonalstatistics"
+
+    def displayName(self):
+        return self.tr("Subplot zonal statistics")
+
+    def group(self):
+        return self.tr("FIELDimagePy")
+
+    def groupId(self):
+        return "fieldimagepy"
+
+    def shortHelpString(self):
+        return self.tr("Computes per-band statistics of the raster pixels whose centers fall inside "
+                       "each subplot. Only block-aligned raster windows intersecting the subplots "
+                       "are read, tile by tile on a thread pool, so very large orthomosaics are "
+                       "never loaded into memory. Nodata and alpha-masked pixels are ignored.")
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(QgsProcessingParameterFeatureSource(
+            self.INPUT, self.tr("Subplot layer"), [QgsProcessing.TypeVectorPolygon]))
+        self.addParameter(QgsProcessingParameterRasterLayer(
+            self.RASTER, self.tr("DOM raster")))
+        self.addParameter(QgsProcessingParameterBand(
+            self.BANDS, self.tr("Bands (all non-alpha bands if empty)"),
+            parentLayerParameterName=self.RASTER, optional=True, allowMultiple=True))
+        self.addParameter(QgsProcessingParameterEnum(
+            self.STATISTICS, self.tr("Statistics"), options=list(STATISTICS),
+            allowMultiple=True, defaultValue=list(range(len(STATISTICS)))))
+        self.addParameter(QgsProcessingParameterString(
+            self.PERCENTILES, self.tr("Percentiles (comma separated, e.g. 10,90)"),
+            defaultValue="", optional=True))
+        self.addParameter(QgsProcessingParameterNumber(
+            self.THREADS, self.tr("Worker threads (0 = automatic)"),
+            QgsProcessingParameterNumber.Integer, 0, minValue=0))
+        self.addParameter(QgsProcessingParameterFeatureSink(
+            self.OUTPUT, self.tr("Subplots with statistics"), QgsProcessing.TypeVectorPolygon))
+
+    def processAlgorithm(self, parameters, context, feedback):
+        source = self.parameterAsSource(parameters, self.INPUT, context)
+        if source is None:
+            raise QgsProcessingException(self.invalidSourceError(parameters, self.INPUT))
+        raster_layer = self.parameterAsRasterLayer(parameters, self.RASTER, context)
+
+        statistics = [STATISTICS[i] for i in self.parameterAsEnums(parameters, self.STATISTICS, context)]
+        text = self.parameterAsString(parameters, self.PERCENTILES, context)
+        try:
+            percentiles = [float(p) for p in text.replace(" ", "").split(",") if p]
+        except ValueError:
+            raise QgsProcessingException(self.tr("Invalid percentiles: {}").format(text))
+
+        try:
+            path = api.raster_path(raster_layer)
+        except FieldShapeError as e:
+            raise QgsProcessingException(str(e))
+        bands = self.parameterAsInts(parameters, self.BANDS, context) or RasterInfo(path).data_bands
+        threads = self.parameterAsInt(parameters, self.THREADS, context) or None
+
+        # 第一遍: 读取子地块几何并转换到栅格坐标系
+        transform = QgsCoordinateTransform(source.sourceCrs(), raster_layer.crs(),
+                                           context.transformContext())
+        polygons = []
+        for feature in source.getFeatures():
+            geom = feature.geometry()
+            geom.transform(transform)
+            polygons.append(api.geometry_rings(geom))
+
+        feedback.pushInfo(self.tr("Computing statistics of {} subplots").format(len(polygons)))
+        names = stat_names(bands, statistics, percentiles)
+
+        def progress(fraction):
+            feedback.setProgress(100 * fraction)
+            return not feedback.isCanceled()
+
+        values = zonal_statistics(path, polygons, bands, statistics, percentiles,
+                                  max_workers=threads, progress=progress)
+        if feedback.isCanceled():
+            return {}
+
+        # 第二遍: 复制要素并附加统计值
+        fields = QgsFields(source.fields())
+        for field in api.zonal_fields(names):
+            fields.append(field)
+
+        sink, dest_id = self.parameterAsSink(parameters, self.OUTPUT, context, fields,
+                                             source.wkbType(), source.sourceCrs())
+        if sink is None:
+            raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT))
+
+        chunk = []
+        for i, feature in enumerate(source.getFeatures()):
+            if feedback.isCanceled():
+                break
+            out = QgsFeature(fields)
+            out.setGeometry(feature.geometry())
+            out.setAttributes(feature.attributes() + api.attribute_values(values[i]))
+            chunk.append(out)
+            if len(chunk) >= api.CHUNK_SIZE:
+                sink.addFeatures(chunk, QgsFeatureSink.FastInsert)
+                chunk = []
+        sink.addFeatures(chunk, QgsFeatureSink.FastInsert)
+
+        return {self.OUTPUT: dest_id}
@@ -0,0 +1,14 @@
+# File: fieldimagepy
+# Author: Haozhou Wang
+# Organization: UTOkyo FieldPhenomics Lab
+# Description:
+#     Core geometry engine of FIELDimagePy-QGIS tools
+# Dependencies:
+#     - Python 3.x
+#     - NumPy
+# License: MIT
+
+from .grid import SubplotGrid, QuadGrid, divide_rectangle, divide_quad, cells_to_wkb
+from .minrect import convex_hull, min_area_rectangle, rotation_angle
+from .batch import BlockSpec, BlockResult, divide_block, divide_blocks
+from .errors import FieldShapeError
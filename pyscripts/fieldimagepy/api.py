@@ -0,0 +1,719 @@
+# File: api
+# Author: Haozhou Wang
+# Organization: UTOkyo FieldPhenomics Lab
+# Description:
+#     Headless subplot division pipeline on QGIS layers (no dialogs / message boxes)
+# Dependencies:
+#     - Python 3.x
+#     - QGIS 3.x
+# License: MIT
+# Usage:
+#     from fieldimagepy import api
+#     fields, results = api.prepare_subplots(layer, rows=10, cols=4, x_buffer=0.5)
+#     api.save_subplots(fields, api.iter_subplot_features(fields, results),
+#                       layer.crs(), "subplots.shp")
+
+import os
+import shutil
+import struct
+from collections import namedtuple
+
+import numpy as np
+from qgis.PyQt.QtCore import QVariant
+from qgis.core import (Qgis, QgsCoordinateTransform, QgsCoordinateTransformContext,
+                       QgsCsException, QgsFeature, QgsField, QgsFields, QgsGeometry, QgsMapLayer,
+                       QgsMessageLog, QgsPointXY, QgsVectorFileWriter, QgsVectorLayer,
+                       QgsWkbTypes, NULL)
+
+from .autofit import fit_grid
+from .batch import BlockSpec, block_count, divide_blocks
+from .cover import COVER_NAMES, canopy_cover, cover_threshold
+from .errors import FieldShapeError
+from .fieldbook import check_count, fieldbook_positions, read_fieldbook
+from .grid import cells_to_wkb
+from .height import (HEIGHT_PERCENTILES, HEIGHT_STATISTICS, alley_rings, height_names,
+                     plant_height, soil_baseline)
+from .minrect import min_area_rectangle
+from .raster import RasterInfo, world_to_pixel
+from .zonal import STATISTICS, stat_names, zonal_statistics
+
+# 每批写入的要素数, 内存中同时只保留一批QgsFeature
+CHUNK_SIZE = 10000
+
+# 输出文件扩展名对应的OGR驱动, 以及写入时创建空间索引的图层选项
+# Shapefile为关闭时生成的.qix, GPKG为R-tree索引, FlatGeobuf为packed Hilbert R-tree索引
+OUTPUT_DRIVERS = {
+    ".shp": ("ESRI Shapefile", ["SPATIAL_INDEX=YES"]),
+    ".gpkg": ("GPKG", ["SPATIAL_INDEX=YES"]),
+    ".fgb": ("FlatGeobuf", ["SPATIAL_INDEX=YES"]),
+}
+
+# Shapefile的各个文件, 写出时一起替换
+SHAPEFILE_EXTENSIONS = (".shp", ".shx", ".dbf", ".prj", ".cpg", ".qix")
+
+# 写出前估算输出大小: 各格式每个子地块(几何, 记录和索引)的大致字节数, 每个属性字段另计
+FEATURE_BYTES = {"ESRI Shapefile": 160, "GPKG": 240, "FlatGeobuf": 150}
+MEMORY_FEATURE_BYTES = 600
+FIELD_BYTES = 16
+# Shapefile的.shp和.dbf文件不能超过2GB
+SHAPEFILE_LIMIT = 2 * 1024 ** 3
+
+# 阶段计时记录在QGIS日志面板中的标签页
+LOG_TAG = "FIELDimagePy"
+
+
+def log_message(text, level=Qgis.Info):
+    """写入QGIS日志面板的FIELDimagePy标签页(可在任意线程中调用)"""
+    QgsMessageLog.logMessage(text, LOG_TAG, level)
+
+
+def _vertices(geom):
+    """多边形外环顶点(多部件时依次拼接)"""
+    vertices = []
+    if geom.isMultipart():
+        for part in geom.asGeometryCollection():
+            vertices.extend(part.asPolygon()[0])
+    else:
+        vertices = geom.asPolygon()[0]
+    return vertices
+
+
+def get_hull_vertices(geom):
+    """获取多边形凸包的顶点坐标列表"""
+    return [(p.x(), p.y()) for p in _vertices(geom.convexHull())]
+
+
+def get_polygon_vertices(geom):
+    """获取多边形外环自身的顶点坐标列表(闭合, 按环的顺序)"""
+    return [(p.x(), p.y()) for p in _vertices(geom)]
+
+
+def get_min_area_rectangle(geom):
+    """获取多边形的最小面积外接矩形顶点(4, 2)"""
+    rect = min_area_rectangle(get_hull_vertices(geom), is_hull=True)
+    if rect is None:
+        raise FieldShapeError("errMinRect")
+    return rect
+
+
+def rect_to_geometry(rect):
+    """矩形顶点(4, 2)转换为QgsGeometry"""
+    return QgsGeometry.fromPolygonXY([[QgsPointXY(x, y) for x, y in rect]])
+
+
+def cells_to_geometries(cells):
+    """子地块角点(N, 4, 2)转换为QgsGeometry列表"""
+    geometries = []
+    for wkb in cells_to_wkb(cells):
+        geom = QgsGeometry()
+        geom.fromWkb(wkb)
+        geometries.append(geom)
+    return geometries
+
+
+def feature_value(feature, field, default, cast=None):
+    """读取属性字段, 字段未指定或为空值时返回默认值"""
+    if field:
+        value = feature[field]
+        if value is not None and value != NULL:
+            return cast(value) if cast else value
+    return default
+
+
+def validate_source(source, batch=False, geometry_only=False, id_field=None):
+    """验证边界图层(QgsVectorLayer或QgsFeatureSource), 不通过时抛出FieldShapeError"""
+    if source is None or source.featureCount() == 0:
+        raise FieldShapeError("errNotAPolygon")
+
+    if source.featureCount() > 1 and not batch:
+        raise FieldShapeError("errNotOneLayer")
+
+    for feature in source.getFeatures():
+        geom = feature.geometry()
+        block = feature_value(feature, id_field, feature.id()) if batch else None
+
+        if geom.type() != QgsWkbTypes.PolygonGeometry:
+            raise FieldShapeError("errNotAPolygon", block=block)
+
+        if not geom.isGeosValid():
+            raise FieldShapeError("errNotGoodPoly", block=block)
+
+        # 注意:闭合多边形第一个和最后一个顶点相同
+        if not geometry_only and len(_vertices(geom)) != 5:
+            raise FieldShapeError("errNot4Poly", block=block)
+
+
+def validate_grid(rows, cols, plot_size=None, quad=False):
+    """验证行数和列数; 固定子地块尺寸时可为0(尽量排满), 不能与四边形模式同时使用"""
+    if quad and plot_size is not None:
+        raise FieldShapeError("errQuadPlotSize")
+    if plot_size is not None:
+        if rows < 0 or cols < 0:
+            raise FieldShapeError("errNoZero")
+        if any(np.any(np.asarray(size) <= 0) for size in plot_size):
+            raise FieldShapeError("errNegative")
+    elif rows <= 0 or cols <= 0:
+        raise FieldShapeError("errNoZero")
+
+
+def check_target_crs(crs):
+    """输出CRS须为米制投影坐标系"""
+    if crs.isGeographic():
+        raise FieldShapeError("errMeterCRS")
+
+
+def collect_blocks(source, rows, cols, x_buffer=0.0, y_buffer=0.0, id_field=None,
+                   rows_field=None, cols_field=None, x_buffer_field=None, y_buffer_field=None,
+                   hull=None, rect=None, plot_size=None, quad=False, vertices=None):
+    """读取所有要素作为区块, 各区块的参数可从属性字段读取
+
+    hull(feature) / rect(feature) / vertices(feature)可返回已缓存的凸包顶点, 外接矩形
+    和多边形自身的顶点, 默认由几何计算; plot_size为固定子地块尺寸(宽度, 长度), 所有区块共用;
+    quad为True时按边界四边形双线性分割, 所有区块共用, 区块使用多边形自身的顶点
+    """
+    if quad:
+        hull = vertices or (lambda feature: get_polygon_vertices(feature.geometry()))
+    blocks = []
+    for feature in source.getFeatures():
+        blocks.append(BlockSpec(
+            feature_value(feature, id_field, feature.id()),
+            hull(feature) if hull else get_hull_vertices(feature.geometry()),
+            feature_value(feature, rows_field, rows, int),
+            feature_value(feature, cols_field, cols, int),
+            feature_value(feature, x_buffer_field, x_buffer, float),
+            feature_value(feature, y_buffer_field, y_buffer, float),
+            rect(feature) if rect else None,
+            plot_size,
+            quad,
+        ))
+    return blocks
+
+
+def subplot_fields(source=None, batch=False, id_field=None):
+    """输出图层字段: id, [block_id], row, col"""
+    fields = QgsFields()
+    fields.append(QgsField("id", QVariant.Int))
+    if batch:
+        # 区块ID沿用来源字段的类型
+        if id_field:
+            block_field = QgsField(source.fields().field(id_field))
+            block_field.setName("block_id")
+        else:
+            block_field = QgsField("block_id", QVariant.LongLong)
+        fields.append(block_field)
+    fields.append(QgsField("row", QVariant.Int))
+    fields.append(QgsField("col", QVariant.Int))
+    return fields
+
+
+def prepare_blocks(source, rows, cols, x_buffer=0.0, y_buffer=0.0, batch=False, id_field=None,
+                   rows_field=None, cols_field=None, x_buffer_field=None, y_buffer_field=None,
+                   plot_size=None, quad=False):
+    """验证边界图层并读取区块, 返回输出字段和BlockSpec列表
+
+    需要访问图层, 应在主线程中调用; 返回的区块为纯数据, 可交给后台任务分割.
+    plot_size为(宽度, 长度)时按固定子地块尺寸排列, rows / cols为0时尽量排满;
+    quad为True时子地块填满边界四边形(双线性插值), 而不是其最小面积外接矩形
+    """
+    validate_grid(rows, cols, plot_size, quad)
+    validate_source(source, batch, id_field=id_field)
+
+    blocks = collect_blocks(source, rows, cols, x_buffer, y_buffer, id_field,
+                            rows_field, cols_field, x_buffer_field, y_buffer_field,
+                            plot_size=plot_size, quad=quad)
+    return subplot_fields(source, batch, id_field), blocks
+
+
+def prepare_subplots(source, rows, cols, x_buffer=0.0, y_buffer=0.0, batch=False, id_field=None,
+                     rows_field=None, cols_field=None, x_buffer_field=None, y_buffer_field=None,
+                     max_workers=None, plot_size=None, quad=False):
+    """验证并分割边界图层, 返回输出字段和各区块的网格(BlockResult列表)
+
+    batch=False时图层只能包含一个四边形要素;
+    batch=True时每个要素为一个区块, 并行分割.
+    plot_size, quad见prepare_blocks(), 排列结果在各网格的layout属性中
+    """
+    fields, blocks = prepare_blocks(source, rows, cols, x_buffer, y_buffer, batch, id_field,
+                                    rows_field, cols_field, x_buffer_field, y_buffer_field,
+                                    plot_size, quad)
+    return fields, divide_blocks(blocks, max_workers=max_workers)
+
+
+def crs_transform(source_crs, target_crs, transform_context=None):
+    """坐标系转换, 坐标系相同时返回None"""
+    if source_crs == target_crs:
+        return None
+    return QgsCoordinateTransform(source_crs, target_crs,
+                                  transform_context or QgsCoordinateTransformContext())
+
+
+def transform_points(points, transform):
+    """坐标数组(..., 2)一次性转换坐标系
+
+    所有点编码为一条WKB折线, 由QgsGeometry.transform()批量转换, 不逐点调用Python
+    """
+    points = np.asarray(points, dtype=float)
+    flat = points.reshape(-1, 2)
+
+    geom = QgsGeometry()
+    geom.fromWkb(struct.pack("<BII", 1, 2, len(flat)) + flat.astype("<f8").tobytes())
+    try:
+        geom.transform(transform)
+    except QgsCsException as e:
+        raise FieldShapeError("errTransform", str(e)) from e
+
+    line = geom.constGet()
+    out = np.column_stack([line.xVector(), line.yVector()])
+    return out.reshape(points.shape)
+
+
+def grid_cells(grid, transform=None):
+    """网格的子地块角点(N, 4, 2), 需要时转换坐标系
+
+    只转换共享的(rows+1)×(cols+1)格网点, 再由其组装子地块,
+    转换量与格网点数成正比, 且相邻子地块的边转换后仍然重合
+    """
+    if transform is None:
+        return grid.cells()
+    return grid.cells(lattice=transform_points(grid.lattice(), transform))
+
+
+def geometry_rings(geom):
+    """多边形(含多部件和洞)的所有环坐标, 用于像素掩膜"""
+    polygons = geom.asMultiPolygon() if geom.isMultipart() else [geom.asPolygon()]
+    return [np.array([(p.x(), p.y()) for p in ring]) for polygon in polygons for ring in polygon]
+
+
+def geometry_corners(geom):
+    """子地块多边形的四个角点(4, 2), 顺序与写出时一致; 不是四边形时返回None"""
+    vertices = _vertices(geom)
+    if len(vertices) != 5:
+        return None
+    return np.array([(p.x(), p.y()) for p in vertices[:4]])
+
+
+def raster_path(raster_layer):
+    """栅格图层对应的GDAL数据源"""
+    if raster_layer is None or raster_layer.type() != QgsMapLayer.RasterLayer:
+        raise FieldShapeError("errNotRaster")
+    return raster_layer.dataProvider().dataSourceUri()
+
+
+def zonal_fields(names):
+    """分区统计的输出字段"""
+    return [QgsField(name, QVariant.Double) for name in names]
+
+
+ZonalConfig = namedtuple("ZonalConfig", ["path", "transform", "bands", "statistics",
+                                         "percentiles", "names"])
+
+
+def zonal_config(crs, raster_layer, bands=None, statistics=STATISTICS, percentiles=(),
+                 transform_context=None):
+    """读取栅格图层的分区统计参数(主线程), 返回ZonalConfig
+
+    transform为子地块到栅格坐标系的转换, 坐标系相同时为None
+    """
+    path = raster_path(raster_layer)
+    transform = crs_transform(crs, raster_layer.crs(), transform_context)
+
+    bands = list(bands or RasterInfo(path).data_bands)
+    statistics = list(statistics)
+    percentiles = list(percentiles)
+    return ZonalConfig(path, transform, bands, statistics, percentiles,
+                       stat_names(bands, statistics, percentiles))
+
+
+def auto_fit(rect, crs, raster_layer, transform_context=None, **kwargs):
+    """由DOM图层估算外接矩形rect(crs坐标系)内的网格参数, 返回GridFit
+
+    rect转换到栅格坐标系后采样, 间距按rect在crs中的边长(米)输出
+    """
+    path = raster_path(raster_layer)
+    rect = np.asarray(rect, dtype=float)[:4]
+    lengths = np.hypot(*(rect[1] - rect[0])), np.hypot(*(rect[3] - rect[0]))
+    transform = crs_transform(crs, raster_layer.crs(), transform_context)
+    if transform is not None:
+        rect = transform_points(rect, transform)
+    return fit_grid(path, rect, lengths, **kwargs)
+
+
+def results_zonal_statistics(results, config, max_workers=None, progress=None):
+    """按ZonalConfig计算一组区块子地块的分区统计(N, 字段数), 不访问图层, 可在后台线程调用"""
+    if not results:
+        return np.empty((0, len(config.names)))
+
+    # 每个线程使用转换的副本
+    transform = (QgsCoordinateTransform(config.transform)
+                 if config.transform is not None else None)
+    cells = np.concatenate([grid_cells(result.grid, transform) for result in results])
+
+    return zonal_statistics(config.path, cells, config.bands, config.statistics,
+                            config.percentiles, max_workers=max_workers, progress=progress)
+
+
+def compute_zonal_statistics(results, crs, raster_layer, bands=None, statistics=STATISTICS,
+                             percentiles=(), transform_context=None, max_workers=None):
+    """计算所有区块子地块在栅格中的分区统计
+
+    返回字段名列表和统计数组(N, 字段数), 行顺序与iter_subplot_features()的要素一致
+    """
+    config = zonal_config(crs, raster_layer, bands, statistics, percentiles, transform_context)
+    return config.names, results_zonal_statistics(results, config, max_workers)
+
+
+CoverConfig = namedtuple("CoverConfig", ["path", "transform", "expression", "threshold",
+                                         "names"])
+
+
+def cover_config(crs, raster_layer, blocks=None, expression="ExG", threshold=None,
+                 transform_context=None):
+    """读取栅格图层的植被覆盖度参数(主线程), 返回CoverConfig
+
+    threshold为空时, 由区块范围内降采样(金字塔)的指数直方图计算全局Otsu阈值,
+    之后各子任务使用同一阈值, 不需要为选择阈值遍历整个栅格
+    """
+    path = raster_path(raster_layer)
+    transform = crs_transform(crs, raster_layer.crs(), transform_context)
+
+    if threshold is None:
+        window = None
+        if blocks:
+            points = np.concatenate([np.asarray(block.hull, dtype=float).reshape(-1, 2)
+                                     for block in blocks])
+            if transform is not None:
+                points = transform_points(points, transform)
+            info = RasterInfo(path)
+            px = world_to_pixel(info.geotransform, points)
+            lo = np.clip(np.floor(px.min(axis=0)), 0, [info.width, info.height]).astype(int)
+            hi = np.clip(np.ceil(px.max(axis=0)), 0, [info.width, info.height]).astype(int)
+            if (hi > lo).all():
+                window = (lo[0], lo[1], hi[0], hi[1])
+        try:
+            threshold = cover_threshold(path, expression, window=window)
+        except ValueError as e:
+            raise FieldShapeError("errNoPixels") from e
+
+    return CoverConfig(path, transform, expression, threshold, list(COVER_NAMES))
+
+
+def results_canopy_cover(results, config, max_workers=None, progress=None):
+    """按CoverConfig计算一组区块子地块的植被覆盖度(N, 3), 不访问图层, 可在后台线程调用"""
+    if not results:
+        return np.empty((0, len(config.names)))
+
+    transform = (QgsCoordinateTransform(config.transform)
+                 if config.transform is not None else None)
+    cells = np.concatenate([grid_cells(result.grid, transform) for result in results])
+    values, _ = canopy_cover(config.path, cells, config.expression, threshold=config.threshold,
+                             max_workers=max_workers, progress=progress)
+    return values
+
+
+def compute_plant_height(results, crs, dsm_layer, dtm_layer=None, baseline_percentile=50,
+                         statistics=HEIGHT_STATISTICS, percentiles=HEIGHT_PERCENTILES,
+                         transform_context=None, max_workers=None, **kwargs):
+    """计算所有区块子地块的株高统计, 返回字段名列表, 统计数组(N, 字段数)
+    和每个子地块超出株高范围的像素数(N,)
+
+    株高为DSM减DTM; 没有DTM时以每个子地块周围行列间距(走道)内DSM的
+    baseline_percentile百分位数为土壤基准, 需要间距大于0
+    """
+    dsm_path = raster_path(dsm_layer)
+    transform = crs_transform(crs, dsm_layer.crs(), transform_context)
+    cells = np.concatenate([grid_cells(result.grid, transform) for result in results])
+
+    dtm_path = None
+    baselines = None
+    if dtm_layer is not None:
+        dtm_path = raster_path(dtm_layer)
+    else:
+        alleys = np.concatenate([result.grid.alley_cells() for result in results])
+        if transform is not None:
+            alleys = transform_points(alleys, transform)
+        if np.allclose(alleys, cells):
+            raise FieldShapeError("errNoAlley")
+        baselines = soil_baseline(dsm_path, alley_rings(cells, alleys), baseline_percentile,
+                                  max_workers=max_workers)
+
+    values, clipped = plant_height(dsm_path, cells, dtm_path, baselines, statistics, percentiles,
+                                   max_workers=max_workers, **kwargs)
+    return height_names(statistics, percentiles), values, clipped
+
+
+FieldBookConfig = namedtuple("FieldBookConfig", ["book", "order", "serpentine", "start",
+                                                 "names"])
+
+# 记录本列类型对应的字段类型
+FIELDBOOK_TYPES = {"int": QVariant.Int, "int64": QVariant.LongLong, "float": QVariant.Double,
+                   "str": QVariant.String}
+
+
+def fieldbook_config(path, fields=None, order="row", serpentine=False, start="row1_col1",
+                     sheet=None):
+    """读取田间记录本(CSV / XLSX, 逐行读取), 返回FieldBookConfig
+
+    记录本每行对应一个子地块, 按order / serpentine / start的种植顺序排列;
+    names为输出字段名, 与fields中已有字段重名时加前缀fb_
+    """
+    book = read_fieldbook(path, sheet)
+    reserved = fields.names() if fields is not None else ()
+    return FieldBookConfig(book, order, serpentine, start, book.field_names(reserved))
+
+
+def check_fieldbook(config, count):
+    """记录本行数与子地块数不一致时报错, 应在写出之前调用"""
+    check_count(config.book, count)
+
+
+def fieldbook_fields(config):
+    """记录本的输出字段, 类型由各列的值推断"""
+    return [QgsField(name, FIELDBOOK_TYPES[t])
+            for name, t in zip(config.names, config.book.column_types())]
+
+
+def results_fieldbook(results, config):
+    """各子地块(按输出id顺序)的记录本属性列表
+
+    由每个区块的(行, 列)→顺序号数组一次计算全部子地块对应的记录本行号,
+    超出记录本的子地块为空值; 不访问图层, 可在后台线程调用
+    """
+    positions = fieldbook_positions([result.grid.shape for result in results],
+                                    config.order, config.serpentine, config.start)
+    return config.book.take(positions)
+
+
+def attribute_values(row):
+    """统计值转换为属性值, NaN为空值"""
+    return [None if np.isnan(v) else float(v) for v in row]
+
+
+def iter_subplot_features(fields, results, chunk_size=CHUNK_SIZE, extra=None, transform=None,
+                          records=None):
+    """按批生成子地块要素(每批最多chunk_size个), 供写入器逐批写入
+
+    records为每个子地块的记录本属性(results_fieldbook()的结果), 接在行列号之后;
+    extra为附加在每个要素末尾的属性数组(N, k), 如分区统计结果;
+    transform为到输出坐标系的转换(按格网点批量转换)
+    """
+    with_block = fields.indexOf("block_id") != -1
+    lattice_transform = None
+    if transform is not None:
+        def lattice_transform(lattice):
+            return transform_points(lattice, transform)
+
+    # 子地块按行分批生成, 不会一次生成整个网格
+    fid = 0
+    for result in results:
+        for cells, row_idx, col_idx in result.grid.iter_cells(chunk_size, lattice_transform):
+            chunk = []
+            geometries = cells_to_geometries(cells)
+            for geom, row, col in zip(geometries, row_idx, col_idx):
+                feat = QgsFeature(fields)
+                feat.setGeometry(geom)
+                attrs = [fid, int(row)+1, int(col)+1]  # 从1开始计数
+                if with_block:
+                    attrs.insert(1, result.block_id)
+                if records is not None:
+                    attrs.extend(records[fid])
+                if extra is not None:
+                    attrs.extend(attribute_values(extra[fid]))
+                feat.setAttributes(attrs)
+                chunk.append(feat)
+                fid += 1
+            yield chunk
+
+
+def locate_points(results, points):
+    """点(M, 2)所在的子地块, 返回区块序号, 行号, 列号(从1开始)和子地块id
+
+    id与iter_subplot_features()输出的id字段一致; 不在任何子地块内的点均为-1.
+    points须与results位于同一坐标系
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    block = np.full(len(points), -1)
+    row = np.full(len(points), -1)
+    col = np.full(len(points), -1)
+    fid = np.full(len(points), -1)
+
+    offset = 0
+    for b, result in enumerate(results):
+        todo = np.flatnonzero(fid < 0)
+        r, c, index = result.grid.locate(points[todo])
+        hit = index >= 0
+        todo = todo[hit]
+        block[todo] = b
+        row[todo] = r[hit] + 1
+        col[todo] = c[hit] + 1
+        fid[todo] = index[hit] + offset
+        offset += len(result.grid)
+    return block, row, col, fid
+
+
+def divide_source(source, rows, cols, x_buffer=0.0, y_buffer=0.0, batch=False, id_field=None,
+                  rows_field=None, cols_field=None, x_buffer_field=None, y_buffer_field=None,
+                  max_workers=None, plot_size=None, quad=False):
+    """分割边界图层, 返回输出字段和全部子地块要素列表(适用于小规模网格)
+
+    plot_size, quad见prepare_blocks()
+    """
+    fields, results = prepare_subplots(source, rows, cols, x_buffer, y_buffer, batch, id_field,
+                                       rows_field, cols_field, x_buffer_field, y_buffer_field,
+                                       max_workers, plot_size, quad)
+    features = []
+    for chunk in iter_subplot_features(fields, results):
+        features.extend(chunk)
+
+    return fields, features
+
+
+def create_memory_layer(fields, chunks, crs, name="subplots"):
+    """创建包含子地块的临时图层, chunks为按批生成的要素列表"""
+    layer = QgsVectorLayer("Polygon?crs=" + crs.authid(), name, "memory")
+    provider = layer.dataProvider()
+    provider.addAttributes(fields)
+    layer.updateFields()
+    for chunk in chunks:
+        provider.addFeatures(chunk)
+    layer.updateExtents()
+    return layer
+
+
+def output_driver(output_path):
+    """按扩展名选择输出驱动, 返回(驱动名, 图层选项)"""
+    ext = os.path.splitext(output_path)[1].lower()
+    if ext not in OUTPUT_DRIVERS:
+        raise FieldShapeError("errFormat", ext)
+    return OUTPUT_DRIVERS[ext]
+
+
+def count_subplots(blocks):
+    """区块的子地块总数"""
+    return sum(block_count(block) for block in blocks)
+
+
+def estimate_output_size(count, n_fields, output_path=None):
+    """估算count个子地块(各n_fields个属性)输出的字节数, output_path为空时估算临时图层的内存占用"""
+    if output_path:
+        per_feature = FEATURE_BYTES[output_driver(output_path)[0]]
+    else:
+        per_feature = MEMORY_FEATURE_BYTES
+    return count * (per_feature + FIELD_BYTES * n_fields)
+
+
+def format_size(size):
+    """字节数转换为易读的字符串"""
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def check_output_size(count, n_fields, output_path=None):
+    """写出前估算输出大小, 返回估算的字节数
+
+    超过Shapefile的2GB限制或输出目录的剩余空间时抛出FieldShapeError
+    """
+    size = estimate_output_size(count, n_fields, output_path)
+    if output_path:
+        if output_driver(output_path)[0] == "ESRI Shapefile" and size > SHAPEFILE_LIMIT:
+            raise FieldShapeError("errShpLimit", format_size(size))
+        free = shutil.disk_usage(os.path.dirname(os.path.abspath(output_path))).free
+        if size > free:
+            raise FieldShapeError("errDiskSpace", f"{format_size(size)} > {format_size(free)}")
+    return size
+
+
+def _output_files(path):
+    """输出文件及其附属文件(Shapefile的.dbf, .shx, .qix等, GeoPackage的-wal, -shm)中存在的路径"""
+    stem, ext = os.path.splitext(path)
+    if ext.lower() == ".shp":
+        return [stem + e for e in SHAPEFILE_EXTENSIONS if os.path.exists(stem + e)]
+    return [p for p in (path, path + "-wal", path + "-shm", path + "-journal")
+            if os.path.exists(p)]
+
+
+def _remove_output(path):
+    for file in _output_files(path):
+        os.remove(file)
+
+
+def write_subplots(fields, chunks, crs, output_path, transform_context=None, feedback=None):
+    """将按批生成的子地块要素直接写入文件, 返回输出图层名
+
+    不经过临时图层, 每批要素以addFeatures批量写入;
+    输出格式由扩展名决定(.shp / .gpkg / .fgb), 空间索引由写入器的图层选项在关闭时创建.
+    先写入同目录下的临时文件名(如plots.partial.shp), 完成后才替换输出文件,
+    出错或中止时删除临时文件, 不会留下不完整的输出.
+    不访问项目和界面, 可在后台任务中调用; feedback(已写入要素数)返回False时中止, 返回None
+    """
+    driver, layer_options = output_driver(output_path)
+    layer_name = os.path.splitext(os.path.basename(output_path))[0]
+    stem, ext = os.path.splitext(output_path)
+    temp_path = f"{stem}.partial{ext}"
+
+    options = QgsVectorFileWriter.SaveVectorOptions()
+    options.driverName = driver
+    options.fileEncoding = "UTF-8"
+    options.layerName = layer_name
+    options.layerOptions = layer_options
+
+    completed = False
+    writer = None
+    try:
+        # 上次中断留下的临时文件
+        _remove_output(temp_path)
+        writer = QgsVectorFileWriter.create(
+            temp_path,
+            fields,
+            QgsWkbTypes.Polygon,
+            crs,
+            transform_context or QgsCoordinateTransformContext(),
+            options
+        )
+        if writer.hasError() != QgsVectorFileWriter.NoError:
+            raise FieldShapeError("errSave", writer.errorMessage())
+
+        written = 0
+        for chunk in chunks:
+            if not writer.addFeatures(chunk):
+                raise FieldShapeError("errSave", writer.errorMessage())
+            written += len(chunk)
+            if feedback is not None and feedback(written) is False:
+                break
+        else:
+            completed = True
+    finally:
+        # 释放写入器以完成写入(同时写出空间索引)
+        writer = None
+        if not completed:
+            _remove_output(temp_path)
+    if not completed:
+        return None
+
+    try:
+        _remove_output(output_path)
+        temp_stem = os.path.splitext(os.path.basename(temp_path))[0]
+        for file in _output_files(temp_path):
+            name = os.path.basename(file)
+            os.replace(file, os.path.join(os.path.dirname(file),
+                                          layer_name + name[len(temp_stem):]))
+    except OSError as e:
+        raise FieldShapeError("errSave", str(e))
+    return layer_name
+
+
+def open_output(output_path, layer_name=None):
+    """打开写出的子地块文件"""
+    layer_name = layer_name or os.path.splitext(os.path.basename(output_path))[0]
+    saved_layer = QgsVectorLayer(output_path, layer_name, "ogr")
+    if not saved_layer.isValid():
+        raise FieldShapeError("errSaveLoad")
+    return saved_layer
+
+
+def save_subplots(fields, chunks, crs, output_path, transform_context=None):
+    """将按批生成的子地块要素写入文件, 返回打开的输出图层"""
+    layer_name = write_subplots(fields, chunks, crs, output_path, transform_context)
+    return open_output(output_path, layer_name)
@@ -0,0 +1,314 @@
+# File: autofit
+# Author: Haozhou Wang
+# Organization: UTOkyo FieldPhenomics Lab
+# Description:
+#     Detect the subplot rows, columns and spacing from a low resolution overview
+#     of the orthomosaic (no Qt / QGIS)
+# Dependencies:
+#     - Python 3.x
+#     - NumPy
+#     - GDAL (osgeo, shipped with QGIS)
+# License: MIT
+# Usage:
+#     fit = fit_grid("dom.tif", rect)   # rect: get_min_area_rectangle()的四个顶点
+#     SubplotGrid.from_rectangle(rect, fit.rows, fit.cols, fit.x_buffer, fit.y_buffer)
+
+import warnings
+from collections import namedtuple
+
+import numpy as np
+from osgeo import gdal
+
+from .errors import FieldShapeError
+from .indices import INDICES, compile_expression
+from .raster import RasterInfo, pixel_to_world, world_to_pixel
+
+# 外接矩形内采样点数的上限(长边), 从金字塔中读取, 大型DOM也只需数秒
+MAX_SAMPLES = 1024
+# 最小子地块周期(地图单位, 米), 避免把子地块内的作物行识别为子地块
+MIN_PERIOD = 1.0
+# 自相关峰值低于该值时认为该方向没有周期(只有一个子地块)
+MIN_SCORE = 0.1
+# 周期整数分之一处(偏差在周期的HARMONIC_WIDTH以内)的峰值不低于最高峰的该比例时, 取其为基频
+HARMONIC_SCORE = 0.7
+HARMONIC_WIDTH = 0.05
+
+# 外接矩形边与第一个或最后一个子地块的距离超过周期的该比例时, 提示边界不够紧
+MARGIN_TOLERANCE = 0.1
+
+# 每个方向的拟合结果: 子地块数, 间距, 周期, 第一个子地块起点与矩形边的距离(相位),
+# 最后一个子地块终点与矩形另一边的距离和自相关峰值; 子地块超出矩形边时距离为负
+AxisFit = namedtuple("AxisFit", ["count", "buffer", "period", "phase", "end", "score"])
+GridFit = namedtuple("GridFit", ["rows", "cols", "x_buffer", "y_buffer", "x", "y"])
+
+
+def read_overview(path, rect, bands, max_samples=MAX_SAMPLES):
+    """在外接矩形的旋转框架中采样栅格, 返回数据(b, ny, nx)和有效掩膜(ny, nx)
+
+    列沿矩形的x边(顶点0→1), 行沿y边(顶点0→3). 按采样间距降采样读取
+    (GDAL自动使用金字塔), 只读取矩形覆盖的窗口
+    """
+    info = RasterInfo(path)
+    gt = info.geotransform
+    rect = np.asarray(rect, dtype=float)[:4]
+    x_edge = rect[1] - rect[0]
+    y_edge = rect[3] - rect[0]
+
+    # 矩形的像素范围
+    px = world_to_pixel(gt, rect)
+    x0, y0 = np.clip(np.floor(px.min(axis=0)).astype(int), 0, [info.width, info.height])
+    x1, y1 = np.clip(np.ceil(px.max(axis=0)).astype(int), 0, [info.width, info.height])
+    if x1 <= x0 or y1 <= y0:
+        raise FieldShapeError("errAutoFit")
+
+    # 采样间距不小于像素, 长边不超过max_samples个采样点
+    pixel = np.sqrt(abs(gt[1] * gt[5] - gt[2] * gt[4]))
+    lengths = np.hypot(*x_edge), np.hypot(*y_edge)
+    step = max(pixel, max(lengths) / max_samples)
+    nx, ny = (max(1, int(np.ceil(length / step))) for length in lengths)
+
+    # 窗口降采样到采样间距读取
+    factor = step / pixel
+    bw = max(1, int(np.ceil((x1 - x0) / factor)))
+    bh = max(1, int(np.ceil((y1 - y0) / factor)))
+    dataset = gdal.Open(path)
+    buffer = np.empty((len(bands), bh, bw))
+    valid = np.ones((bh, bw), dtype=bool)
+    for i, b in enumerate(bands):
+        band = dataset.GetRasterBand(b)
+        buffer[i] = band.ReadAsArray(int(x0), int(y0), int(x1 - x0), int(y1 - y0), bw, bh,
+                                     resample_alg=gdal.GRIORA_Average)
+        if not band.GetMaskFlags() & gdal.GMF_ALL_VALID:
+            valid &= band.GetMaskBand().ReadAsArray(int(x0), int(y0), int(x1 - x0),
+                                                    int(y1 - y0), bw, bh) > 0
+    dataset = None
+
+    # 降采样窗口的仿射变换
+    origin = pixel_to_world(gt, np.array([x0, y0]))
+    sx = (x1 - x0) / bw
+    sy = (y1 - y0) / bh
+    buffer_gt = (origin[0], gt[1] * sx, gt[2] * sy, origin[1], gt[4] * sx, gt[5] * sy)
+
+    # 旋转框架中的采样点(最近邻)
+    u = (np.arange(nx) + 0.5) / nx
+    v = ((np.arange(ny) + 0.5) / ny)[:, None, None]
+    world = rect[0] + u[:, None] * x_edge + v * y_edge
+    cr = np.floor(world_to_pixel(buffer_gt, world)).astype(int)
+    inside = (cr[..., 0] >= 0) & (cr[..., 0] < bw) & (cr[..., 1] >= 0) & (cr[..., 1] < bh)
+    c = np.clip(cr[..., 0], 0, bw - 1)
+    r = np.clip(cr[..., 1], 0, bh - 1)
+    return buffer[:, r, c], valid[r, c] & inside
+
+
+def _fill_gaps(profile):
+    """线性插值填充剖面中的空值, 有效值少于4个时返回None"""
+    ok = np.isfinite(profile)
+    if ok.sum() < 4:
+        return None
+    idx = np.arange(len(profile))
+    return np.interp(idx, idx[ok], profile[ok])
+
+
+def axis_period(profile, min_lag=2):
+    """由自相关估算剖面的周期(采样点数, 亚采样点精度), 返回(周期, 峰值)
+
+    周期短于min_lag的成分(如子地块内的作物行)在自相关之前滤除;
+    没有明显周期时周期为None
+    """
+    n = len(profile)
+    p = profile - np.polyval(np.polyfit(np.arange(n), profile, 1), np.arange(n))
+    spectrum = np.fft.rfft(p, 2 * n)
+    if min_lag >= 2:
+        spectrum[int(np.ceil(2 * n / min_lag)) + 1:] = 0
+    acf = np.fft.irfft(np.abs(spectrum) ** 2)[:n]
+    if acf[0] <= 0:
+        return None, 0.0
+    acf /= acf[0]
+
+    # 周期至少覆盖两个完整周期
+    lags = np.arange(max(1, min_lag), n // 2)
+    lags = lags[(acf[lags] > acf[lags - 1]) & (acf[lags] >= acf[lags + 1])]
+    if len(lags) == 0:
+        return None, 0.0
+    peak, score = _refine_peak(acf, lags[np.argmax(acf[lags])])
+    if score < MIN_SCORE:
+        return None, score
+
+    # 周期不是整数个采样点时, 周期整数倍处的峰值可能略高于基频;
+    # 从最小的整数分之一开始, 取峰值接近最高峰的基频
+    period = peak
+    for m in range(int(peak // max(1, min_lag)), 1, -1):
+        height = _near_peak(acf, lags, peak / m)[1]
+        if height >= HARMONIC_SCORE * score:
+            period, score = peak / m, height
+            break
+
+    # 有偏自相关随延迟线性衰减, 峰值位置偏向小延迟; 定位使用无偏自相关
+    unbiased = acf * n / (n - np.arange(n))
+    return _harmonic_period(unbiased, lags, period), score
+
+
+def _refine_peak(acf, k):
+    """抛物线插值峰值k的亚采样点位置和高度"""
+    a, b, c = acf[k - 1], acf[k], acf[k + 1]
+    denom = a - 2 * b + c
+    shift = float(np.clip(0.5 * (a - c) / denom, -0.5, 0.5)) if denom != 0 else 0.0
+    return k + shift, float(b - 0.25 * (a - c) * shift)
+
+
+def _near_peak(acf, lags, position, period=None):
+    """position附近(周期period的HARMONIC_WIDTH以内, 至少1个采样点)最高的峰值, 返回(位置, 高度)
+
+    period默认为position
+    """
+    width = HARMONIC_WIDTH * (position if period is None else period)
+    near = lags[np.abs(lags - position) <= max(1.0, width)]
+    if len(near) == 0:
+        return None, -np.inf
+    return max((_refine_peak(acf, k) for k in near), key=lambda peak: peak[1])
+
+
+def _harmonic_period(acf, lags, period):
+    """由周期各整数倍处的峰值位置最小二乘估算周期(逐个倍数更新预测位置)
+
+    单个峰值的抛物线插值受作物行等纹理影响, 多个倍数的拟合使误差约按倍数减小
+    """
+    orders, positions = [], []
+    for j in range(1, int(lags[-1] / period) + 1):
+        position, height = _near_peak(acf, lags, j * period, period)
+        if height < MIN_SCORE:
+            break
+        orders.append(j)
+        positions.append(position)
+        period = np.dot(orders, positions) / np.dot(orders, orders)
+    return float(period)
+
+
+def fold_profile(profile, period, bins=None):
+    """按周期折叠剖面, 返回每个相位区间的均值(bins,)"""
+    bins = bins or max(8, int(round(period)))
+    phase = (np.arange(len(profile)) % period) / period
+    index = np.minimum((phase * bins).astype(int), bins - 1)
+    sums = np.bincount(index, profile, minlength=bins)
+    counts = np.bincount(index, minlength=bins)
+    return sums / np.maximum(counts, 1)
+
+
+def _longest_run(mask):
+    """循环布尔序列中最长的连续True区间, 返回(起点, 长度)"""
+    n = len(mask)
+    if mask.all():
+        return 0, n
+    # 从一个False之后开始展开, 使区间不跨越首尾
+    offset = int(np.flatnonzero(~mask)[0]) + 1
+    rolled = np.roll(mask, -offset)
+    edges = np.diff(np.concatenate([[0], rolled.astype(int), [0]]))
+    begins = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    if len(begins) == 0:
+        return 0, 0
+    k = np.argmax(ends - begins)
+    return (begins[k] + offset) % n, int(ends[k] - begins[k])
+
+
+def _fundamental(profile, period, width=0.02, steps=41):
+    """在period附近(相对宽度width)搜索基频分量最强的周期, 返回(周期, 相位中心)
+
+    单位为采样点(采样点i的中心位于i + 0.5); 相位中心为基频分量的峰值位置,
+    即植被指数高的子地块中心, 使用整个剖面, 周期的微小误差不会在折叠中累积
+    """
+    x = np.arange(len(profile)) + 0.5
+    p = profile - profile.mean()
+    periods = period * (1 + np.linspace(-width, width, steps))
+    power = np.abs(np.exp(-2j * np.pi * x[None, :] / periods[:, None]) @ p)
+    k = int(np.clip(np.argmax(power), 1, steps - 2))
+    a, b, c = power[k - 1:k + 2]
+    denom = a - 2 * b + c
+    shift = float(np.clip(0.5 * (a - c) / denom, -0.5, 0.5)) if denom != 0 else 0.0
+    period = periods[k] + shift * (periods[1] - periods[0])
+    coef = np.exp(-2j * np.pi * x / period) @ p
+    return float(period), float(-np.angle(coef) / (2 * np.pi) * period % period)
+
+
+def fit_axis(profile, length, min_period=MIN_PERIOD):
+    """一个方向的拟合: 周期由自相关得到, 子地块数为round((总长 - 相位 + 间距) / 周期)
+
+    间距为折叠剖面中低于中值阈值(植被指数低)的最长连续区间,
+    子地块内作物行之间的短间隔不计入; 第一个子地块的起点为基频中心减去半个子地块.
+    相位为起点与矩形边的距离: 边前为空白时为正, 边切入子地块时为负
+    """
+    profile = _fill_gaps(profile)
+    if profile is None:
+        raise FieldShapeError("errAutoFit")
+    scale = length / len(profile)
+    period, score = axis_period(profile, int(np.ceil(min_period / scale)))
+    if period is None:
+        return AxisFit(1, 0.0, float(length), 0.0, 0.0, score)
+
+    period, center = _fundamental(profile, period)
+    folded = fold_profile(profile, period)
+    bins = len(folded)
+    begin, run = _longest_run(folded < (folded.min() + folded.max()) / 2)
+    gap = run / bins * period
+    start = (center - (period - gap) / 2) % period
+    # 起点之前超过一个间距时, 边或者切入了子地块, 或者留有更宽的空白:
+    # 比较边附近的均值与间距和子地块内的平均水平(子地块内可有作物行的起伏)
+    in_gap = np.zeros(bins, dtype=bool)
+    in_gap[(begin + np.arange(run)) % bins] = True
+    level = (folded[in_gap].mean() + folded[~in_gap].mean()) / 2 if run < bins else np.inf
+    head = profile[:max(1, int(round(start - gap)))]
+    phase = start if start <= gap or head.mean() < level else start - period
+
+    period, gap, phase = period * scale, gap * scale, phase * scale
+    count = max(1, int(round((length - phase + gap) / period)))
+    end = length - phase - count * period + gap
+    return AxisFit(count, float(gap) if count > 1 else 0.0, float(period), float(phase),
+                   float(end), score)
+
+
+def loose_margins(fit, tolerance=MARGIN_TOLERANCE):
+    """矩形边与子地块的距离超过周期的tolerance比例时返回(x起点, x终点, y起点, y终点)的距离,
+    否则返回None
+
+    网格从外接矩形的角点开始, 不能使用相位平移, 边界留有空白时子地块会偏移
+    """
+    margins = (fit.x.phase, fit.x.end, fit.y.phase, fit.y.end)
+    periods = (fit.x.period, fit.x.period, fit.y.period, fit.y.period)
+    if any(abs(m) > tolerance * p for m, p in zip(margins, periods)):
+        return margins
+    return None
+
+
+def fit_grid(path, rect, lengths=None, expression=None, band_map=None,
+             min_period=MIN_PERIOD, max_samples=MAX_SAMPLES):
+    """由DOM自动估算外接矩形内的网格参数, 返回GridFit
+
+    在矩形的旋转框架中采样降采样的栅格, 计算植被指数沿两个方向的投影剖面,
+    由自相关得到子地块的周期, 由折叠剖面得到间距和相位.
+    rect与栅格为同一坐标系; lengths为矩形x边和y边的实际长度(默认按rect坐标计算),
+    间距和周期按此长度输出. expression默认为ExG(单波段栅格为b1, 如植被指数栅格)
+    """
+    rect = np.asarray(rect, dtype=float)[:4]
+    if lengths is None:
+        lengths = np.hypot(*(rect[1] - rect[0])), np.hypot(*(rect[3] - rect[0]))
+
+    if expression is None:
+        expression = "ExG" if RasterInfo(path).count >= 3 else "b1"
+    evaluate, bands = compile_expression(INDICES.get(expression, expression), band_map)
+
+    data, valid = read_overview(path, rect, bands, max_samples)
+    index = np.where(valid, evaluate(data), np.nan)
+    index[~np.isfinite(index)] = np.nan
+    if not np.isfinite(index).any():
+        raise FieldShapeError("errAutoFit")
+
+    # 沿y方向平均得到x剖面(列), 沿x方向平均得到y剖面(行)
+    # 全为空值的行或列(矩形超出栅格)为NaN, 由fit_axis插值填充
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        x_profile = np.nanmean(index, axis=0)
+        y_profile = np.nanmean(index, axis=1)
+
+    x = fit_axis(x_profile, lengths[0], min_period)
+    y = fit_axis(y_profile, lengths[1], min_period)
+    return GridFit(y.count, x.count, x.buffer, y.buffer, x, y)
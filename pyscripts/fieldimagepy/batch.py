@@ -0,0 +1,86 @@
+# File: batch
+# Author: Haozhou Wang
+# Organization: UTOkyo FieldPhenomics Lab
+# Description:
+#     Divide many plot boundaries (blocks) in parallel (pure NumPy, no Qt / QGIS)
+# Dependencies:
+#     - Python 3.x
+#     - NumPy
+# License: MIT
+
+from collections import namedtuple
+from concurrent import futures
+
+from .errors import FieldShapeError
+from .grid import QuadGrid, SubplotGrid, order_quad, plot_layout
+from .minrect import min_area_rectangle
+
+# hull: 边界多边形的顶点(或凸包), rows / cols / 间距为该区块单独的参数
+# rect: 已计算的最小面积外接矩形(可选), 给出时不再重新计算
+# plot_size: 固定子地块尺寸(宽度, 长度)(可选), 给出时按尺寸排列, rows / cols为空时尽量排满
+# quad: 为True时按边界四边形本身双线性分割(QuadGrid), 不使用外接矩形;
+#       此时hull为多边形外环自身的顶点(按环的顺序, 可闭合), 而不是凸包
+BlockSpec = namedtuple("BlockSpec", ["block_id", "hull", "rows", "cols", "x_buffer", "y_buffer",
+                                     "rect", "plot_size", "quad"], defaults=(None, None, False))
+BlockResult = namedtuple("BlockResult", ["block_id", "rect", "grid"])
+
+
+def divide_block(block, is_hull=True):
+    """计算单个区块的最小面积外接矩形并生成网格"""
+    rect = block.rect
+    if rect is None:
+        # 四边形模式的顶点不一定是凸包
+        rect = min_area_rectangle(block.hull, is_hull=is_hull and not block.quad)
+    if rect is None:
+        raise FieldShapeError("errMinRect", block=block.block_id)
+
+    try:
+        if block.quad:
+            if block.plot_size is not None:
+                raise FieldShapeError("errQuadPlotSize")
+            grid = QuadGrid.from_quad(order_quad(block.hull, rect), block.rows, block.cols,
+                                      block.x_buffer, block.y_buffer)
+        elif block.plot_size is not None:
+            grid = SubplotGrid.from_plot_size(rect, *block.plot_size, block.x_buffer,
+                                              block.y_buffer, block.rows or None,
+                                              block.cols or None)
+        else:
+            grid = SubplotGrid.from_rectangle(rect, block.rows, block.cols,
+                                              block.x_buffer, block.y_buffer)
+    except FieldShapeError as e:
+        raise FieldShapeError(e.key, e.detail, block.block_id) from e
+
+    return BlockResult(block.block_id, rect, grid)
+
+
+def block_count(block, is_hull=True):
+    """区块的子地块数; 固定尺寸排列时只计算排列结果, 不生成网格"""
+    if block.plot_size is None:
+        return max(0, block.rows) * max(0, block.cols)
+    rect = block.rect
+    if rect is None:
+        rect = min_area_rectangle(block.hull, is_hull=is_hull)
+    if rect is None:
+        raise FieldShapeError("errMinRect", block=block.block_id)
+    try:
+        fit = plot_layout(rect, *block.plot_size, block.x_buffer, block.y_buffer,
+                          block.rows or None, block.cols or None)[-1]
+    except FieldShapeError as e:
+        raise FieldShapeError(e.key, e.detail, block.block_id) from e
+    return fit.rows * fit.cols
+
+
+def divide_blocks(blocks, is_hull=True, max_workers=None, use_processes=False):
+    """并行分割多个区块, 按输入顺序返回BlockResult列表
+
+    QGIS内嵌的Python解释器无法可靠地启动子进程, 因此默认使用线程池;
+    在独立的Python进程中(如命令行)可设置use_processes=True
+    """
+    blocks = list(blocks)
+    if len(blocks) <= 1:
+        return [divide_block(b, is_hull) for b in blocks]
+
+    # 进程池(multiprocessing)在使用时才加载
+    executor = futures.ProcessPoolExecutor if use_processes else futures.ThreadPoolExecutor
+    with executor(max_workers=max_workers) as pool:
+        return list(pool.map(divide_block, blocks, [is_hull] * len(blocks)))
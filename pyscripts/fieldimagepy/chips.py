@@ -0,0 +1,234 @@
+# File: chips
+# Author: Haozhou Wang
+# Organization: UTOkyo FieldPhenomics Lab
+# Description:
+#     Export each subplot from the orthomosaic as an image chip rotated into the grid frame (no Qt / QGIS)
+# Dependencies:
+#     - Python 3.x
+#     - NumPy
+#     - GDAL (osgeo, shipped with QGIS)
+# License: MIT
+
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+from osgeo import gdal, gdal_array
+
+from .raster import TILE_SIZE, RasterInfo, plan_tiles, polygon_windows, read_window, world_to_pixel
+
+# 输出格式: GDAL驱动, 扩展名, 创建选项
+CHIP_FORMATS = {
+    "GTiff": (".tif", ["COMPRESS=DEFLATE"]),
+    "PNG": (".png", ["WORLDFILE=YES"]),
+}
+RESAMPLING = ("bilinear", "nearest")
+
+# 记录已导出影像块签名的清单文件, 再次运行时跳过未改变的影像块
+MANIFEST = "chips.json"
+
+_local = threading.local()
+
+
+def _open(path):
+    """每个线程(或进程)单独打开并缓存栅格"""
+    datasets = getattr(_local, "datasets", None)
+    if datasets is None:
+        datasets = _local.datasets = {}
+    if path not in datasets:
+        datasets[path] = gdal.Open(path)
+    return datasets[path]
+
+
+def chip_frame(cell, resolution):
+    """子地块(4, 2)的影像块仿射框架, 返回(宽, 高, 地理变换)
+
+    列沿子地块的x边(角点0→1), 行沿y边, 方向取使影像不镜像的一侧;
+    像素尺寸按resolution取整后均分边长, 影像块恰好覆盖子地块
+    """
+    cell = np.asarray(cell, dtype=float)
+    x_edge = cell[1] - cell[0]
+    y_edge = cell[3] - cell[0]
+    width = max(1, int(np.ceil(np.hypot(*x_edge) / resolution)))
+    height = max(1, int(np.ceil(np.hypot(*y_edge) / resolution)))
+
+    # 右手系(y边在x边左侧)时从角点3开始向下排列行, 否则从角点0开始
+    if x_edge[0] * y_edge[1] - x_edge[1] * y_edge[0] > 0:
+        top_left, row_step = cell[3], -y_edge / height
+    else:
+        top_left, row_step = cell[0], y_edge / height
+    col_step = x_edge / width
+
+    geotransform = (top_left[0], col_step[0], row_step[0],
+                    top_left[1], col_step[1], row_step[1])
+    return width, height, geotransform
+
+
+def resample(data, valid, window, geotransform, chip_shape, chip_transform, method="bilinear"):
+    """按影像块的仿射框架从窗口数据(b, h, w)中重采样, 返回(b, 高, 宽)数据和有效掩膜"""
+    height, width = chip_shape
+    gt = chip_transform
+    cols = np.arange(width) + 0.5
+    rows = (np.arange(height) + 0.5)[:, None]
+    world = np.stack([gt[0] + cols * gt[1] + rows * gt[2],
+                      gt[3] + cols * gt[4] + rows * gt[5]], axis=-1)
+
+    # 源像素坐标(以像素中心为整数)
+    px = world_to_pixel(geotransform, world)
+    x = px[..., 0] - window[0] - 0.5
+    y = px[..., 1] - window[1] - 0.5
+    h, w = data.shape[1:]
+    inside = (x >= -0.5) & (x <= w - 0.5) & (y >= -0.5) & (y <= h - 0.5)
+
+    if method == "nearest":
+        xi = np.clip(np.rint(x).astype(int), 0, w - 1)
+        yi = np.clip(np.rint(y).astype(int), 0, h - 1)
+        return data[:, yi, xi], valid[:, yi, xi] & inside
+
+    x0 = np.clip(np.floor(x).astype(int), 0, w - 1)
+    y0 = np.clip(np.floor(y).astype(int), 0, h - 1)
+    x1 = np.minimum(x0 + 1, w - 1)
+    y1 = np.minimum(y0 + 1, h - 1)
+    fx = np.clip(x - x0, 0, 1)
+    fy = np.clip(y - y0, 0, 1)
+
+    out = (data[:, y0, x0] * (1 - fx) * (1 - fy) + data[:, y0, x1] * fx * (1 - fy)
+           + data[:, y1, x0] * (1 - fx) * fy + data[:, y1, x1] * fx * fy)
+    ok = valid[:, y0, x0] & valid[:, y0, x1] & valid[:, y1, x0] & valid[:, y1, x1]
+    return out, ok & inside
+
+
+def write_chip(path, data, valid, chip_transform, projection, data_type, nodata, fmt="GTiff"):
+    """写出一个影像块, 无效像素填充为nodata"""
+    bands, height, width = data.shape
+    dtype = np.dtype(gdal_array.GDALTypeCodeToNumericTypeCode(data_type))
+
+    mem = gdal.GetDriverByName("MEM").Create("", width, height, bands, data_type)
+    mem.SetGeoTransform(chip_transform)
+    mem.SetProjection(projection)
+    for b in range(bands):
+        values = np.where(valid[b], data[b], nodata)
+        if np.issubdtype(dtype, np.integer):
+            limits = np.iinfo(dtype)
+            values = np.clip(np.rint(values), limits.min, limits.max)
+        band = mem.GetRasterBand(b + 1)
+        band.WriteArray(values.astype(dtype))
+        band.SetNoDataValue(nodata)
+
+    gdal.GetDriverByName(fmt).CreateCopy(path, mem, options=CHIP_FORMATS[fmt][1])
+    mem = None
+
+
+def _export_tile(path, window, jobs, bands, projection, geotransform, data_type, nodata, fmt,
+                 method):
+    """读取一个瓦片窗口并导出其中所有影像块, jobs为[(输出路径, 宽, 高, 仿射变换), ...]"""
+    data, valid = read_window(_open(path), window, bands)
+    for out_path, width, height, chip_transform in jobs:
+        chip, chip_valid = resample(data, valid, window, geotransform, (height, width),
+                                    chip_transform, method)
+        write_chip(out_path, chip, chip_valid, chip_transform, projection, data_type, nodata, fmt)
+    return len(jobs)
+
+
+def raster_signature(path):
+    """源栅格的标识: 路径, 大小和修改时间"""
+    stat = os.stat(path)
+    return [os.path.abspath(path), stat.st_size, stat.st_mtime]
+
+
+def chip_signature(raster, cell, bands, resolution, fmt, method):
+    """影像块的签名: 源栅格标识, 子地块角点和导出参数"""
+    text = json.dumps([raster, np.round(np.asarray(cell, dtype=float), 6).tolist(),
+                       list(bands), resolution, fmt, method])
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def export_chips(path, cells, out_dir, ids=None, bands=None, fmt="GTiff", resolution=None,
+                 method="bilinear", prefix="subplot_", tile_size=TILE_SIZE, max_workers=None,
+                 use_processes=False, overwrite=False, progress=None):
+    """将每个子地块从栅格中切出为影像块, 旋转到网格方向, 返回(导出数, 跳过数)
+
+    cells为与栅格同一坐标系的子地块角点(N, 4, 2), ids为文件名中的编号(默认0, 1, ...);
+    子地块按块对齐的瓦片分组, 每个瓦片窗口只读取一次, 由其中所有影像块共享.
+    QGIS内嵌的解释器无法可靠地启动子进程, 默认使用线程池(GDAL读写时释放GIL);
+    在独立的Python进程中可设置use_processes=True.
+    与上次导出的签名相同且文件存在的影像块被跳过(overwrite=True时全部重新导出).
+    progress(已完成比例)返回False时取消
+    """
+    info = RasterInfo(path)
+    bands = list(bands or info.data_bands)
+    cells = np.asarray(cells, dtype=float)
+    ids = list(range(len(cells))) if ids is None else list(ids)
+    resolution = resolution or float(np.sqrt(abs(info.geotransform[1] * info.geotransform[5]
+                                                  - info.geotransform[2] * info.geotransform[4])))
+    ext = CHIP_FORMATS[fmt][0]
+
+    dataset = gdal.Open(path)
+    data_type = dataset.GetRasterBand(bands[0]).DataType
+    if fmt == "PNG" and data_type not in (gdal.GDT_Byte, gdal.GDT_UInt16):
+        data_type = gdal.GDT_UInt16
+    nodata = info.nodata[bands[0] - 1]
+    nodata = 0 if nodata is None else nodata
+    dataset = None
+
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, MANIFEST)
+    manifest = {}
+    if os.path.exists(manifest_path) and not overwrite:
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+
+    # 签名未改变且文件存在的影像块不再导出
+    raster = raster_signature(path)
+    signatures = {}
+    todo = []
+    for i, (cell, chip_id) in enumerate(zip(cells, ids)):
+        name = f"{prefix}{chip_id}{ext}"
+        signatures[name] = chip_signature(raster, cell, bands, resolution, fmt, method)
+        if manifest.get(name) == signatures[name] and os.path.exists(os.path.join(out_dir, name)):
+            continue
+        todo.append(i)
+    skipped = len(cells) - len(todo)
+
+    # 双线性插值需要窗口外多一个像素(与栅格不相交的子地块不导出)
+    windows = polygon_windows(cells[todo], info.geotransform, info.width, info.height)
+    hit = (windows[:, 2] > windows[:, 0]) & (windows[:, 3] > windows[:, 1])
+    windows[hit, :2] = np.maximum(windows[hit, :2] - 1, 0)
+    windows[hit, 2] = np.minimum(windows[hit, 2] + 1, info.width)
+    windows[hit, 3] = np.minimum(windows[hit, 3] + 1, info.height)
+    tiles = plan_tiles(windows, info.block_size, info.width, info.height, tile_size)
+
+    args = []
+    for window, indices in tiles:
+        jobs = []
+        for k in indices:
+            i = todo[k]
+            width, height, chip_transform = chip_frame(cells[i], resolution)
+            jobs.append((os.path.join(out_dir, f"{prefix}{ids[i]}{ext}"),
+                         width, height, chip_transform))
+        args.append((path, window, jobs, bands, info.projection, tuple(info.geotransform),
+                     data_type, nodata, fmt, method))
+
+    executor = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    written = 0
+    try:
+        with executor(max_workers=max_workers) as pool:
+            futures = [pool.submit(_export_tile, *a) for a in args]
+            for i, future in enumerate(futures):
+                written += future.result()
+                for out_path, *_ in args[i][2]:
+                    name = os.path.basename(out_path)
+                    manifest[name] = signatures[name]
+                if progress is not None and progress((i + 1) / len(futures)) is False:
+                    for pending in futures[i + 1:]:
+                        pending.cancel()
+                    break
+    finally:
+        # 只记录已完成的影像块, 中断后再次运行时继续
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1)
+
+    return written, skipped
@@ -0,0 +1,141 @@
+# File: context
+# Author: Haozhou Wang
+# Organization: UTOkyo FieldPhenomics Lab
+# Description:
+#     Per-session geometry context of the plot boundary layer, shared by Focus, Preview and Run
+# Dependencies:
+#     - Python 3.x
+#     - QGIS 3.x
+# License: MIT
+# Usage:
+#     context = GeometryContext(layer)
+#     context.validate(batch=False)
+#     angle = context.rotation_angle()
+#     blocks = context.blocks(rows=10, cols=4)
+
+from qgis.core import QgsFields
+
+from . import api
+from .errors import FieldShapeError
+from .minrect import min_area_rectangle, rotation_angle
+
+
+def layer_state(layer):
+    """图层的编辑和修改状态, 任何一项改变都会使上下文失效"""
+    undo_stack = layer.undoStack() if layer.isEditable() else None
+    return (layer.id(), layer.isEditable(), layer.isModified(),
+            undo_stack.index() if undo_stack is not None else -1,
+            layer.subsetString(), layer.dataProvider().dataSourceUri())
+
+
+class GeometryContext:
+
+    """边界图层的几何上下文
+
+    要素(几何和属性)只读取一次, 凸包, 最小面积外接矩形, 边向量和旋转角度
+    按要素ID缓存. 对PostGIS或大型GPKG等图层, 每次读取要素都是一次往返查询.
+    可直接作为api中的要素源(featureCount / getFeatures / fields)使用
+    """
+
+    def __init__(self, layer):
+        self.layer = layer
+        self.layer_id = layer.id()
+        self.state = layer_state(layer)
+        self.stale = False
+        self.features = list(layer.getFeatures())
+        self._fields = QgsFields(layer.fields())
+        self._hulls = {}
+        self._vertices = {}
+        self._rects = {}
+        self._validated = {}
+
+        # 图层数据改变(包括编辑中的修改和提交)时失效
+        layer.dataChanged.connect(self.invalidate)
+
+    def invalidate(self):
+        self.stale = True
+
+    def close(self):
+        """断开与图层的连接"""
+        try:
+            self.layer.dataChanged.disconnect(self.invalidate)
+        except (RuntimeError, TypeError):  # 图层已删除或未连接
+            pass
+
+    def matches(self, layer):
+        """上下文是否仍对应图层的当前状态"""
+        return (not self.stale and layer is not None
+                and layer.id() == self.layer_id and layer_state(layer) == self.state)
+
+    def featureCount(self):
+        return len(self.features)
+
+    def getFeatures(self):
+        return iter(self.features)
+
+    def fields(self):
+        return self._fields
+
+    def feature(self):
+        """第一个要素(单区块模式)"""
+        if not self.features:
+            raise FieldShapeError("errNotAPolygon")
+        return self.features[0]
+
+    def hull(self, feature):
+        """要素的凸包顶点"""
+        fid = feature.id()
+        if fid not in self._hulls:
+            self._hulls[fid] = api.get_hull_vertices(feature.geometry())
+        return self._hulls[fid]
+
+    def vertices(self, feature):
+        """要素外环自身的顶点(闭合, 四边形模式使用)"""
+        fid = feature.id()
+        if fid not in self._vertices:
+            self._vertices[fid] = api.get_polygon_vertices(feature.geometry())
+        return self._vertices[fid]
+
+    def rect(self, feature):
+        """要素的最小面积外接矩形(4, 2), 无法计算时为None"""
+        fid = feature.id()
+        if fid not in self._rects:
+            self._rects[fid] = min_area_rectangle(self.hull(feature), is_hull=True)
+        return self._rects[fid]
+
+    def min_area_rectangle(self, feature=None):
+        """外接矩形, 无法计算时抛出FieldShapeError"""
+        rect = self.rect(feature if feature is not None else self.feature())
+        if rect is None:
+            raise FieldShapeError("errMinRect")
+        return rect
+
+    def edges(self, feature=None):
+        """外接矩形的两条边向量: 沿列方向(0→1)和沿行方向(0→3)"""
+        rect = self.min_area_rectangle(feature)
+        return rect[1] - rect[0], rect[3] - rect[0]
+
+    def rotation_angle(self, feature=None):
+        """使外接矩形长边水平的旋转角度(度)"""
+        return rotation_angle(self.min_area_rectangle(feature))
+
+    def validate(self, batch=False, geometry_only=False, id_field=None):
+        """验证图层, 同一组参数的结果被缓存, 不通过时抛出FieldShapeError"""
+        key = (batch, geometry_only, id_field)
+        if key not in self._validated:
+            try:
+                api.validate_source(self, batch, geometry_only, id_field)
+                self._validated[key] = None
+            except FieldShapeError as e:
+                self._validated[key] = e
+        if self._validated[key] is not None:
+            raise self._validated[key]
+
+    def blocks(self, rows, cols, x_buffer=0.0, y_buffer=0.0, id_field=None, rows_field=None,
+               cols_field=None, x_buffer_field=None, y_buffer_field=None, plot_size=None,
+               quad=False):
+        """由缓存的凸包(四边形模式为多边形自身的顶点)和外接矩形生成区块(BlockSpec), 顺序与要素一致"""
+        return api.collect_blocks(self, rows, cols, x_buffer, y_buffer, id_field, rows_field,
+                                  cols_field, x_buffer_field, y_buffer_field,
+                                  hull=self.hull, rect=self.rect, plot_size=plot_size,
+                                  quad=quad, vertices=self.vertices)
@@ -0,0 +1,772 @@
+# File: dialog
+# Author: Haozhou Wang
+# Organization: UTOkyo FieldPhenomics Lab
+# Description:
+#     Subplot division dialog: creating subplots inside the given plot boundary
+# Dependencies:
+#     - Python 3.x
+#     - QGIS 3.x
+# License: MIT
+# Usage:
+#     由fieldShape.py启动, 或在QGIS控制台中:
+#     from fieldimagepy.dialog import show_dialog
+#     show_dialog()
+#
+#     界面, 翻译和iface只在导入本模块时加载, 核心几何模块(fieldimagepy)不依赖本模块
+
+import os
+
+import numpy as np
+from qgis.PyQt.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QLabel, 
+                                QLineEdit, QPushButton, QComboBox, QCheckBox,
+                                QMessageBox, QFileDialog, QWidget, QGridLayout)
+from qgis.PyQt.QtCore import (Qt, QVariant, QLocale, QTimer)
+from qgis.PyQt import QtGui
+from qgis.core import (QgsProject, QgsVectorLayer, QgsFeature, QgsGeometry, 
+                      QgsRectangle, QgsWkbTypes, QgsCoordinateReferenceSystem,
+                      QgsField, QgsFields, QgsMapLayer, QgsFillSymbol,
+                      QgsFieldProxyModel)
+from qgis.gui import QgsMapCanvas, QgsFieldComboBox
+from qgis.utils import iface
+
+from . import api
+from .errors import FieldShapeError
+from .fieldbook import START_CORNERS
+from .autofit import loose_margins
+from .batch import divide_block
+from .grid import parse_lengths, plot_layout
+from .i18n import get_lang
+from .context import GeometryContext
+from .tasks import SubplotDivisionTask, start_task
+from .trace import RunTrace, trace_enabled
+
+locale = QLocale.system().name()
+lang = get_lang(locale)
+
+# 实时预览的防抖间隔(毫秒)
+PREVIEW_DELAY = 250
+# 子地块数超过该值时, 运行前需要确认; 预览只显示不超过该数量的子地块
+LARGE_GRID = 100000
+
+class SubplotDivisionDialog(QDialog):
+
+    """
+    无视样地在地里面的朝向，仅按长短边来进行判断
+
+    O------>  col
+    |
+    |
+    v  row
+
+           long edge (width, x)
+    +---------------------------+
+    |                           |
+    |                           |  short edge (height, y)
+    |                           |
+    +---------------------------+
+
+      +--+   +--+   +--+   +--+
+      |  |   |  |   |  |   |  |     
+      |  |   |  |   |  |   |  |     
+      |  |   |  |   |  |   |  |     
+      +--+   +--+   +--+   +--+     
+    ^      
+    |  y_buffer
+    v
+      +--+   +--+   +--+   +--+
+      |  |   |  |   |  |   |  |
+      |  |   |  |   |  |   |  |
+      |  |   |  |   |  |   |  |
+      +--+   +--+   +--+   +--+
+          <->    <->    <->    
+               x_buffer 
+    """
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(lang['windowTitle'])
+        self.setMinimumWidth(400)
+        
+        # 创建UI元素
+        layout = QVBoxLayout()
+
+        self.layer_label = QLabel(lang['layerLbl'])
+        self.layer_combo = QComboBox()
+        self.populate_layer_combo()
+        
+        # 选择输入图层
+        layer_controls = QHBoxLayout()
+        layer_controls.addWidget(self.layer_combo, 5)
+
+        # 新增聚焦按钮
+        self.focus_button = QPushButton(lang['focusBtn'])
+        self.focus_button.clicked.connect(self.focus_and_rotate)
+        layer_controls.addWidget(self.focus_button)
+
+        layout.addWidget(self.layer_label, 1)
+        layout.addLayout(layer_controls)
+
+        # 批量模式: 每个要素为一个区块, 参数可从属性字段读取
+        self.batch_check = QCheckBox(lang['batchChk'])
+        self.batch_check.toggled.connect(self.toggle_batch)
+        layout.addWidget(self.batch_check)
+
+        self.batch_widget = QWidget()
+        batch_layout = QGridLayout()
+        batch_layout.setContentsMargins(0, 0, 0, 0)
+        self.id_field_combo = self.create_field_combo(QgsFieldProxyModel.AllTypes)
+        self.rows_field_combo = self.create_field_combo(QgsFieldProxyModel.Numeric)
+        self.cols_field_combo = self.create_field_combo(QgsFieldProxyModel.Numeric)
+        self.x_buffer_field_combo = self.create_field_combo(QgsFieldProxyModel.Numeric)
+        self.y_buffer_field_combo = self.create_field_combo(QgsFieldProxyModel.Numeric)
+        for i, (lbl, combo) in enumerate([
+                ('idFieldLbl', self.id_field_combo),
+                ('colsFieldLbl', self.cols_field_combo),
+                ('rowsFieldLbl', self.rows_field_combo),
+                ('xBufFieldLbl', self.x_buffer_field_combo),
+                ('yBufFieldLbl', self.y_buffer_field_combo)]):
+            batch_layout.addWidget(QLabel(lang[lbl]), i, 0)
+            batch_layout.addWidget(combo, i, 1)
+        self.batch_widget.setLayout(batch_layout)
+        self.batch_widget.setVisible(False)
+        layout.addWidget(self.batch_widget)
+
+        self.layer_combo.currentIndexChanged.connect(self.update_field_combos)
+        self.update_field_combos()
+        
+        # 行数和列数
+        self.cols_label = QLabel(lang['colsLbl'])
+        self.cols_edit = QLineEdit("5")
+        self.cols_edit.setValidator(self.create_count_validator())
+        layout.addWidget(self.cols_label)
+        layout.addWidget(self.cols_edit)
+
+        self.rows_label = QLabel(lang['rowsLbl'])
+        self.rows_edit = QLineEdit("5")
+        self.rows_edit.setValidator(self.create_count_validator())
+        layout.addWidget(self.rows_label)
+        layout.addWidget(self.rows_edit)
+
+        # 固定子地块尺寸: 按宽度和长度排列, 行列数为0时尽量排满
+        self.plot_size_check = QCheckBox(lang['plotSizeChk'])
+        self.plot_size_check.toggled.connect(self.toggle_plot_size)
+        layout.addWidget(self.plot_size_check)
+        self.plot_size_widget = QWidget()
+        plot_size_layout = QGridLayout()
+        plot_size_layout.setContentsMargins(0, 0, 0, 0)
+        self.plot_width_edit = QLineEdit("1.5")
+        self.plot_length_edit = QLineEdit("5")
+        plot_size_layout.addWidget(QLabel(lang['plotWidthLbl']), 0, 0)
+        plot_size_layout.addWidget(self.plot_width_edit, 0, 1)
+        plot_size_layout.addWidget(QLabel(lang['plotLengthLbl']), 1, 0)
+        plot_size_layout.addWidget(self.plot_length_edit, 1, 1)
+        self.plot_size_widget.setLayout(plot_size_layout)
+        self.plot_size_widget.setVisible(False)
+        layout.addWidget(self.plot_size_widget)
+
+        # 四边形模式: 子地块填满边界四边形本身(梯形, 斜边区块), 与固定尺寸互斥
+        self.quad_check = QCheckBox(lang['quadChk'])
+        self.quad_check.toggled.connect(self.toggle_quad)
+        layout.addWidget(self.quad_check)
+        
+        # 选择DOM图层用于CRS
+        self.dom_label = QLabel(lang['domLbl'])
+        self.dom_combo = QComboBox()
+        self.populate_dom_combo()
+        
+        # 由DOM自动识别行列数和间距
+        self.auto_fit_button = QPushButton(lang['autoFitBtn'])
+        self.auto_fit_button.clicked.connect(self.auto_fit)
+        dom_controls = QHBoxLayout()
+        dom_controls.addWidget(self.dom_combo, 5)
+        dom_controls.addWidget(self.auto_fit_button)
+        layout.addWidget(self.dom_label)
+        layout.addLayout(dom_controls)
+
+        # 从DOM计算子地块的分区统计
+        self.stats_check = QCheckBox(lang['statsChk'])
+        layout.addWidget(self.stats_check)
+
+        # 每个子地块的植被覆盖度(ExG, Otsu阈值)
+        self.cover_check = QCheckBox(lang['coverChk'])
+        layout.addWidget(self.cover_check)
+
+        # 各阶段的耗时和内存记录到QGIS日志(环境变量FIELDIMAGEPY_TRACE=1时默认勾选)
+        self.trace_check = QCheckBox(lang['traceChk'])
+        self.trace_check.setChecked(trace_enabled())
+        layout.addWidget(self.trace_check)
+        
+        # 缓冲区设置
+        self.x_buffer_label = QLabel(lang['xBufLbl'])
+        self.x_buffer_edit = QLineEdit("0")
+        # self.x_buffer_edit.setToolTip("AAA")
+        self.x_buffer_edit.setValidator(QtGui.QDoubleValidator())
+        layout.addWidget(self.x_buffer_label)
+        layout.addWidget(self.x_buffer_edit)
+        
+        self.y_buffer_label = QLabel(lang['yBufLbl'])
+        self.y_buffer_edit = QLineEdit("0")
+        self.y_buffer_edit.setValidator(QtGui.QDoubleValidator())
+        layout.addWidget(self.y_buffer_label)
+        layout.addWidget(self.y_buffer_edit)
+        
+        # 田间记录本: 按种植顺序将每行的属性连接到子地块
+        self.fieldbook_label = QLabel(lang['fieldBookLbl'])
+        self.fieldbook_edit = QLineEdit()
+        self.fieldbook_edit.setPlaceholderText(lang["fieldBookPlacehold"])
+        self.fieldbook_button = QPushButton("...")
+        self.fieldbook_button.setFixedWidth(30)
+        self.fieldbook_button.clicked.connect(self.select_fieldbook)
+        self.order_combo = QComboBox()
+        self.order_combo.addItem(lang['orderRow'], "row")
+        self.order_combo.addItem(lang['orderCol'], "column")
+        self.start_combo = QComboBox()
+        for key, corner in zip(("startR1C1", "startR1CN", "startRNC1", "startRNCN"),
+                               START_CORNERS):
+            self.start_combo.addItem(lang[key], corner)
+        self.serpentine_check = QCheckBox(lang['serpentineChk'])
+
+        fieldbook_layout = QHBoxLayout()
+        fieldbook_layout.addWidget(self.fieldbook_edit)
+        fieldbook_layout.addWidget(self.fieldbook_button)
+        order_layout = QHBoxLayout()
+        order_layout.addWidget(self.order_combo)
+        order_layout.addWidget(self.start_combo)
+        order_layout.addWidget(self.serpentine_check)
+        layout.addWidget(self.fieldbook_label)
+        layout.addLayout(fieldbook_layout)
+        layout.addLayout(order_layout)
+
+        # 输出选项
+        self.output_label = QLabel(lang['outputLbl'])
+        self.output_edit = QLineEdit()
+        self.output_edit.setPlaceholderText(lang["outputPlacehold"])  # 灰色提示文字
+        self.output_button = QPushButton("...")  # 改为单个点按钮
+        self.output_button.setFixedWidth(30)  # 实际使用30px，10px会太窄无法正常显示
+        self.output_button.clicked.connect(self.select_output)
+
+        output_layout = QHBoxLayout()
+        output_layout.addWidget(self.output_edit)
+        output_layout.addWidget(self.output_button)
+        layout.addWidget(self.output_label)
+        layout.addLayout(output_layout)
+        
+        # 按钮
+        self.preview_button = QPushButton(lang['prevBtn'])
+        self.preview_button.clicked.connect(self.preview)
+        self.run_button = QPushButton(lang['runBtn'])
+        self.run_button.clicked.connect(self.run)
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.clicked.connect(self.reject)
+        
+        button_layout = QHBoxLayout()
+        button_layout.addWidget(self.preview_button)
+        button_layout.addWidget(self.run_button)
+        button_layout.addWidget(self.cancel_button)
+        layout.addLayout(button_layout)
+        
+        self.setLayout(layout)
+        
+        # 预览画布和持久的预览图层
+        self.preview_canvas = None
+        self.preview_layer = None
+        self.preview_fids = []
+        self.preview_source_id = None
+        # 预览区块缓存: 几何上下文和字段不变时不重新生成区块
+        self.preview_key = None
+        self.preview_blocks = []
+
+        # 实时预览: 输入停止一段时间后才更新(防抖)
+        self.preview_timer = QTimer(self)
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.setInterval(PREVIEW_DELAY)
+        self.preview_timer.timeout.connect(self.update_preview)
+        for edit in [self.rows_edit, self.cols_edit, self.x_buffer_edit, self.y_buffer_edit,
+                     self.plot_width_edit, self.plot_length_edit]:
+            edit.textChanged.connect(self.schedule_preview)
+        self.batch_check.toggled.connect(self.schedule_preview)
+        self.plot_size_check.toggled.connect(self.schedule_preview)
+        self.quad_check.toggled.connect(self.schedule_preview)
+        self.layer_combo.currentIndexChanged.connect(self.schedule_preview)
+        for combo in self.field_combos():
+            combo.fieldChanged.connect(self.schedule_preview)
+
+        # 添加旋转角度存储变量
+        self.rotation_angle = 0.0
+
+        # 边界图层的几何上下文, 聚焦/预览/运行共用
+        self.context = None
+    
+    def populate_layer_combo(self):
+        """填充多边形图层到下拉框"""
+        self.layer_combo.clear()
+        layers = QgsProject.instance().mapLayers().values()
+        for layer in layers:
+            if layer.type() == QgsMapLayer.VectorLayer and layer.geometryType() == QgsWkbTypes.PolygonGeometry:
+                self.layer_combo.addItem(layer.name(), layer)
+    
+    def populate_dom_combo(self):
+        """填充DOM图层到下拉框"""
+        self.dom_combo.clear()
+        self.dom_combo.addItem("", None)
+        layers = QgsProject.instance().mapLayers().values()
+        for layer in layers:
+            self.dom_combo.addItem(layer.name(), layer)
+    
+    def create_count_validator(self):
+        """行数和列数: 非负整数(0仅用于固定尺寸模式), 不设上限(大规模网格按批生成)"""
+        validator = QtGui.QIntValidator(self)
+        validator.setBottom(0)
+        return validator
+    
+    def create_field_combo(self, filters):
+        """创建可留空的字段下拉框, 留空时使用对话框中的数值"""
+        combo = QgsFieldComboBox()
+        combo.setFilters(filters)
+        combo.setAllowEmptyFieldName(True)
+        return combo
+
+    def field_combos(self):
+        """批量模式的字段下拉框, 顺序与api.collect_blocks()的参数一致"""
+        return [self.id_field_combo, self.rows_field_combo, self.cols_field_combo,
+                self.x_buffer_field_combo, self.y_buffer_field_combo]
+
+    def update_field_combos(self):
+        """切换图层时更新字段下拉框"""
+        layer = self.layer_combo.currentData()
+        for combo in self.field_combos():
+            combo.setLayer(layer)
+
+    def toggle_batch(self, state):
+        """切换批量模式"""
+        self.batch_widget.setVisible(state)
+        self.adjustSize()
+
+    def toggle_plot_size(self, state):
+        """切换固定子地块尺寸模式"""
+        self.plot_size_widget.setVisible(state)
+        if state:
+            self.quad_check.setChecked(False)
+        self.adjustSize()
+
+    def toggle_quad(self, state):
+        """切换四边形模式(与固定子地块尺寸互斥)"""
+        if state:
+            self.plot_size_check.setChecked(False)
+
+    def get_plot_size(self):
+        """固定子地块尺寸(宽度, 长度), 未启用时为None; 输入无效时抛出ValueError"""
+        if not self.plot_size_check.isChecked():
+            return None
+        return parse_lengths(self.plot_width_edit.text()), parse_lengths(self.plot_length_edit.text())
+
+    def toggle_output(self, state):
+        """切换输出文件路径的可用状态"""
+        self.output_edit.setEnabled(state)
+        self.output_button.setEnabled(state)
+    
+    def select_output(self):
+        """选择输出文件路径"""
+        path, selected = QFileDialog.getSaveFileName(
+            self, lang["savefileDialogTitle"], "", lang["savefileDialogTypes"]
+        )
+        if path:
+            # 未输入支持的扩展名时, 按所选文件类型补全
+            if os.path.splitext(path)[1].lower() not in api.OUTPUT_DRIVERS:
+                path += next((ext for ext in api.OUTPUT_DRIVERS if ext in selected), '.shp')
+            self.output_edit.setText(path)
+    
+    def select_fieldbook(self):
+        """选择田间记录本文件"""
+        path, _ = QFileDialog.getOpenFileName(
+            self, lang["fieldBookDialogTitle"], "", lang["fieldBookDialogTypes"]
+        )
+        if path:
+            self.fieldbook_edit.setText(path)
+    
+    def get_context(self):
+        """当前图层的几何上下文, 图层切换或被修改后重新读取"""
+        layer = self.layer_combo.currentData()
+        if layer is None:
+            raise FieldShapeError("errNotAPolygon")
+        if self.context is None or not self.context.matches(layer):
+            if self.context is not None:
+                self.context.close()
+            self.context = GeometryContext(layer)
+        return self.context
+    
+    def validate_input(self, geometry_only=False):
+        """验证输入参数"""
+        try:
+            self.get_context().validate(self.batch_check.isChecked(), geometry_only,
+                                        self.id_field_combo.currentField())
+            
+            # 如果是仅验证几何，直接返回
+            if geometry_only:
+                return True
+            
+            # 检查行数和列数
+            api.validate_grid(int(self.rows_edit.text()), int(self.cols_edit.text()),
+                              self.get_plot_size(), self.quad_check.isChecked())
+            
+            return True
+            
+        except FieldShapeError as e:
+            QMessageBox.warning(self, lang["err"], e.message(lang))
+            return False
+        except Exception as e:
+            QMessageBox.warning(self, lang["err"], f"{lang['errException']}: {str(e)}")
+            return False
+    
+    def calculate_rotation_angle(self):
+        """计算将边界框长边转为水平所需的旋转角度"""
+        if not self.validate_input(geometry_only=True):
+            return None
+        
+        # 由缓存的最小面积外接矩形计算角度（QGIS使用度）
+        try:
+            self.rotation_angle = self.get_context().rotation_angle()
+        except FieldShapeError:
+            return None
+        
+        return self.rotation_angle
+    
+    def focus_and_rotate(self):
+        """聚焦到选定图层并旋转视图使长边水平"""
+        angle = self.calculate_rotation_angle()
+        if angle is None:
+            QMessageBox.warning(self, lang["err"], lang['errRot'])
+            return
+        
+        # 获取当前活动地图画布
+        canvas = iface.mapCanvas()
+        
+        # 获取图层范围
+        layer = self.layer_combo.currentData()
+        extent = layer.extent()
+        
+        # 设置旋转角度
+        canvas.setRotation(angle)
+        
+        # 缩放至图层范围
+        canvas.setExtent(extent)
+        canvas.refresh()
+    
+    def auto_fit(self):
+        """由DOM的降采样影像识别子地块的周期和间距, 填入行列数和间距
+        
+        在外接矩形的旋转框架(与聚焦时的旋转方向一致)中计算, 批量模式下使用第一个区块;
+        网格从矩形的角点开始, 边界与子地块之间留有空白时提示
+        """
+        if not self.validate_input(geometry_only=True):
+            return
+        
+        try:
+            context = self.get_context()
+            fit = api.auto_fit(context.min_area_rectangle(), context.layer.crs(),
+                               self.dom_combo.currentData(),
+                               QgsProject.instance().transformContext())
+        except FieldShapeError as e:
+            QMessageBox.warning(self, lang["err"], e.message(lang))
+            return
+        except Exception as e:
+            QMessageBox.warning(self, lang["err"], f"{lang['errException']}: {str(e)}")
+            return
+        
+        # 修改输入框会触发实时预览
+        self.rows_edit.setText(str(fit.rows))
+        self.cols_edit.setText(str(fit.cols))
+        self.x_buffer_edit.setText(f"{fit.x_buffer:.3f}")
+        self.y_buffer_edit.setText(f"{fit.y_buffer:.3f}")
+        iface.messageBar().pushInfo(lang['success'], lang['autoFitDone'].format(**fit._asdict()))
+        margins = loose_margins(fit)
+        if margins is not None:
+            iface.messageBar().pushWarning(lang['autoFitBtn'], lang['autoFitMargin'].format(*margins))
+    
+    def schedule_preview(self):
+        """预览窗口打开时, 在输入停止PREVIEW_DELAY毫秒后更新预览"""
+        if self.preview_canvas is not None and self.preview_canvas.isVisible():
+            self.preview_timer.start()
+    
+    def get_preview_blocks(self):
+        """预览用的区块(BlockSpec), 按几何上下文和批量设置缓存
+        
+        未从属性字段读取的参数为None, 使用对话框中的数值;
+        四边形模式的区块使用多边形自身的顶点, 因此也作为缓存的键
+        """
+        context = self.get_context()
+        batch = self.batch_check.isChecked()
+        quad = self.quad_check.isChecked()
+        fields = [combo.currentField() or None for combo in self.field_combos()] if batch else []
+        key = (context, batch, quad, tuple(fields))
+        if key != self.preview_key:
+            context.validate(batch, id_field=fields[0] if batch else None)
+            self.preview_blocks = context.blocks(None, None, None, None, *fields, quad=quad)
+            for block in self.preview_blocks:
+                if block.rect is None:
+                    raise FieldShapeError("errMinRect", block=block.block_id if batch else None)
+            self.preview_key = key
+        return self.preview_blocks
+    
+    def get_preview_layer(self, layer):
+        """持久的预览图层, 仅在坐标系改变时重新创建"""
+        if self.preview_layer is None or self.preview_layer.crs() != layer.crs():
+            self.preview_layer = QgsVectorLayer("Polygon", "preview", "memory")
+            self.preview_layer.setCrs(layer.crs())
+            self.preview_layer.renderer().setSymbol(QgsFillSymbol.createSimple({
+                'color': '0,255,0,100',  # 半透明绿色
+                'outline_color': 'black',
+                'outline_width': '0.5'
+            }))
+            self.preview_fids = []
+            self.preview_source_id = None
+        return self.preview_layer
+    
+    def preview(self):
+        """打开预览窗口, 之后修改参数时实时更新"""
+        if not self.validate_input():
+            return
+        
+        # 创建预览画布（如果不存在）
+        if not self.preview_canvas:
+            self.preview_canvas = QgsMapCanvas()
+            self.preview_canvas.setWindowTitle(lang["prevWinTitle"])
+            self.preview_canvas.setCanvasColor(Qt.white)
+            # 设置为独立窗口，可关闭
+            self.preview_canvas.setWindowFlags(Qt.Window)
+        
+        self.preview_canvas.showNormal()
+        self.update_preview(fit=True)
+    
+    def update_preview(self, fit=False):
+        """更新预览图层的子地块
+        
+        子地块数不变时原地修改几何(changeGeometryValues), 行列数改变时才重新添加要素
+        """
+        if self.preview_canvas is None or not self.preview_canvas.isVisible():
+            return
+        
+        layer = self.layer_combo.currentData()
+        if layer is None:
+            return
+        
+        try:
+            rows = int(self.rows_edit.text())
+            cols = int(self.cols_edit.text())
+            x_buffer = float(self.x_buffer_edit.text())
+            y_buffer = float(self.y_buffer_edit.text())
+            plot_size = self.get_plot_size()
+            quad = self.quad_check.isChecked()
+        except ValueError:
+            return  # 输入未完成时保留上一次的预览
+        
+        # 由缓存的外接矩形直接计算格网(只计算格网坐标), 子地块数不超过上限时才生成角点
+        try:
+            api.validate_grid(rows, cols, plot_size, quad)
+            grids = []
+            for block in self.get_preview_blocks():
+                grids.append(divide_block(block._replace(
+                    rows=rows if block.rows is None else block.rows,
+                    cols=cols if block.cols is None else block.cols,
+                    x_buffer=x_buffer if block.x_buffer is None else block.x_buffer,
+                    y_buffer=y_buffer if block.y_buffer is None else block.y_buffer,
+                    plot_size=plot_size, quad=quad)).grid)
+            count = sum(len(grid) for grid in grids)
+            if count > LARGE_GRID:
+                raise FieldShapeError("errPrevLarge", str(count))
+            cells = np.concatenate([grid.cells() for grid in grids])
+        except FieldShapeError as e:
+            self.preview_canvas.setWindowTitle(f"{lang['prevWinTitle']} - {e.message(lang)}")
+            return
+        title = lang["prevWinTitle"]
+        if len(grids) == 1 and grids[0].layout is not None:
+            title += " - " + lang['plotSizeFit'].format(**grids[0].layout._asdict())
+        self.preview_canvas.setWindowTitle(title)
+        
+        preview_layer = self.get_preview_layer(layer)
+        provider = preview_layer.dataProvider()
+        geometries = api.cells_to_geometries(cells)
+        if len(geometries) == len(self.preview_fids):
+            provider.changeGeometryValues(dict(zip(self.preview_fids, geometries)))
+        else:
+            provider.truncate()
+            features = []
+            for geom in geometries:
+                feat = QgsFeature()
+                feat.setGeometry(geom)
+                features.append(feat)
+            _, added = provider.addFeatures(features)
+            self.preview_fids = [feat.id() for feat in added]
+        preview_layer.updateExtents()
+        
+        # 切换输入图层时重新设置画布
+        if layer.id() != self.preview_source_id:
+            self.preview_canvas.setDestinationCrs(layer.crs())
+            self.preview_canvas.setLayers([preview_layer, layer])
+            self.preview_source_id = layer.id()
+            fit = True
+        
+        if fit:
+            extent = preview_layer.extent()
+            if extent.isNull():
+                self.preview_canvas.setWindowTitle(f"{lang['prevWinTitle']} - {lang['errPrevRange']}")
+                return
+            if not layer.extent().isNull():
+                extent.combineExtentWith(layer.extent())
+            self.preview_canvas.setExtent(extent)
+        preview_layer.triggerRepaint()
+
+    
+    def run(self):
+        """执行分割操作"""
+        if not self.validate_input():
+            return
+        
+        # 获取参数
+        layer = self.layer_combo.currentData()
+        rows = int(self.rows_edit.text())
+        cols = int(self.cols_edit.text())
+        x_buffer = float(self.x_buffer_edit.text())
+        y_buffer = float(self.y_buffer_edit.text())
+        plot_size = self.get_plot_size()
+        quad = self.quad_check.isChecked()
+        
+        # 确定输出CRS
+        dom_layer = self.dom_combo.currentData()
+        target_crs = dom_layer.crs() if dom_layer else layer.crs()
+        
+        # 阶段计时: 主线程的准备阶段在此记录, 后台阶段由任务记录, 任务结束时输出
+        trace = RunTrace("subplot_division", enabled=self.trace_check.isChecked(),
+                         log=api.log_message)
+        
+        try:
+            api.check_target_crs(target_crs)
+            
+            # 主线程中由几何上下文生成区块(复用已读取的要素和外接矩形),
+            # 分割/统计/写出在后台任务中进行
+            batch = self.batch_check.isChecked()
+            id_field = self.id_field_combo.currentField()
+            with trace.stage("blocks") as stage:
+                context = self.get_context()
+                blocks = context.blocks(
+                    rows, cols, x_buffer, y_buffer,
+                    id_field=id_field,
+                    rows_field=self.rows_field_combo.currentField(),
+                    cols_field=self.cols_field_combo.currentField(),
+                    x_buffer_field=self.x_buffer_field_combo.currentField(),
+                    y_buffer_field=self.y_buffer_field_combo.currentField(),
+                    plot_size=plot_size,
+                    quad=quad,
+                )
+                stage.count = len(blocks)
+            fields = api.subplot_fields(context, batch, id_field)
+            
+            # 分区统计(分块读取DOM), 结果作为属性写入
+            zonal = None
+            if self.stats_check.isChecked():
+                with trace.stage("zonal_config"):
+                    zonal = api.zonal_config(
+                        layer.crs(), dom_layer,
+                        transform_context=QgsProject.instance().transformContext())
+            
+            # 植被覆盖度: 阈值在此由DOM金字塔计算一次, 后台逐瓦片分类计数
+            cover = None
+            if self.cover_check.isChecked():
+                with trace.stage("cover_threshold"):
+                    cover = api.cover_config(
+                        layer.crs(), dom_layer, blocks,
+                        transform_context=QgsProject.instance().transformContext())
+            
+            # 田间记录本在此逐行读取, 行数在写出前与子地块数核对
+            fieldbook = None
+            if self.fieldbook_edit.text().strip():
+                with trace.stage("fieldbook_read") as stage:
+                    fieldbook = api.fieldbook_config(
+                        self.fieldbook_edit.text().strip(), fields,
+                        order=self.order_combo.currentData(),
+                        serpentine=self.serpentine_check.isChecked(),
+                        start=self.start_combo.currentData())
+                    stage.count = len(fieldbook.book)
+            
+            # 写出前估算输出大小, 超过格式限制或磁盘空间时终止
+            output_path = self.output_edit.text() or None
+            count = api.count_subplots(blocks)
+            n_fields = (fields.count() + (len(zonal.names) if zonal else 0)
+                        + (len(cover.names) if cover else 0)
+                        + (len(fieldbook.names) if fieldbook else 0))
+            size = api.check_output_size(count, n_fields, output_path)
+        
+        except FieldShapeError as e:
+            trace.finish()
+            QMessageBox.warning(self, lang["err"], e.message(lang))
+            return
+        
+        # 记录本行数与子地块数不一致时, 在写出之前确认
+        if fieldbook is not None and len(fieldbook.book) != count:
+            answer = QMessageBox.question(
+                self, lang['windowTitle'],
+                lang['fieldBookCount'].format(rows=len(fieldbook.book), count=count))
+            if answer != QMessageBox.Yes:
+                trace.finish()
+                return
+        
+        # 大规模网格需要确认
+        if count > LARGE_GRID:
+            answer = QMessageBox.question(
+                self, lang['windowTitle'],
+                lang['largeGrid'].format(count=count, size=api.format_size(size)))
+            if answer != QMessageBox.Yes:
+                trace.finish()
+                return
+        
+        # 子地块按格网点批量转换到输出坐标系(DOM的坐标系)
+        transform = api.crs_transform(layer.crs(), target_crs,
+                                      QgsProject.instance().transformContext())
+        
+        # 逐批生成要素, 直接写入文件; 未指定输出时写入临时图层
+        trace.info.update(layer=layer.name(), batch=batch, subplots=count,
+                          zonal=zonal is not None, cover=cover is not None)
+        task = SubplotDivisionTask(
+            lang['taskDesc'], blocks, fields, target_crs,
+            output_path=output_path,
+            zonal=zonal,
+            cover=cover,
+            fieldbook=fieldbook,
+            transform=transform,
+            transform_context=QgsProject.instance().transformContext(),
+            on_finished=report_task,
+            trace=trace,
+        )
+        start_task(task)
+        iface.messageBar().pushInfo(lang['success'], lang['taskStarted'])
+        
+        # 固定尺寸模式下报告排列结果和剩余边距(单个区块)
+        if plot_size is not None and len(blocks) == 1 and blocks[0].rect is not None:
+            block = blocks[0]
+            fit = plot_layout(block.rect, *plot_size, block.x_buffer, block.y_buffer,
+                              block.rows or None, block.cols or None)[-1]
+            iface.messageBar().pushInfo(lang['success'],
+                                        lang['plotSizeFit'].format(**fit._asdict()))
+        
+        self.accept()
+
+
+def report_task(task, layer, exception):
+    """后台任务结束后(主线程)显示结果"""
+    if exception is not None:
+        message = exception.message(lang) if isinstance(exception, FieldShapeError) else str(exception)
+        iface.messageBar().pushCritical(lang["err"], message)
+    elif layer is None:
+        iface.messageBar().pushWarning(lang["err"], lang['taskCanceled'])
+    elif task.output_path:
+        iface.messageBar().pushSuccess(lang['success'], f"{lang['sucSave']}: {task.output_path}")
+    else:
+        iface.messageBar().pushSuccess(lang['success'], lang['sucSaveTemp'])
+
+
+
+def show_dialog():
+    """打开子地块分割对话框(模态), 返回对话框"""
+    dialog = SubplotDivisionDialog()
+    dialog.exec_()
+    return dialog
@@ -0,0 +1,35 @@
+# File: errors
+# Author: Haozhou Wang
+# Organization: UTOkyo FieldPhenomics Lab
+# Description:
+#     Exceptions raised by FIELDimagePy-QGIS tools instead of message boxes
+# Dependencies:
+#     - Python 3.x
+# License: MIT
+
+
+class FieldShapeError(ValueError):
+
+    """
+    输入验证或处理失败
+
+    key为翻译字典中的键, 界面中用message(lang)按当前语言显示,
+    str(e)为英文信息, 用于命令行和Processing日志
+    """
+
+    def __init__(self, key, detail="", block=None):
+        self.key = key
+        self.detail = detail
+        self.block = block
+        # 翻译字典在首次出错时才加载
+        from .i18n import i18n_en
+        super().__init__(self.message(i18n_en))
+
+    def message(self, lang):
+        """按指定语言生成错误信息"""
+        text = lang[self.key]
+        if self.detail:
+            text = f"{text}: {self.detail}"
+        if self.block is not None:
+            text = f"{lang['errBlock']} {self.block}: {text}"
+        return text
@@ -0,0 +1,209 @@
+# File: fieldbook
+# Author: Haozhou Wang
+# Organization: UTOkyo FieldPhenomics Lab
+# Description:
+#     Field-book join: read CSV / XLSX field books row by row and map their records
+#     to subplots by planting order (row / column major, serpentine, start corner)
+# Dependencies:
+#     - Python 3.x
+#     - NumPy
+#     - GDAL (osgeo, shipped with QGIS, only for XLSX / ODS)
+# License: MIT
+# Usage:
+#     book = read_fieldbook("fieldbook.xlsx")
+#     positions = fieldbook_positions([grid.shape], by="row", serpentine=True)
+#     records = book.take(positions)   # 与子地块id顺序一致
+
+import csv
+import os
+
+import numpy as np
+
+from .errors import FieldShapeError
+
+# 记录本中的排列方向和起始角(以网格的行列号表示, 第1行第1列为矩形第0个顶点)
+ORDERS = ("row", "column")
+START_CORNERS = ("row1_col1", "row1_colN", "rowN_col1", "rowN_colN")
+
+CSV_EXTENSIONS = (".csv", ".txt", ".tsv")
+OGR_EXTENSIONS = (".xlsx", ".xls", ".ods")
+
+INT32_MAX = 2 ** 31 - 1
+
+
+def plot_order(rows, cols, by="row", serpentine=False, start="row1_col1"):
+    """每个子地块(行, 列)在记录本中的顺序号(rows, cols), 从0开始
+
+    by为"row"时先沿一行依次排列各列, 再换行; "column"时先沿一列排列各行.
+    serpentine为蛇形(往返)排列, 偶数行(列)反向; start为第一个子地块所在的角
+    """
+    if by not in ORDERS or start not in START_CORNERS:
+        raise ValueError(f"Unknown plot order: {by}, {start}")
+    r, c = np.indices((rows, cols))
+    if start.startswith("rowN"):
+        r = rows - 1 - r
+    if start.endswith("colN"):
+        c = cols - 1 - c
+
+    major, minor, n = (r, c, cols) if by == "row" else (c, r, rows)
+    if serpentine:
+        minor = np.where(major % 2 == 1, n - 1 - minor, minor)
+    return major * n + minor
+
+
+def fieldbook_positions(shapes, by="row", serpentine=False, start="row1_col1"):
+    """各子地块(按输出id顺序)对应的记录本行号(N,)
+
+    shapes为各区块网格的(rows, cols); 多个区块按顺序接续编号, 每个区块内使用相同的排列方式.
+    子地块id在区块内按行优先排列, 因此直接展平顺序号数组
+    """
+    positions = []
+    offset = 0
+    for rows, cols in shapes:
+        positions.append(plot_order(rows, cols, by, serpentine, start).ravel() + offset)
+        offset += rows * cols
+    return np.concatenate(positions) if positions else np.empty(0, dtype=int)
+
+
+def _convert_column(values):
+    """CSV的文本列转换为整数或浮点数列(全部可转换时), 空字符串为None"""
+    values = [None if v is None or v.strip() == "" else v.strip() for v in values]
+    present = [v for v in values if v is not None]
+    # 前导0的编号(如"007")和带下划线的数字保留为文本
+    if any("_" in v or (len(v) > 1 and v[0] == "0" and v[1].isdigit()) for v in present):
+        return values
+    for cast in (int, float):
+        try:
+            converted = [cast(v) for v in present]
+        except ValueError:
+            continue
+        it = iter(converted)
+        return [None if v is None else next(it) for v in values]
+    return values
+
+
+def _unique_names(names):
+    """列名去空白, 空列名和重复列名加序号"""
+    out = []
+    seen = set()
+    for i, name in enumerate(names):
+        name = (str(name).strip() if name is not None else "") or f"field{i + 1}"
+        base, k = name, 2
+        while name.lower() in seen:
+            name = f"{base}_{k}"
+            k += 1
+        seen.add(name.lower())
+        out.append(name)
+    return out
+
+
+class FieldBook:
+
+    """田间记录本: 列名和按记录本顺序排列的记录(每条记录为一个元组)"""
+
+    def __init__(self, names, records):
+        self.names = _unique_names(names)
+        self.records = records
+
+    def __len__(self):
+        return len(self.records)
+
+    def column_types(self):
+        """各列的类型: "int", "int64", "float"或"str"(空列为"str")"""
+        types = []
+        for k in range(len(self.names)):
+            values = [r[k] for r in self.records if r[k] is not None]
+            if values and all(isinstance(v, int) and not isinstance(v, bool) for v in values):
+                big = max(abs(v) for v in values) > INT32_MAX
+                types.append("int64" if big else "int")
+            elif values and all(isinstance(v, (int, float)) for v in values):
+                types.append("float")
+            else:
+                types.append("str")
+        return types
+
+    def field_names(self, reserved=()):
+        """输出字段名, 与已有字段(如id, row, col)重名时加前缀fb_"""
+        reserved = {name.lower() for name in reserved}
+        return [f"fb_{name}" if name.lower() in reserved else name for name in self.names]
+
+    def take(self, positions):
+        """按行号取出记录, 返回列表; 超出记录本范围的行号为全空记录"""
+        empty = (None,) * len(self.names)
+        n = len(self.records)
+        return [self.records[p] if 0 <= p < n else empty for p in positions]
+
+
+def read_csv(path, encoding="utf-8-sig", delimiter=None):
+    """逐行读取CSV记录本, 第一行为列名; delimiter为空时由文件开头自动识别
+
+    各列全部为整数(或数值)时转换为int(或float)
+    """
+    with open(path, newline="", encoding=encoding) as f:
+        if delimiter is None:
+            sample = f.read(65536)
+            f.seek(0)
+            try:
+                delimiter = csv.Sniffer().sniff(sample, delimiters=",;\t|").delimiter
+            except csv.Error:
+                delimiter = ","
+        reader = csv.reader(f, delimiter=delimiter)
+        names = next(reader, None)
+        if names is None:
+            raise FieldShapeError("errFieldBook", path)
+        width = len(names)
+        records = []
+        for row in reader:
+            if not any(v.strip() for v in row):
+                continue  # 跳过空行
+            row = row[:width] + [""] * (width - len(row))
+            records.append(row)
+
+    columns = [_convert_column([r[k] for r in records]) for k in range(width)]
+    return FieldBook(names, list(zip(*columns)) if records else [])
+
+
+def read_ogr(path, sheet=None):
+    """用OGR逐行读取XLSX / XLS / ODS记录本, 第一行为列名, 保留单元格的类型
+
+    sheet为工作表名或序号(默认第一个)
+    """
+    from osgeo import gdal
+
+    dataset = gdal.OpenEx(path, gdal.OF_VECTOR, open_options=["HEADERS=FORCE"])
+    if dataset is None:
+        raise FieldShapeError("errFieldBook", path)
+    layer = (dataset.GetLayerByName(sheet) if isinstance(sheet, str)
+             else dataset.GetLayer(sheet or 0))
+    if layer is None:
+        raise FieldShapeError("errFieldBook", f"{path}: {sheet}")
+
+    definition = layer.GetLayerDefn()
+    names = [definition.GetFieldDefn(k).GetName() for k in range(definition.GetFieldCount())]
+    records = []
+    for feature in layer:
+        record = tuple(feature.GetField(k) if feature.IsFieldSetAndNotNull(k) else None
+                       for k in range(len(names)))
+        if any(v is not None and v != "" for v in record):
+            records.append(record)
+    dataset = None
+    return FieldBook(names, records)
+
+
+def read_fieldbook(path, sheet=None, encoding="utf-8-sig"):
+    """按扩展名读取CSV或XLSX(XLS, ODS)记录本, 返回FieldBook"""
+    ext = os.path.splitext(path)[1].lower()
+    try:
+        if ext in CSV_EXTENSIONS:
+            return read_csv(path, encoding, "\t" if ext == ".tsv" else None)
+        if ext in OGR_EXTENSIONS:
+            return read_ogr(path, sheet)
+    except (OSError, UnicodeDecodeError, csv.Error) as e:
+        raise FieldShapeError("errFieldBook", str(e)) from e
+    raise FieldShapeError("errFieldBook", path)
+
+
+def check_count(book, count):
+    """记录数与子地块数不一致时报错(写出之前调用)"""
+    if len(book) != count:
+        raise FieldShapeError("errFieldBookCount", f"{len(book)} / {count}")
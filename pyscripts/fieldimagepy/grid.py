@@ -0,0 +1,489 @@
+# File: grid
+# Author: Haozhou Wang
+# Organization: UTOkyo FieldPhenomics Lab
+# Description:
+#     Vectorized subplot grid engine (pure NumPy, no Qt / QGIS)
+# Dependencies:
+#     - Python 3.x
+#     - NumPy
+# License: MIT
+
+from collections import namedtuple
+
+import numpy as np
+
+from .errors import FieldShapeError
+
+# 固定尺寸排列时剩余边距的位置
+ALIGNMENTS = ("start", "center", "end")
+
+# 固定尺寸排列的结果
+# AxisLayout: 一个方向上能容纳的子地块数, 指定(或按尺寸数组)的子地块数, 占用长度, 剩余边距和起点偏移
+# LayoutFit: 行数, 列数, x / y方向的剩余边距(米)及各方向的详细结果
+AxisLayout = namedtuple("AxisLayout", ["count", "requested", "used", "margin", "offset"])
+LayoutFit = namedtuple("LayoutFit", ["rows", "cols", "x_margin", "y_margin", "x", "y"])
+
+
+def _axis_positions(sizes, gaps):
+    """由子地块尺寸和间距计算一个方向上的格网坐标
+
+    返回去重后的格网坐标(ords)以及每个子地块起止坐标在ords中的索引(n, 2)
+    """
+    sizes = np.asarray(sizes, dtype=float)
+    gaps = np.asarray(gaps, dtype=float)
+
+    # [size0, gap0, size1, gap1, ..., size_n-1] 累加得到所有起止位置
+    steps = np.empty(2 * len(sizes) - 1)
+    steps[0::2] = sizes
+    steps[1::2] = gaps
+    bounds = np.concatenate([[0.0], np.cumsum(steps)])
+
+    # 间距为0时相邻子地块共享边, 只保留一个格网坐标
+    is_new = np.ones(len(bounds), dtype=bool)
+    is_new[1:] = bounds[1:] != bounds[:-1]
+    ords = bounds[is_new]
+    index = (np.cumsum(is_new) - 1).reshape(-1, 2)
+
+    return ords, index
+
+
+def _even_sizes(total, n, buffer):
+    """均分总长度, 返回n个子地块尺寸和n-1个间距"""
+    size = (total - (n - 1) * buffer) / n
+    if size <= 0:
+        raise FieldShapeError("errNegative")
+    return np.full(n, size), np.full(n - 1, float(buffer))
+
+
+def parse_lengths(text):
+    """解析尺寸文本: 单个数值返回float, 列表返回数组
+
+    以逗号或空格分隔, n*value(或value*n)表示重复, 如"2, 10*1.5, 2"为两端较宽的12个子地块
+    """
+    values = []
+    for item in str(text).replace(",", " ").split():
+        if "*" in item:
+            n, value = item.split("*", 1)
+            if not n.strip().isdigit():
+                n, value = value, n
+            values.extend([float(value)] * int(n))
+        else:
+            values.append(float(item))
+    if not values:
+        raise ValueError(f"No lengths in {text!r}")
+    if len(values) == 1 and "*" not in str(text):
+        return values[0]
+    return np.array(values)
+
+
+def _fixed_axis(total, sizes, gaps, count=None, align="center"):
+    """按固定尺寸在总长total内排列一个方向的子地块
+
+    sizes为单个尺寸或每个子地块的尺寸数组, gaps为单个间距或n-1个间距的数组;
+    单个尺寸且count为空时排列尽可能多的子地块. 位置由尺寸和间距的累加和一次计算,
+    只保留终点不超出总长的子地块. 返回(尺寸, 间距, AxisLayout)
+    """
+    sizes = np.atleast_1d(np.asarray(sizes, dtype=float))
+    gaps = np.atleast_1d(np.asarray(gaps, dtype=float))
+    if align not in ALIGNMENTS:
+        raise ValueError(f"Unknown alignment: {align}")
+    if len(sizes) == 0 or (sizes <= 0).any():
+        raise FieldShapeError("errNegative")
+
+    if len(sizes) == 1:
+        if count is None and len(gaps) > 1:
+            count = len(gaps) + 1
+        if count is None:
+            if sizes[0] + gaps[0] <= 0:
+                raise FieldShapeError("errNegative")
+            count = int(np.floor((total + gaps[0]) / (sizes[0] + gaps[0]) + 1e-9))
+        sizes = np.full(max(count, 0), sizes[0])
+    elif count is not None and count != len(sizes):
+        raise FieldShapeError("errPlotSizes", f"{len(sizes)} / {count}")
+
+    if len(gaps) == 1:
+        gaps = np.full(max(len(sizes) - 1, 0), gaps[0])
+    elif len(gaps) != len(sizes) - 1:
+        raise FieldShapeError("errPlotSizes", f"{len(gaps)} / {len(sizes) - 1}")
+
+    # 各子地块的终点: 尺寸累加和 + 之前的间距累加和
+    ends = np.cumsum(sizes) + np.concatenate([[0.0], np.cumsum(gaps)])
+    n = int(np.searchsorted(ends, total * (1 + 1e-9), side="right"))
+    if n == 0:
+        raise FieldShapeError("errPlotFit")
+
+    used = float(ends[n - 1])
+    margin = float(total - used)
+    offset = {"start": 0.0, "center": margin / 2, "end": margin}[align]
+    return sizes[:n], gaps[:n - 1], AxisLayout(n, len(sizes), used, margin, offset)
+
+
+def plot_layout(rect, plot_width, plot_length, x_buffer=0.0, y_buffer=0.0, rows=None,
+                cols=None, align="center"):
+    """按固定子地块尺寸(米)在矩形内排列, 返回(x尺寸, x间距, y尺寸, y间距, LayoutFit)
+
+    plot_width为列方向(矩形x边)的子地块宽度, plot_length为行方向(y边)的长度,
+    可为单个数值或每列/每行的尺寸数组(如较宽的边行); x_buffer / y_buffer可为单个数值或间距数组.
+    rows / cols为空时排列尽可能多的子地块; 指定时只保留能容纳的部分.
+    剩余边距按align(start, center, end)分配
+    """
+    rect = np.asarray(rect, dtype=float)[:4]
+    total_width = np.hypot(*(rect[1] - rect[0]))
+    total_height = np.hypot(*(rect[3] - rect[0]))
+
+    x_sizes, x_gaps, x = _fixed_axis(total_width, plot_width, x_buffer, cols, align)
+    y_sizes, y_gaps, y = _fixed_axis(total_height, plot_length, y_buffer, rows, align)
+    return x_sizes, x_gaps, y_sizes, y_gaps, LayoutFit(y.count, x.count, x.margin, y.margin, x, y)
+
+
+def _locate_axis(values, ords, index):
+    """坐标所在的子地块序号(一个方向), 位于间距或范围外时为-1
+
+    子地块重叠(负间距)时属于后一个
+    """
+    starts = ords[index[:, 0]]
+    ends = ords[index[:, 1]]
+    i = np.searchsorted(starts, values, side="right") - 1
+    inside = (i >= 0) & (values <= ends[np.maximum(i, 0)])
+    return np.where(inside, i, -1)
+
+
+def _alley_margins(ords, index):
+    """每个子地块两侧的半间距(n, 2), 边缘一侧取相邻间距; 重叠(负间距)时为0"""
+    gaps = np.maximum(ords[index[1:, 0]] - ords[index[:-1, 1]], 0) / 2
+    if len(gaps) == 0:
+        return np.zeros((1, 2))
+    return np.column_stack([np.concatenate([gaps[:1], gaps]),
+                            np.concatenate([gaps, gaps[-1:]])])
+
+
+class SubplotGrid:
+
+    """
+    仿射子地块网格
+
+    origin为矩形第0个顶点, x_axis / y_axis为单位向量,
+    列沿x_axis(矩形底边)排列, 行沿y_axis(矩形左边)排列
+
+    (rows+1)×(cols+1)的格网点只计算一次, 子地块四个角点直接从格网中索引,
+    有间距时每个方向的格网坐标为2n个
+    """
+
+    def __init__(self, origin, x_axis, y_axis, x_sizes, x_gaps, y_sizes, y_gaps):
+        self.origin = np.asarray(origin, dtype=float)
+        self.x_axis = np.asarray(x_axis, dtype=float)
+        self.y_axis = np.asarray(y_axis, dtype=float)
+
+        self.x_sizes = np.asarray(x_sizes, dtype=float)
+        self.y_sizes = np.asarray(y_sizes, dtype=float)
+
+        if len(self.x_sizes) == 0 or len(self.y_sizes) == 0:
+            raise FieldShapeError("errNoZero")
+        if (self.x_sizes <= 0).any() or (self.y_sizes <= 0).any():
+            raise FieldShapeError("errNegative")
+
+        self.x_ords, self.x_index = _axis_positions(self.x_sizes, x_gaps)
+        self.y_ords, self.y_index = _axis_positions(self.y_sizes, y_gaps)
+        # 固定尺寸排列的结果(LayoutFit), 均分网格为None
+        self.layout = None
+
+    @classmethod
+    def from_rectangle(cls, rect, rows, cols, x_buffer=0.0, y_buffer=0.0):
+        """从矩形的四个顶点(4, 2)创建均分网格, 顶点顺序与get_min_area_rectangle一致"""
+        rect = np.asarray(rect, dtype=float)[:4]
+        if rows <= 0 or cols <= 0:
+            raise FieldShapeError("errNoZero")
+
+        bottom = rect[1] - rect[0]
+        left = rect[3] - rect[0]
+        total_width = np.hypot(*bottom)
+        total_height = np.hypot(*left)
+
+        x_sizes, x_gaps = _even_sizes(total_width, cols, x_buffer)
+        y_sizes, y_gaps = _even_sizes(total_height, rows, y_buffer)
+
+        return cls(rect[0], bottom / total_width, left / total_height,
+                   x_sizes, x_gaps, y_sizes, y_gaps)
+
+    @classmethod
+    def from_plot_size(cls, rect, plot_width, plot_length, x_buffer=0.0, y_buffer=0.0,
+                       rows=None, cols=None, align="center"):
+        """按固定子地块尺寸创建网格, 参数见plot_layout(); 排列结果保存在layout属性中"""
+        rect = np.asarray(rect, dtype=float)[:4]
+        x_sizes, x_gaps, y_sizes, y_gaps, fit = plot_layout(
+            rect, plot_width, plot_length, x_buffer, y_buffer, rows, cols, align)
+
+        bottom = rect[1] - rect[0]
+        left = rect[3] - rect[0]
+        x_axis = bottom / np.hypot(*bottom)
+        y_axis = left / np.hypot(*left)
+        origin = rect[0] + fit.x.offset * x_axis + fit.y.offset * y_axis
+
+        grid = cls(origin, x_axis, y_axis, x_sizes, x_gaps, y_sizes, y_gaps)
+        grid.layout = fit
+        return grid
+
+    @property
+    def rows(self):
+        return len(self.y_sizes)
+
+    @property
+    def cols(self):
+        return len(self.x_sizes)
+
+    @property
+    def shape(self):
+        return self.rows, self.cols
+
+    def __len__(self):
+        return self.rows * self.cols
+
+    def lattice(self, y_range=None):
+        """计算格网点坐标, 形状为(len(y_ords), len(x_ords), 2)
+
+        y_range=(lo, hi)时只计算第lo到hi-1行格网点
+        """
+        y_ords = self.y_ords if y_range is None else self.y_ords[y_range[0]:y_range[1]]
+        return self._to_world(self.x_ords[None, :], y_ords[:, None])
+
+    def _to_world(self, u, v):
+        """网格坐标(沿x_axis和y_axis的距离, 可广播)转换为世界坐标(..., 2)"""
+        u = np.asarray(u, dtype=float)[..., None]
+        v = np.asarray(v, dtype=float)[..., None]
+        return self.origin + u * self.x_axis + v * self.y_axis
+
+    def _to_grid(self, points):
+        """世界坐标(M, 2)转换为网格坐标(u, v), 逆仿射变换"""
+        basis = np.column_stack([self.x_axis, self.y_axis])
+        return np.linalg.solve(basis, (points - self.origin).T)
+
+    def indices(self):
+        """子地块的行号和列号(从0开始, 按行优先排列)"""
+        row_idx = np.repeat(np.arange(self.rows), self.cols)
+        col_idx = np.tile(np.arange(self.cols), self.rows)
+        return row_idx, col_idx
+
+    def cells(self, lattice=None):
+        """返回所有子地块角点(N, 4, 2)
+
+        角点顺序: 起点, 沿x_axis, 对角, 沿y_axis
+        可传入已变换的格网点(例如坐标转换后)直接组装子地块
+        """
+        if lattice is None:
+            lattice = self.lattice()
+        return self._row_cells(lattice, 0, 0, self.rows)
+
+    def iter_cells(self, chunk_size, transform=None):
+        """按行分批生成(角点(n, 4, 2), 行号, 列号), 每批不超过chunk_size个子地块(至少一行)
+
+        每批只计算所需行的格网点, 内存占用与网格总大小无关;
+        transform(格网点)可在组装前转换格网点坐标, 相邻批次共享的格网点转换结果相同
+        """
+        rows_per_chunk = max(1, chunk_size // self.cols)
+        for r0 in range(0, self.rows, rows_per_chunk):
+            r1 = min(r0 + rows_per_chunk, self.rows)
+            lo = int(self.y_index[r0:r1].min())
+            hi = int(self.y_index[r0:r1].max()) + 1
+
+            lattice = self.lattice((lo, hi))
+            if transform is not None:
+                lattice = transform(lattice)
+
+            row_idx = np.repeat(np.arange(r0, r1), self.cols)
+            col_idx = np.tile(np.arange(self.cols), r1 - r0)
+            yield self._row_cells(lattice, lo, r0, r1), row_idx, col_idx
+
+    def locate(self, points):
+        """点(M, 2)所在子地块的行号, 列号和序号(行优先, 与cells()的顺序一致)
+
+        由逆变换直接计算网格坐标, 不做多边形相交;
+        位于网格外或行列间距内的点, 三者均为-1
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        u, v = self._to_grid(points)
+
+        col = _locate_axis(u, self.x_ords, self.x_index)
+        row = _locate_axis(v, self.y_ords, self.y_index)
+        inside = (row >= 0) & (col >= 0)
+
+        row = np.where(inside, row, -1)
+        col = np.where(inside, col, -1)
+        return row, col, np.where(inside, row * self.cols + col, -1)
+
+    def alley_cells(self):
+        """每个子地块向两侧扩展半个行列间距后的角点(N, 4, 2), 顺序与cells()一致
+
+        与子地块本身之差即为其周围的间距(走道), 可作为土壤基准面的采样区域;
+        没有间距时与cells()相同
+        """
+        x_margin = _alley_margins(self.x_ords, self.x_index)
+        y_margin = _alley_margins(self.y_ords, self.y_index)
+        x0 = self.x_ords[self.x_index[:, 0]] - x_margin[:, 0]
+        x1 = self.x_ords[self.x_index[:, 1]] + x_margin[:, 1]
+        y0 = (self.y_ords[self.y_index[:, 0]] - y_margin[:, 0])[:, None]
+        y1 = (self.y_ords[self.y_index[:, 1]] + y_margin[:, 1])[:, None]
+
+        corners = np.stack([
+            np.stack(np.broadcast_arrays(x0, y0), axis=-1),
+            np.stack(np.broadcast_arrays(x1, y0), axis=-1),
+            np.stack(np.broadcast_arrays(x1, y1), axis=-1),
+            np.stack(np.broadcast_arrays(x0, y1), axis=-1),
+        ], axis=2)  # (rows, cols, 4, 2) 网格坐标
+        return self._to_world(corners[..., 0], corners[..., 1]).reshape(-1, 4, 2)
+
+    def _row_cells(self, lattice, lattice_row, r0, r1):
+        """第r0到r1-1行子地块的角点, lattice从第lattice_row行格网点开始"""
+        y0 = self.y_index[r0:r1, 0][:, None] - lattice_row
+        y1 = self.y_index[r0:r1, 1][:, None] - lattice_row
+        x0 = self.x_index[:, 0][None, :]
+        x1 = self.x_index[:, 1][None, :]
+
+        corners = np.stack([
+            lattice[y0, x0],
+            lattice[y0, x1],
+            lattice[y1, x1],
+            lattice[y1, x0],
+        ], axis=2)  # (rows, cols, 4, 2)
+
+        return corners.reshape(-1, 4, 2)
+
+
+class QuadGrid(SubplotGrid):
+
+    """
+    双线性四边形网格
+
+    quad为四边形的四个顶点(起点, 沿x边, 对角, 沿y边), 网格坐标(u, v)为0~1的参数坐标,
+    世界坐标由四个顶点双线性插值. 参数坐标中的格网线在四边形中仍为直线,
+    因此子地块仍为四边形, 且外侧子地块与四边形边界贴合(梯形, 斜边的区块)
+    """
+
+    def __init__(self, quad, x_sizes, x_gaps, y_sizes, y_gaps):
+        self.quad = np.asarray(quad, dtype=float)[:4]
+        super().__init__(self.quad[0], self.quad[1] - self.quad[0], self.quad[3] - self.quad[0],
+                         x_sizes, x_gaps, y_sizes, y_gaps)
+
+    @classmethod
+    def from_quad(cls, quad, rows, cols, x_buffer=0.0, y_buffer=0.0):
+        """从四边形的四个顶点(4, 2)创建均分的双线性网格, 顶点顺序见order_quad()
+
+        间距(米)按两条对边的平均长度换算为参数坐标, 子地块在参数坐标中均分
+        """
+        quad = np.asarray(quad, dtype=float)[:4]
+        if rows <= 0 or cols <= 0:
+            raise FieldShapeError("errNoZero")
+
+        width = (np.hypot(*(quad[1] - quad[0])) + np.hypot(*(quad[2] - quad[3]))) / 2
+        height = (np.hypot(*(quad[3] - quad[0])) + np.hypot(*(quad[2] - quad[1]))) / 2
+        x_sizes, x_gaps = _even_sizes(1.0, cols, x_buffer / width)
+        y_sizes, y_gaps = _even_sizes(1.0, rows, y_buffer / height)
+        return cls(quad, x_sizes, x_gaps, y_sizes, y_gaps)
+
+    def _to_world(self, u, v):
+        """参数坐标(u, v)的双线性插值"""
+        # (1-u)(1-v)·A + u(1-v)·B + uv·C + (1-u)v·D = A + u·e + v·f + uv·g
+        a = self.quad[0]
+        e, f, g = self.quad[1] - a, self.quad[3] - a, a - self.quad[1] + self.quad[2] - self.quad[3]
+        u = np.asarray(u, dtype=float)[..., None]
+        v = np.asarray(v, dtype=float)[..., None]
+        return a + u * e + v * f + (u * v) * g
+
+    def _to_grid(self, points):
+        """世界坐标(M, 2)的参数坐标(u, v), 双线性插值的解析逆(逐点解v的二次方程)
+
+        凸四边形内的点在单位正方形内有唯一解; 四边形外的点取另一个根或为NaN(无实数解)
+        """
+        a = self.quad[0]
+        e, f, g = self.quad[1] - a, self.quad[3] - a, a - self.quad[1] + self.quad[2] - self.quad[3]
+        h = points - a
+
+        def cross(p, q):
+            return p[..., 0] * q[..., 1] - p[..., 1] * q[..., 0]
+
+        # (h - v·f) × (e + v·g) = 0
+        k2 = -cross(f, g)
+        k1 = cross(h, g) - cross(f, e)
+        k0 = cross(h, e)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            root = np.sqrt(k1 * k1 - 4 * k2 * k0)
+            q = -0.5 * (k1 + np.copysign(root, k1))
+            # 数值稳定的两个根; 平行四边形(k2=0)时退化为一次方程, 第一个根为inf
+            v = np.stack([q / k2, k0 / q])
+            den = e + v[..., None] * g
+            num = h - v[..., None] * f
+            use_x = np.abs(den[..., 0]) >= np.abs(den[..., 1])
+            u = np.where(use_x, num[..., 0] / den[..., 0], num[..., 1] / den[..., 1])
+
+        first = (u[0] >= 0) & (u[0] <= 1) & (v[0] >= 0) & (v[0] <= 1)
+        return np.where(first, u[0], u[1]), np.where(first, v[0], v[1])
+
+
+def order_quad(vertices, rect):
+    """将四边形的顶点(4, 2)排列为与外接矩形rect相同的顺序, 使网格方向与矩形模式一致
+
+    vertices为多边形外环的顶点(按环的顺序, 可闭合), 须为凸四边形.
+    在4个起点和2个方向中选择与矩形对应顶点距离平方和最小的排列
+    """
+    vertices = np.asarray(vertices, dtype=float).reshape(-1, 2)
+    if len(vertices) > 1 and np.array_equal(vertices[0], vertices[-1]):
+        vertices = vertices[:-1]  # 闭合环的最后一个点与起点重复
+    if len(vertices) != 4:
+        raise FieldShapeError("errNot4Poly")
+    edges = np.roll(vertices, -1, axis=0) - vertices
+    turns = edges[:, 0] * np.roll(edges, -1, axis=0)[:, 1] - edges[:, 1] * np.roll(edges, -1, axis=0)[:, 0]
+    if not ((turns > 0).all() or (turns < 0).all()):
+        raise FieldShapeError("errQuadConvex")
+    rect = np.asarray(rect, dtype=float)[:4]
+    candidates = [np.roll(order, -k, axis=0) for order in (vertices, vertices[::-1])
+                  for k in range(4)]
+    return min(candidates, key=lambda quad: ((quad - rect) ** 2).sum())
+
+
+def divide_quad(quad, rows, cols, x_buffer=0.0, y_buffer=0.0):
+    """将四边形(顶点顺序见order_quad())按双线性插值分割为rows×cols个子四边形
+
+    返回角点数组(N, 4, 2), 以及行号和列号数组(N,)
+    """
+    grid = QuadGrid.from_quad(quad, rows, cols, x_buffer, y_buffer)
+    row_idx, col_idx = grid.indices()
+    return grid.cells(), row_idx, col_idx
+
+
+def divide_rectangle(rect, rows, cols, x_buffer=0.0, y_buffer=0.0, plot_size=None,
+                     align="center"):
+    """将矩形分割为rows×cols个子矩形
+
+    plot_size为(宽度, 长度)时按固定子地块尺寸排列(见plot_layout()), rows / cols为空时尽量排满.
+    返回角点数组(N, 4, 2), 以及行号和列号数组(N,)
+    """
+    if plot_size is not None:
+        grid = SubplotGrid.from_plot_size(rect, *plot_size, x_buffer, y_buffer, rows, cols, align)
+    else:
+        grid = SubplotGrid.from_rectangle(rect, rows, cols, x_buffer, y_buffer)
+    row_idx, col_idx = grid.indices()
+    return grid.cells(), row_idx, col_idx
+
+
+def cells_to_wkb(cells):
+    """将子地块角点(N, 4, 2)批量编码为WKB多边形, 返回bytes列表
+
+    用于在输出端转换为QgsGeometry, 避免逐点创建QgsPointXY
+    """
+    cells = np.asarray(cells, dtype=float)
+    n = len(cells)
+
+    wkb_dtype = np.dtype([
+        ("order", "u1"), ("type", "<u4"), ("rings", "<u4"),
+        ("points", "<u4"), ("coords", "<f8", (5, 2)),
+    ])
+    buf = np.empty(n, dtype=wkb_dtype)
+    buf["order"] = 1  # little endian
+    buf["type"] = 3  # Polygon
+    buf["rings"] = 1
+    buf["points"] = 5
+    buf["coords"][:, :4] = cells
+    buf["coords"][:, 4] = cells[:, 0]  # 闭合多边形
+
+    raw = buf.tobytes()
+    size = wkb_dtype.itemsize
+    return [raw[i * size:(i + 1) * size] for i in range(n)]
@@ -0,0 +1,286 @@
+# File: height
+# Author: Haozhou Wang
+# Organization: UTOkyo FieldPhenomics Lab
+# Description:
+#     Per-subplot plant height from a DSM, streamed tile by tile into mergeable
+#     fixed-bin histogram sketches (no Qt / QGIS)
+# Dependencies:
+#     - Python 3.x
+#     - NumPy
+#     - GDAL (osgeo, shipped with QGIS)
+# License: MIT
+# Usage:
+#     baselines = soil_baseline("dsm.tif", alley_rings(grid.cells(), grid.alley_cells()))
+#     values, clipped = plant_height("dsm.tif", grid.cells(), baselines=baselines)
+
+import numpy as np
+
+from .raster import (TILE_SIZE, RasterInfo, _ThreadDatasets, band_range, map_tiles, polygon_mask,
+                     polygon_windows, read_window, tile_counts, tile_polygons, world_to_pixel)
+
+HEIGHT_STATISTICS = ("count", "mean", "min", "max")
+HEIGHT_PERCENTILES = (90, 95, 99)
+
+# 默认的株高范围和分箱宽度(米), 范围外的高度计入两端的分箱并计数
+HEIGHT_RANGE = (-1.0, 4.0)
+BIN_WIDTH = 0.01
+# 每个子地块直方图的最大分箱数, 范围过大时加宽分箱
+MAX_BINS = 10000
+
+
+def height_names(statistics=HEIGHT_STATISTICS, percentiles=HEIGHT_PERCENTILES):
+    """株高结果的字段名, 如h_mean, h_p95"""
+    return [f"h_{s}" for s in statistics] + [f"h_p{p:g}" for p in percentiles]
+
+
+def alley_rings(cells, alley_cells):
+    """子地块周围的间距区域: 以扩展后的子地块为外环, 子地块本身为洞"""
+    return [[outer, inner] for outer, inner in zip(alley_cells, cells)]
+
+
+def estimate_height_range(dsm_path, dtm_path=None, baselines=None, band=1):
+    """由波段的概略统计(可来自金字塔)估计株高范围
+
+    上限为DSM最大值减DTM最小值或最低的土壤基准, 不小于HEIGHT_RANGE的上限;
+    两者都未给出时为DSM本身的范围. 统计不可用时返回HEIGHT_RANGE
+    """
+    low, high = band_range(dsm_path, band)
+    if dtm_path is None and baselines is None:
+        return (low, high) if np.isfinite([low, high]).all() else HEIGHT_RANGE
+    if dtm_path is not None:
+        high -= band_range(dtm_path, 1)[0]
+    elif np.isfinite(baselines).any():
+        high -= np.nanmin(baselines)
+    else:
+        high = np.nan
+    return (HEIGHT_RANGE[0], max(HEIGHT_RANGE[1], high) if np.isfinite(high) else HEIGHT_RANGE[1])
+
+
+def _quantiles(counts, offsets, minima, maxima, percentiles, bin_width):
+    """由直方图(k, bins)计算百分位数(k, len(percentiles)), 在分箱内线性插值"""
+    cum = np.cumsum(counts, axis=1)
+    total = cum[:, -1]
+    rows = np.arange(len(counts))
+    out = np.empty((len(counts), len(percentiles)))
+    for j, p in enumerate(percentiles):
+        target = p / 100 * total
+        k = np.minimum((cum < target[:, None]).sum(axis=1), counts.shape[1] - 1)
+        before = np.where(k > 0, cum[rows, k - 1], 0)
+        inside = counts[rows, k]
+        frac = np.where(inside > 0, (target - before) / np.maximum(inside, 1), 0)
+        # 插值结果限制在实际的最小值和最大值之间
+        out[:, j] = np.clip((offsets + k + frac) * bin_width, minima, maxima)
+    return out
+
+
+class HeightSketch:
+
+    """每个子地块一个固定分箱的高度直方图, 逐瓦片合并
+
+    分箱位于以0为原点的公共网格上. 给出low时每个子地块的范围为
+    [low, low + span); 否则以其第一个非空瓦片的中位数为中心(用于高程等绝对值).
+    范围外的值计入两端的分箱, 并按子地块计数. remaining为每个子地块所在的瓦片数,
+    子地块的所有瓦片合并后立即算出统计并释放直方图, 因此内存只与处理中的
+    子地块数有关. 分箱数超过MAX_BINS时加宽分箱. 百分位数在分箱内线性插值,
+    误差不超过一个分箱宽度; 计数, 均值, 最小值和最大值是精确的
+    """
+
+    def __init__(self, remaining, span, bin_width=BIN_WIDTH, low=None,
+                 percentiles=HEIGHT_PERCENTILES):
+        self.bins = max(1, int(np.ceil(span / bin_width)))
+        if self.bins > MAX_BINS:
+            self.bins = MAX_BINS
+            bin_width = span / MAX_BINS
+        self.bin_width = bin_width
+        self.offset = None if low is None else int(np.floor(low / bin_width))
+        self.percentiles = list(percentiles)
+
+        n = len(remaining)
+        self.remaining = np.array(remaining, dtype=np.int64)
+        self.active = {}
+        self.sums = np.zeros(n)
+        self.minima = np.full(n, np.inf)
+        self.maxima = np.full(n, -np.inf)
+        self.clipped = np.zeros(n, dtype=np.int64)
+        self.counts = np.zeros(n, dtype=np.int64)
+        self.quantiles = np.full((n, len(self.percentiles)), np.nan)
+
+    def histogram(self, values):
+        """一组高度值的(起始分箱, 直方图, 和, 最小值, 最大值, 范围外的个数)"""
+        offset = self.offset
+        if offset is None:
+            median = np.median(values) if len(values) else 0.0
+            offset = int(np.floor(median / self.bin_width)) - self.bins // 2
+        index = np.floor(values / self.bin_width).astype(np.int64) - offset
+        outside = np.count_nonzero((index < 0) | (index >= self.bins))
+        return (offset, np.bincount(np.clip(index, 0, self.bins - 1), minlength=self.bins),
+                values.sum(), values.min(initial=np.inf), values.max(initial=-np.inf), outside)
+
+    def merge(self, indices, offsets, counts, sums, minima, maxima, clipped):
+        """合并一个瓦片中部分子地块的直方图, 完成所有瓦片的子地块立即统计"""
+        np.add.at(self.sums, indices, sums)
+        np.minimum.at(self.minima, indices, minima)
+        np.maximum.at(self.maxima, indices, maxima)
+        np.add.at(self.clipped, indices, clipped)
+        span = np.arange(self.bins)
+        for i, offset, row in zip(indices, offsets, counts):
+            if not row.any():
+                continue
+            if i not in self.active:
+                self.active[i] = (offset, row.astype(np.int64))
+                continue
+            # 起始分箱不同时平移到该子地块的范围
+            base, hist = self.active[i]
+            shifted = span + (offset - base)
+            self.clipped[i] += row[(shifted < 0) | (shifted >= self.bins)].sum()
+            np.add.at(hist, np.clip(shifted, 0, self.bins - 1), row)
+
+        self.remaining[indices] -= 1
+        self.finish(indices[self.remaining[indices] <= 0])
+
+    def finish(self, indices):
+        """统计并释放这些子地块的直方图"""
+        indices = [i for i in indices if i in self.active]
+        if not indices:
+            return
+        offsets, counts = zip(*(self.active.pop(i) for i in indices))
+        counts = np.stack(counts)
+        self.counts[indices] = counts.sum(axis=1)
+        if self.percentiles:
+            self.quantiles[indices] = _quantiles(counts, np.array(offsets), self.minima[indices],
+                                                 self.maxima[indices], self.percentiles,
+                                                 self.bin_width)
+
+    def statistics(self, statistics=HEIGHT_STATISTICS):
+        """统计结果(N, 字段数), 与height_names()的顺序一致; 取消时未完成的子地块按已合并的部分统计"""
+        self.finish(list(self.active))
+        has = self.counts > 0
+        columns = {
+            "count": self.counts.astype(float),
+            "mean": np.where(has, self.sums / np.maximum(self.counts, 1), np.nan),
+            "min": np.where(has, self.minima, np.nan),
+            "max": np.where(has, self.maxima, np.nan),
+        }
+        return np.column_stack([columns[s] for s in statistics] + list(self.quantiles.T)
+                               or [np.empty((len(has), 0))])
+
+
+def _sample_dtm(dataset, info, dsm_info, window):
+    """在DSM窗口的像素中心采样DTM(最近邻), 返回数据(h, w)和有效掩膜
+
+    DTM与DSM网格相同时直接读取同一窗口
+    """
+    if (info.width, info.height) == (dsm_info.width, dsm_info.height) \
+            and np.allclose(info.geotransform, dsm_info.geotransform):
+        data, valid = read_window(dataset, window, [1])
+        return data[0], valid[0]
+
+    geotransform = dsm_info.geotransform
+    x0, y0, x1, y1 = window
+    cols = np.arange(x0, x1) + 0.5
+    rows = (np.arange(y0, y1) + 0.5)[:, None]
+    world = np.stack([geotransform[0] + cols * geotransform[1] + rows * geotransform[2],
+                      geotransform[3] + cols * geotransform[4] + rows * geotransform[5]], axis=-1)
+    px = np.floor(world_to_pixel(info.geotransform, world)).astype(np.int64)
+    inside = ((px[..., 0] >= 0) & (px[..., 0] < info.width)
+              & (px[..., 1] >= 0) & (px[..., 1] < info.height))
+    if not inside.any():
+        return np.zeros(inside.shape), inside
+
+    lo = px[inside].min(axis=0)
+    hi = px[inside].max(axis=0) + 1
+    data, valid = read_window(dataset, (lo[0], lo[1], hi[0], hi[1]), [1])
+    c = np.clip(px[..., 0] - lo[0], 0, hi[0] - lo[0] - 1)
+    r = np.clip(px[..., 1] - lo[1], 0, hi[1] - lo[1] - 1)
+    return data[0][r, c], valid[0][r, c] & inside
+
+
+def _sketch_polygons(path, polygons, info, sketch_args, tile_values, shifts=None,
+                     tile_size=TILE_SIZE, max_workers=None, progress=None):
+    """逐瓦片将每个多边形内的值统计为HeightSketch(*sketch_args)并合并, 返回该草图
+
+    tile_values(dataset, window)返回瓦片的值(h, w)和有效掩膜(h, w);
+    shifts(N,)给出时从各多边形的值中减去. 瓦片大小固定, 在线程池中并行统计,
+    主线程按多边形合并. progress(已完成比例)返回False时取消
+    """
+    windows = polygon_windows(polygons, info.geotransform, info.width, info.height)
+    tiles = tile_polygons(windows, info.width, info.height, info.block_size, tile_size)
+    sketch = HeightSketch(tile_counts(tiles, len(windows)), *sketch_args)
+
+    def tile_sketch(dataset, window, indices):
+        heights, valid = tile_values(dataset, window)
+        partial = []
+        for i in indices:
+            # 多边形窗口与瓦片的交集
+            x0, y0 = max(windows[i][0], window[0]), max(windows[i][1], window[1])
+            x1, y1 = min(windows[i][2], window[2]), min(windows[i][3], window[3])
+            mask = polygon_mask(polygons[i], (x0, y0, x1, y1), info.geotransform)
+            local = np.s_[y0 - window[1]:y1 - window[1], x0 - window[0]:x1 - window[0]]
+            values = heights[local][mask & valid[local]]
+            if shifts is not None:
+                values = values - shifts[i]
+            partial.append(sketch.histogram(values[np.isfinite(values)]))
+        return (indices,) + tuple(np.array(column) for column in zip(*partial))
+
+    for i, partial in enumerate(map_tiles(path, tiles, tile_sketch, max_workers)):
+        sketch.merge(*partial)
+        if progress is not None and progress((i + 1) / len(tiles)) is False:
+            break
+    return sketch
+
+
+def soil_baseline(dsm_path, rings, percentile=50, band=1, bin_width=BIN_WIDTH,
+                  tile_size=TILE_SIZE, max_workers=None, progress=None):
+    """每个子地块周围间距(土壤)的DSM高程基准(N,), 取间距像素的percentile百分位数
+
+    与plant_height()相同地逐瓦片合并直方图, 不收集像素值; 每个子地块的范围以其
+    第一个瓦片的中位数为中心, 宽度与HEIGHT_RANGE相同.
+    rings为alley_rings()的结果, 没有间距像素的子地块为NaN
+    """
+    info = RasterInfo(dsm_path)
+
+    def tile_values(dataset, window):
+        data, valid = read_window(dataset, window, [band])
+        return data[0], valid[0]
+
+    span = HEIGHT_RANGE[1] - HEIGHT_RANGE[0]
+    sketch = _sketch_polygons(dsm_path, rings, info, (span, bin_width, None, [percentile]),
+                              tile_values, tile_size=tile_size, max_workers=max_workers,
+                              progress=progress)
+    return sketch.statistics(())[:, 0]
+
+
+def plant_height(dsm_path, polygons, dtm_path=None, baselines=None,
+                 statistics=HEIGHT_STATISTICS, percentiles=HEIGHT_PERCENTILES,
+                 height_range=None, bin_width=BIN_WIDTH, band=1, tile_size=TILE_SIZE,
+                 max_workers=None, progress=None):
+    """逐瓦片计算每个子地块的株高统计, 返回(N, 字段数)数组, 与height_names()的顺序一致,
+    以及每个子地块超出height_range的像素数(N,)
+
+    株高为DSM减去DTM(dtm_path, 按DSM像素中心最近邻采样), 或减去每个子地块的
+    土壤基准baselines(N,), 如soil_baseline()的结果; 两者都未给出时为DSM本身.
+    height_range为None时由estimate_height_range()估计. 瓦片大小固定, 在线程池中
+    并行统计为直方图, 主线程按子地块合并, 内存有上限.
+    progress(已完成比例)返回False时取消, 未处理的部分不计入结果
+    """
+    info = RasterInfo(dsm_path)
+    baselines = None if baselines is None else np.asarray(baselines, dtype=float)
+    if height_range is None:
+        height_range = estimate_height_range(dsm_path, dtm_path, baselines, band)
+    low, high = height_range
+
+    dtm_info = RasterInfo(dtm_path) if dtm_path else None
+    dtm_datasets = _ThreadDatasets(dtm_path) if dtm_path else None
+
+    def tile_values(dataset, window):
+        data, valid = read_window(dataset, window, [band])
+        heights, valid = data[0], valid[0]
+        if dtm_info is not None:
+            dtm, dtm_valid = _sample_dtm(dtm_datasets.get(), dtm_info, info, window)
+            heights = heights - dtm
+            valid = valid & dtm_valid
+        return heights, valid
+
+    sketch = _sketch_polygons(dsm_path, polygons, info, (high - low, bin_width, low, percentiles),
+                              tile_values, baselines, tile_size, max_workers, progress)
+    return sketch.statistics(statistics), sketch.clipped
@@ -0,0 +1,274 @@
+# File: i18n
+# Author: Haozhou Wang
+# Organization: UTOkyo FieldPhenomics Lab
+# Description:
+#     Translations of FIELDimagePy-QGIS tools
+# Dependencies:
+#     - Python 3.x
+# License: MIT
+
+i18n_en = {
+    "windowTitle": "Subplot Division Tool",
+    "layerLbl": "Select plot boundary polygon layer:",
+    "focusBtn": "Focus",
+    "batchChk": "Batch mode: divide every feature in the layer",
+    "idFieldLbl": "Block ID field:",
+    "rowsFieldLbl": "Rows field:",
+    "colsFieldLbl": "Columns field:",
+    "xBufFieldLbl": "Row spacing field:",
+    "yBufFieldLbl": "Column spacing field:",
+    "colsLbl": "Horizontal divisions (columns):",
+    "rowsLbl": "Vertical divisions (rows):",
+    "plotSizeChk": "Fixed plot size (rows / columns 0 = as many as fit)",
+    "plotWidthLbl": "Plot width along the columns (m), e.g. 1.5 or 2, 10*1.5, 2:",
+    "plotLengthLbl": "Plot length along the rows (m), e.g. 5 or 6, 8*5, 6:",
+    "quadChk": "Fill the quadrilateral (trapezoid / skewed blocks, bilinear grid)",
+    "domLbl": "Select DOM layer (for output CRS):",
+    "statsChk": "Compute zonal statistics of each subplot from the DOM",
+    "coverChk": "Compute canopy cover of each subplot (ExG, Otsu threshold)",
+    "traceChk": "Log stage timings and memory (Log Messages panel, FIELDimagePy tab)",
+    "xBufLbl": "Row spacing (m), negative for overlap:",
+    "yBufLbl": "Column spacing (m), negative for overlap:",
+    "fieldBookLbl": "Field book (CSV / XLSX, one row per subplot in planting order, optional):",
+    "fieldBookPlacehold": "No field book",
+    "orderRow": "Row by row",
+    "orderCol": "Column by column",
+    "serpentineChk": "Serpentine",
+    "startR1C1": "Start: row 1, column 1",
+    "startR1CN": "Start: row 1, last column",
+    "startRNC1": "Start: last row, column 1",
+    "startRNCN": "Start: last row, last column",
+    "outputLbl": "Output file path:",
+    "outputPlacehold": "Save as temporary file",
+    "prevBtn": "Preview",
+    "autoFitBtn": "Auto fit",
+    "runBtn": "Execute",
+    "prevWinTitle": "Division Preview",
+
+    "savefileDialogTitle": "Save Output File",
+    "fieldBookDialogTitle": "Open Field Book",
+    "fieldBookDialogTypes": "Field books (*.csv *.txt *.tsv *.xlsx *.xls *.ods);;All files (*)",
+    "savefileDialogTypes": "Shapefiles (*.shp);;GeoPackage (*.gpkg);;FlatGeobuf (*.fgb);;All files (*)",
+
+    "err": "Error",
+    "errNotAPolygon": "Please select a valid polygon layer!",
+    "errNotOneLayer": "Plot boundary layer must contain exactly one feature!",
+    "errBlock": "Block",
+    "errNotGoodPoly": "Invalid polygon geometry!",
+    "errNot4Poly": "Polygon must be a quadrilateral (4 vertices)!",
+    "errNoZero": "Rows and columns must be greater than 0!",
+    "errException": "Input validation failed",
+    "errRot": "Cannot calculate rotation angle!",
+    "errNegative": "Buffer value too large - resulting subplot size is negative",
+    "errMinRect": "Cannot calculate minimum bounding rectangle!",
+    "errPrevRange": "Cannot calculate valid preview range!",
+    "errPrevLarge": "Too many subplots to preview",
+    "errMeterCRS": "Please select a projected CRS with meter units",
+    "errSave": "Failed to save file:",
+    "errSaveLoad": "Cannot load saved layer!",
+    "errFormat": "Unsupported output format, please use .shp, .gpkg or .fgb",
+    "errNotRaster": "Please select a raster DOM layer for zonal statistics!",
+    "errTransform": "Failed to transform the subplots to the output coordinate system",
+    "errShpLimit": "Estimated output exceeds the 2 GB limit of Shapefile, please use .gpkg or .fgb",
+    "errDiskSpace": "Not enough disk space for the estimated output",
+    "errAutoFit": "Cannot detect the subplot pattern from the DOM",
+    "errNoAlley": "Plant height needs a DTM, or row/column spacing (alleys) for the soil baseline",
+    "errNoPixels": "No valid DOM pixels inside the blocks to compute the vegetation threshold",
+    "errFieldBook": "Cannot read the field book",
+    "errFieldBookCount": "Field book rows and subplots differ (rows / subplots)",
+    "fieldBookCount": "The field book has {rows} rows but {count} subplots will be created. Extra subplots get empty attributes and extra rows are ignored. Continue?",
+    "errPlotFit": "No plot of the given size fits into the bounding rectangle",
+    "errPlotSizes": "Number of plot sizes or spacings does not match the rows / columns",
+    "errQuadPlotSize": "Fixed plot size cannot be used with the quadrilateral mode",
+    "errQuadConvex": "The quadrilateral mode needs a convex quadrilateral boundary",
+    "largeGrid": "{count} subplots will be created (estimated size {size}). Continue?",
+
+    "success": "Success",
+    "sucSave": "Subplots successfully created and saved to",
+    "sucSaveTemp": "Subplots successfully created as temporary layer",
+    "autoFitDone": "Detected {rows} rows × {cols} columns, spacing {x_buffer:.2f} m / {y_buffer:.2f} m",
+    "autoFitMargin": "The grid starts at the boundary corner, but the boundary is {0:.2f} m / {1:.2f} m (x) and {2:.2f} m / {3:.2f} m (y) away from the first / last plot, so the subplots will be shifted. Draw the boundary tight around the plots",
+    "plotSizeFit": "{rows} rows × {cols} columns fit, leftover margin {x_margin:.2f} m × {y_margin:.2f} m",
+    "taskDesc": "Dividing subplots",
+    "taskStarted": "Subplot division is running in the background, see the task manager for progress",
+    "taskCanceled": "Subplot division canceled"
+}
+
+i18n_cn = {
+    "windowTitle": "样地分割工具",
+    "layerLbl": "选择样地边界多边形图层:",
+    "focusBtn": "聚焦",
+    "batchChk": "批量模式: 分割图层中的所有要素",
+    "idFieldLbl": "区块ID字段:",
+    "rowsFieldLbl": "行数字段:",
+    "colsFieldLbl": "列数字段:",
+    "xBufFieldLbl": "行间距字段:",
+    "yBufFieldLbl": "列间距字段:",
+    "colsLbl": "水平分割份数(行数):",
+    "rowsLbl": "垂直分割份数(列数):",
+    "plotSizeChk": "固定子地块尺寸(行数/列数为0时尽量排满)",
+    "plotWidthLbl": "子地块宽度(沿列方向, 米), 如1.5或2, 10*1.5, 2:",
+    "plotLengthLbl": "子地块长度(沿行方向, 米), 如5或6, 8*5, 6:",
+    "quadChk": "填满四边形(梯形/斜边区块, 双线性网格)",
+    "domLbl": "选择DOM图层(用于输出CRS)",
+    "statsChk": "从DOM计算每个子地块的分区统计",
+    "coverChk": "计算每个子地块的植被覆盖度(ExG, Otsu阈值)",
+    "traceChk": "记录各阶段的耗时和内存(日志面板的FIELDimagePy标签页)",
+    "xBufLbl": "行间距(米), 负值表示互相重叠: ",
+    "yBufLbl": "列间距(米), 负值表示互相重叠: ",
+    "fieldBookLbl": "田间记录本(CSV / XLSX, 按种植顺序每行一个子地块, 可选):",
+    "fieldBookPlacehold": "不使用记录本",
+    "orderRow": "逐行",
+    "orderCol": "逐列",
+    "serpentineChk": "蛇形",
+    "startR1C1": "起点: 第1行第1列",
+    "startR1CN": "起点: 第1行最后一列",
+    "startRNC1": "起点: 最后一行第1列",
+    "startRNCN": "起点: 最后一行最后一列",
+    "outputLbl": "输出文件路径:",
+    "outputPlacehold": "储存为临时文件",
+    "prevBtn": "预览",
+    "autoFitBtn": "自动拟合",
+    "runBtn": "运行",
+    "prevWinTitle": "分割预览",
+
+    "savefileDialogTitle": "保存输出文件",
+    "fieldBookDialogTitle": "打开田间记录本",
+    "fieldBookDialogTypes": "记录本 (*.csv *.txt *.tsv *.xlsx *.xls *.ods);;所有文件 (*)",
+    "savefileDialogTypes": "Shapefiles (*.shp);;GeoPackage (*.gpkg);;FlatGeobuf (*.fgb);;所有文件 (*)",
+
+    "err": "错误",
+    "errNotAPolygon": "请选择一个有效的多边形图层!",
+    "errNotOneLayer": "样地边界图层应只包含一个要素!",
+    "errBlock": "区块",
+    "errNotGoodPoly": "多边形几何无效!",
+    "errNot4Poly": "多边形应为一个四边形(4个顶点)!",
+    "errNoZero": "行数和列数必须大于0!",
+    "errException": "输入验证失败",
+    "errRot": "无法计算旋转角度!",
+    "errNegative": "缓冲区值过大导致子地块尺寸为负值",
+    "errMinRect": "无法计算最小面积外接矩形!",
+    "errPrevRange":  "无法计算有效的预览范围!",
+    "errPrevLarge": "子地块过多, 无法预览",
+    "errMeterCRS": "请选择米制单位的投影坐标系",
+    "errSave": "保存文件失败:",
+    "errSaveLoad": "无法加载保存的图层!",
+    "errFormat": "不支持的输出格式, 请使用.shp, .gpkg或.fgb",
+    "errNotRaster": "分区统计需要选择栅格DOM图层!",
+    "errTransform": "子区域转换到输出坐标系失败",
+    "errShpLimit": "估算的输出超过Shapefile的2GB限制, 请使用.gpkg或.fgb",
+    "errDiskSpace": "磁盘剩余空间不足以保存估算的输出",
+    "errAutoFit": "无法从DOM中识别子地块的排列",
+    "errNoAlley": "株高计算需要DTM, 或大于0的行列间距(走道)作为土壤基准",
+    "errNoPixels": "区块范围内没有有效的DOM像素, 无法计算植被阈值",
+    "errFieldBook": "无法读取田间记录本",
+    "errFieldBookCount": "田间记录本行数与子地块数不一致(行数 / 子地块数)",
+    "fieldBookCount": "田间记录本有{rows}行, 将创建{count}个子地块. 多余的子地块属性为空, 多余的行被忽略. 是否继续?",
+    "errPlotFit": "外接矩形内放不下指定尺寸的子地块",
+    "errPlotSizes": "子地块尺寸或间距的个数与行数/列数不一致",
+    "errQuadPlotSize": "固定子地块尺寸不能与四边形模式同时使用",
+    "errQuadConvex": "四边形模式需要凸四边形的边界",
+    "largeGrid": "将创建{count}个子地块(估算大小{size}), 是否继续?",
+
+    "success": "成功",
+    "sucSave": "子区域已成功创建并保存到",
+    "sucSaveTemp": "子区域已成功创建为临时图层",
+    "autoFitDone": "识别到{rows}行 × {cols}列, 间距{x_buffer:.2f}米 / {y_buffer:.2f}米",
+    "autoFitMargin": "网格从边界的角点开始, 但边界与第一个 / 最后一个子地块相距{0:.2f}米 / {1:.2f}米(x)和{2:.2f}米 / {3:.2f}米(y), 子地块会偏移. 请紧贴地块绘制边界",
+    "plotSizeFit": "可排列{rows}行 × {cols}列, 剩余边距 {x_margin:.2f} 米 × {y_margin:.2f} 米",
+    "taskDesc": "正在分割子区域",
+    "taskStarted": "子区域分割正在后台运行, 进度见任务管理器",
+    "taskCanceled": "子区域分割已取消"
+}
+
+i18n_jp = {
+    "windowTitle": "プロット分割ツール",
+    "layerLbl": "プロット境界ポリゴンレイヤを選択:",
+    "focusBtn": "フォーカス",
+    "batchChk": "一括モード: レイヤ内の全地物を分割",
+    "idFieldLbl": "ブロックIDフィールド:",
+    "rowsFieldLbl": "行数フィールド:",
+    "colsFieldLbl": "列数フィールド:",
+    "xBufFieldLbl": "行間隔フィールド:",
+    "yBufFieldLbl": "列間隔フィールド:",
+    "colsLbl": "水平分割数(列数):",
+    "rowsLbl": "垂直分割数(行数):",
+    "plotSizeChk": "サブプロットサイズを固定(行数/列数0で最大数を配置)",
+    "plotWidthLbl": "サブプロット幅(列方向, m), 例: 1.5 または 2, 10*1.5, 2:",
+    "plotLengthLbl": "サブプロット長(行方向, m), 例: 5 または 6, 8*5, 6:",
+    "quadChk": "四角形を埋める(台形/斜めのブロック、双線形グリッド)",
+    "domLbl": "DOMレイヤを選択(出力CRS用):",
+    "statsChk": "DOMから各サブプロットのゾーン統計を計算",
+    "coverChk": "各サブプロットの植被率を計算(ExG、大津の閾値)",
+    "traceChk": "各段階の所要時間とメモリを記録(ログパネルのFIELDimagePyタブ)",
+    "xBufLbl": "行間隔(m), 負値は重なりを意味:",
+    "yBufLbl": "列間隔(m), 負値は重なりを意味:",
+    "fieldBookLbl": "フィールドブック(CSV / XLSX, 植付順に1行1サブプロット, 任意):",
+    "fieldBookPlacehold": "フィールドブックなし",
+    "orderRow": "行ごと",
+    "orderCol": "列ごと",
+    "serpentineChk": "蛇行",
+    "startR1C1": "開始: 1行目1列目",
+    "startR1CN": "開始: 1行目最終列",
+    "startRNC1": "開始: 最終行1列目",
+    "startRNCN": "開始: 最終行最終列",
+    "outputLbl": "出力ファイルパス:",
+    "outputPlacehold": "一時ファイルとして保存",
+    "prevBtn": "プレビュー",
+    "autoFitBtn": "自動フィット",
+    "runBtn": "実行",
+    "prevWinTitle": "分割プレビュー",
+
+    "savefileDialogTitle": "出力ファイルを保存",
+    "fieldBookDialogTitle": "フィールドブックを開く",
+    "fieldBookDialogTypes": "フィールドブック (*.csv *.txt *.tsv *.xlsx *.xls *.ods);;すべてのファイル (*)",
+    "savefileDialogTypes": "シェープファイル (*.shp);;GeoPackage (*.gpkg);;FlatGeobuf (*.fgb);;すべてのファイル (*)",
+
+    "err": "エラー",
+    "errNotAPolygon": "有効なポリゴンレイヤを選択してください!",
+    "errNotOneLayer": "プロット境界レイヤは1つのみ含む必要あり!",
+    "errBlock": "ブロック",
+    "errNotGoodPoly": "無効なポリゴン形状です!",
+    "errNot4Poly": "ポリゴンは四角形(4頂点)である必要あり!",
+    "errNoZero": "行数と列数は0より大きい必要あり!",
+    "errException": "入力検証失敗",
+    "errRot": "回転角度を計算できません!",
+    "errNegative": "バッファ値が大きすぎてサブプロットサイズが負に",
+    "errMinRect": "最小外接矩形を計算できません!",
+    "errPrevRange": "有効なプレビュー範囲を計算できません!",
+    "errPrevLarge": "サブプロットが多すぎてプレビューできません",
+    "errMeterCRS": "メートル単位の投影座標系を選択してください",
+    "errSave": "ファイル保存失敗:",
+    "errSaveLoad": "保存したレイヤを読み込めません!",
+    "errFormat": "未対応の出力形式です。.shp, .gpkg, .fgbを使用してください",
+    "errNotRaster": "ゾーン統計にはラスタのDOMレイヤを選択してください!",
+    "errTransform": "サブプロットを出力座標系に変換できませんでした",
+    "errShpLimit": "推定出力サイズがShapefileの2GB制限を超えています。.gpkgまたは.fgbを使用してください",
+    "errDiskSpace": "推定出力サイズに対してディスクの空き容量が不足しています",
+    "errAutoFit": "DOMからサブプロットの配置を検出できません",
+    "errNoAlley": "草高の計算にはDTM、または土壌基準となる行列間隔(通路)が必要です",
+    "errNoPixels": "ブロック内に有効なDOMピクセルがなく、植生の閾値を計算できません",
+    "errFieldBook": "フィールドブックを読み込めません",
+    "errFieldBookCount": "フィールドブックの行数とサブプロット数が一致しません(行数 / サブプロット数)",
+    "fieldBookCount": "フィールドブックは{rows}行ですが、{count}個のサブプロットを作成します。余分なサブプロットの属性は空になり、余分な行は無視されます。続行しますか?",
+    "errPlotFit": "指定サイズのサブプロットが外接矩形に収まりません",
+    "errPlotSizes": "サブプロットサイズまたは間隔の数が行数/列数と一致しません",
+    "errQuadPlotSize": "サブプロットサイズの固定は四角形モードと併用できません",
+    "errQuadConvex": "四角形モードには凸四角形の境界が必要です",
+    "largeGrid": "{count}個のサブプロットを作成します(推定サイズ{size})。続行しますか?",
+
+    "success": "成功",
+    "sucSave": "サブプロットの作成と保存に成功:",
+    "sucSaveTemp": "サブプロットが一時レイヤとして作成されました",
+    "autoFitDone": "{rows}行 × {cols}列、間隔{x_buffer:.2f}m / {y_buffer:.2f}mを検出しました",
+    "autoFitMargin": "グリッドは境界の角から始まりますが、境界と最初 / 最後の区画の距離が{0:.2f}m / {1:.2f}m (x)、{2:.2f}m / {3:.2f}m (y)あるため、区画がずれます。境界は区画に沿って描いてください",
+    "plotSizeFit": "{rows}行 × {cols}列を配置、残りの余白 {x_margin:.2f} m × {y_margin:.2f} m",
+    "taskDesc": "サブプロットを分割中",
+    "taskStarted": "サブプロット分割をバックグラウンドで実行中です。進捗はタスクマネージャーで確認できます",
+    "taskCanceled": "サブプロット分割がキャンセルされました"
+}
+
+
+def get_lang(locale):
+    """根据系统语言(如QLocale.system().name())选择翻译"""
+    return i18n_cn if locale.startswith("zh") else i18n_jp if locale.startswith("ja") else i18n_en
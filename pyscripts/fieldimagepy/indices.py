@@ -0,0 +1,151 @@
+# File: indices
+# Author: Haozhou Wang
+# Organization: UTOkyo FieldPhenomics Lab
+# Description:
+#     Vegetation index calculator streaming over the orthomosaic in tiles (no Qt / QGIS)
+# Dependencies:
+#     - Python 3.x
+#     - NumPy
+#     - GDAL (osgeo, shipped with QGIS)
+# License: MIT
+
+import ast
+
+import numpy as np
+from osgeo import gdal
+
+from .raster import TILE_SIZE, RasterInfo, block_windows, map_tiles, read_window
+
+# 常用植被指数, 波段名R / G / B / NIR / RE对应的波段号由band_map指定
+INDICES = {
+    "NGRDI": "(G - R) / (G + R)",
+    "ExG": "2 * G - R - B",
+    "VARI": "(G - R) / (G + R - B)",
+    "GLI": "(2 * G - R - B) / (2 * G + R + B)",
+    "NDVI": "(NIR - R) / (NIR + R)",
+    "GNDVI": "(NIR - G) / (NIR + G)",
+    "NDRE": "(NIR - RE) / (NIR + RE)",
+    "HUE": "arctan(2 * (B - G - R) / 30.5 * (G - B))",
+}
+
+# 默认的RGB波段顺序
+BAND_MAP = {"R": 1, "G": 2, "B": 3}
+
+# 表达式中允许使用的NumPy函数
+FUNCTIONS = {
+    name: getattr(np, name)
+    for name in ("abs", "sqrt", "log", "log10", "exp", "sin", "cos", "tan", "arctan",
+                 "minimum", "maximum", "clip", "where")
+}
+
+_NODES = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Compare, ast.Call, ast.Name,
+          ast.Load, ast.Constant, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.USub,
+          ast.UAdd, ast.Gt, ast.GtE, ast.Lt, ast.LtE, ast.Eq, ast.NotEq)
+
+# 写出的GeoTIFF: 分块, 压缩, 超过4GB时自动使用BigTIFF
+CREATION_OPTIONS = ["TILED=YES", "BLOCKXSIZE=512", "BLOCKYSIZE=512", "COMPRESS=DEFLATE",
+                    "PREDICTOR=3", "BIGTIFF=IF_SAFER", "NUM_THREADS=ALL_CPUS"]
+NODATA = -9999.0
+
+
+def compile_expression(expression, band_map=None):
+    """编译波段运算表达式, 返回(函数, 用到的波段号列表)
+
+    表达式可使用b1, b2, ...或band_map中的波段名, 以及FUNCTIONS中的函数,
+    如 "(NIR - R) / (NIR + R)" 或 "sqrt(b4) - b1"
+    """
+    band_map = dict(BAND_MAP if band_map is None else band_map)
+    tree = ast.parse(expression.strip(), mode="eval")
+
+    names = []
+    for node in ast.walk(tree):
+        if not isinstance(node, _NODES):
+            raise ValueError(f"Unsupported syntax in expression: {type(node).__name__}")
+        if isinstance(node, ast.Call) and not (
+                isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS):
+            raise ValueError("Unsupported function in expression")
+        if isinstance(node, ast.Name) and node.id not in FUNCTIONS:
+            names.append(node.id)
+
+    bands = {}
+    for name in names:
+        if name in band_map:
+            bands[name] = int(band_map[name])
+        elif name[0] == "b" and name[1:].isdigit():
+            bands[name] = int(name[1:])
+        else:
+            raise ValueError(f"Unknown band in expression: {name}")
+
+    code = compile(tree, "<expression>", "eval")
+    used = sorted(set(bands.values()))
+
+    def evaluate(data):
+        """data为used中各波段的数组(b, h, w), 返回计算结果(h, w)"""
+        env = dict(FUNCTIONS)
+        for name, b in bands.items():
+            env[name] = data[used.index(b)]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return eval(code, {"__builtins__": {}}, env)
+
+    return evaluate, used
+
+
+def overview_levels(width, height, min_size=256):
+    """金字塔级别: 2, 4, 8, ... 直到最小边不超过min_size"""
+    levels = []
+    factor = 2
+    while min(width, height) // factor >= min_size:
+        levels.append(factor)
+        factor *= 2
+    return levels or [2]
+
+
+def index_raster(src_path, dst_path, expression, band_map=None, tile_size=TILE_SIZE,
+                 max_workers=None, overviews=True, progress=None):
+    """逐瓦片计算植被指数并写出GeoTIFF, 不会将整个栅格读入内存
+
+    expression可为INDICES中的名称或自定义表达式. 输出与源栅格的像素完全对齐
+    (相同的仿射变换和投影), 子地块的分区统计可直接使用.
+    progress(已完成比例)返回False时取消
+    """
+    evaluate, bands = compile_expression(INDICES.get(expression, expression), band_map)
+
+    info = RasterInfo(src_path)
+    for b in bands:
+        if not 1 <= b <= info.count:
+            raise ValueError(f"Band {b} does not exist in {src_path}")
+
+    driver = gdal.GetDriverByName("GTiff")
+    dst = driver.Create(dst_path, info.width, info.height, 1, gdal.GDT_Float32, CREATION_OPTIONS)
+    dst.SetGeoTransform(tuple(info.geotransform))
+    dst.SetProjection(info.projection)
+    dst_band = dst.GetRasterBand(1)
+    dst_band.SetNoDataValue(NODATA)
+
+    def tile_index(dataset, window, _):
+        data, valid = read_window(dataset, window, bands)
+        out = np.broadcast_to(evaluate(data), data.shape[1:]).astype(np.float32)
+        out[~valid.all(axis=0) | ~np.isfinite(out)] = NODATA
+        return window, out
+
+    tiles = [(window, None) for window in block_windows(
+        info.width, info.height, info.block_size, tile_size)]
+
+    # 各线程计算, 主线程按顺序写出
+    canceled = False
+    for i, (window, out) in enumerate(map_tiles(src_path, tiles, tile_index, max_workers)):
+        dst_band.WriteArray(out, window[0], window[1])
+        if progress is not None and progress((i + 1) / len(tiles)) is False:
+            canceled = True
+            break
+
+    if overviews and not canceled:
+        gdal.SetConfigOption("COMPRESS_OVERVIEW", "DEFLATE")
+        try:
+            dst.BuildOverviews("AVERAGE", overview_levels(info.width, info.height))
+        finally:
+            gdal.SetConfigOption("COMPRESS_OVERVIEW", None)
+
+    dst.FlushCache()
+    dst = None
+    return dst_path
@@ -0,0 +1,135 @@
+# File: minrect
+# Author: Haozhou Wang
+# Organization: UTOkyo FieldPhenomics Lab
+# Description:
+#     Convex hull and minimum area bounding rectangle (pure NumPy, no Qt / QGIS)
+# Dependencies:
+#     - Python 3.x
+#     - NumPy
+# License: MIT
+
+import numpy as np
+
+
+def _cross(o, a, b):
+    return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+
+def convex_hull(points):
+    """计算点集的凸包(Andrew单调链算法), 返回逆时针排列的顶点(h, 2), 不闭合"""
+    pts = np.unique(np.asarray(points, dtype=float).reshape(-1, 2), axis=0)
+    if len(pts) < 3:
+        return pts
+
+    pts = [tuple(p) for p in pts]  # np.unique已按x, y排序
+
+    lower = []
+    for p in pts:
+        while len(lower) >= 2 and _cross(lower[-2], lower[-1], p) <= 0:
+            lower.pop()
+        lower.append(p)
+
+    upper = []
+    for p in reversed(pts):
+        while len(upper) >= 2 and _cross(upper[-2], upper[-1], p) <= 0:
+            upper.pop()
+        upper.append(p)
+
+    return np.array(lower[:-1] + upper[:-1])
+
+
+def _support_table(hull):
+    """旋转卡壳: 逆时针凸包各顶点作为最远点所对应的外法线方向区间
+
+    返回升序的外法线角度(m,)以及对应的顶点(m, 2)
+    """
+    # 统一为逆时针, 并去除长度为0的边
+    x, y = hull[:, 0], hull[:, 1]
+    if (x * np.roll(y, -1) - np.roll(x, -1) * y).sum() < 0:
+        hull = hull[::-1]
+    edges = np.roll(hull, -1, axis=0) - hull
+    keep = (edges != 0).any(axis=1)
+    hull, edges = hull[keep], edges[keep]
+
+    # 逆时针凸包的边角度单调递增, 第k条边的外法线为其角度-90°
+    normals = np.unwrap(np.arctan2(edges[:, 1], edges[:, 0]) - np.pi / 2)
+    # 法线方向位于[normals[k], normals[k+1]]之间时, 第k+1个顶点最远
+    return normals, np.roll(hull, -1, axis=0)
+
+
+def _support(normals, vertices, directions):
+    """批量计算凸包在各方向上的支撑函数值 max(p·d)"""
+    phi = normals[0] + np.mod(directions - normals[0], 2 * np.pi)
+    k = np.searchsorted(normals, phi, side="right") - 1
+    p = vertices[k]
+    return p[:, 0] * np.cos(directions) + p[:, 1] * np.sin(directions)
+
+
+def min_area_rectangle(points, is_hull=False):
+    """获取最小面积外接矩形, 返回四个顶点(4, 2)
+
+    依次以凸包的每条边作为矩形的一条边; 以旋转卡壳的方式, 由边角度在
+    凸包法线序列中二分查找四个方向上的最远顶点, 整体复杂度O(n log n).
+    顶点顺序: 0为该边起点所在角, 0->1沿该边方向, 0->3垂直于该边
+    """
+    hull = np.asarray(points, dtype=float).reshape(-1, 2)
+    if not is_hull:
+        hull = convex_hull(hull)
+
+    # 移除重复的最后一个顶点(闭合多边形)
+    if len(hull) > 1 and (hull[0] == hull[-1]).all():
+        hull = hull[:-1]
+    if len(hull) < 3:
+        return None
+
+    edges = np.roll(hull, -1, axis=0) - hull
+    angles = np.arctan2(edges[:, 1], edges[:, 0])
+    cos_ang = np.cos(angles)
+    sin_ang = np.sin(angles)
+
+    normals, vertices = _support_table(hull)
+    if len(normals) < 3:
+        return None
+
+    # 以每条边起点为原点, 旋转后四个方向上的范围
+    x0 = hull[:, 0] * cos_ang + hull[:, 1] * sin_ang
+    y0 = hull[:, 1] * cos_ang - hull[:, 0] * sin_ang
+    max_x = _support(normals, vertices, angles) - x0
+    min_x = -_support(normals, vertices, angles + np.pi) - x0
+    max_y = _support(normals, vertices, angles + np.pi / 2) - y0
+    min_y = -_support(normals, vertices, angles - np.pi / 2) - y0
+
+    areas = (max_x - min_x) * (max_y - min_y)
+
+    # 面积相同(浮点误差内)时取第一条边, 保证结果稳定
+    best = np.flatnonzero(areas <= areas.min() * (1 + 1e-9))[0]
+
+    rect = np.array([
+        [min_x[best], min_y[best]],
+        [max_x[best], min_y[best]],
+        [max_x[best], max_y[best]],
+        [min_x[best], max_y[best]],
+    ])
+
+    # 逆旋转并平移回原位置
+    c, si = cos_ang[best], sin_ang[best]
+    return np.stack([
+        rect[:, 0] * c - rect[:, 1] * si + hull[best, 0],
+        rect[:, 0] * si + rect[:, 1] * c + hull[best, 1],
+    ], axis=1)
+
+
+def rotation_angle(rect):
+    """计算将矩形长边转为水平所需的旋转角度(度)"""
+    rect = np.asarray(rect, dtype=float)
+    bottom = rect[1] - rect[0]
+    left = rect[3] - rect[0]
+
+    if np.hypot(*bottom) >= np.hypot(*left):
+        # 底边是长边
+        angle = np.arctan2(bottom[1], bottom[0])
+    else:
+        # 左边是长边，需要旋转90度
+        angle = np.arctan2(left[1], left[0]) + np.pi / 2
+
+    return float(np.degrees(angle))
@@ -0,0 +1,274 @@
+# File: raster
+# Author: Haozhou Wang
+# Organization: UTOkyo FieldPhenomics Lab
+# Description:
+#     Windowed, block-aligned raster reading for large orthomosaics (no Qt / QGIS)
+# Dependencies:
+#     - Python 3.x
+#     - NumPy
+#     - GDAL (osgeo, shipped with QGIS)
+# License: MIT
+
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from osgeo import gdal
+
+gdal.UseExceptions()
+
+# 默认每个瓦片的边长(像素), 实际大小对齐到栅格的块大小
+TILE_SIZE = 1024
+
+
+class RasterInfo:
+
+    """栅格的基本信息, 打开一次后在各线程间共享"""
+
+    def __init__(self, path):
+        dataset = gdal.Open(path)
+        self.path = path
+        self.width = dataset.RasterXSize
+        self.height = dataset.RasterYSize
+        self.count = dataset.RasterCount
+        self.geotransform = np.array(dataset.GetGeoTransform(), dtype=float)
+        self.projection = dataset.GetProjection()
+
+        band = dataset.GetRasterBand(1)
+        self.block_size = tuple(band.GetBlockSize())
+        self.nodata = [dataset.GetRasterBand(b).GetNoDataValue() for b in range(1, self.count + 1)]
+
+        # 默认统计除alpha通道外的所有波段
+        self.data_bands = [b for b in range(1, self.count + 1)
+                           if dataset.GetRasterBand(b).GetColorInterpretation() != gdal.GCI_AlphaBand]
+
+
+def band_range(path, band=1):
+    """波段的概略最小值和最大值, 可使用金字塔和已有的统计, 无法计算时为(nan, nan)"""
+    dataset = gdal.Open(path)
+    try:
+        low, high = dataset.GetRasterBand(band).ComputeRasterMinMax(True)
+    except RuntimeError:
+        return np.nan, np.nan
+    return float(low), float(high)
+
+
+def world_to_pixel(geotransform, xy):
+    """地理坐标(..., 2)转换为像素坐标(列, 行), 支持带旋转项的仿射变换"""
+    gt = geotransform
+    xy = np.asarray(xy, dtype=float)
+    dx = xy[..., 0] - gt[0]
+    dy = xy[..., 1] - gt[3]
+    det = gt[1] * gt[5] - gt[2] * gt[4]
+    col = (gt[5] * dx - gt[2] * dy) / det
+    row = (gt[1] * dy - gt[4] * dx) / det
+    return np.stack([col, row], axis=-1)
+
+
+def pixel_to_world(geotransform, colrow):
+    """像素坐标(列, 行)转换为地理坐标"""
+    gt = geotransform
+    colrow = np.asarray(colrow, dtype=float)
+    x = gt[0] + colrow[..., 0] * gt[1] + colrow[..., 1] * gt[2]
+    y = gt[3] + colrow[..., 0] * gt[4] + colrow[..., 1] * gt[5]
+    return np.stack([x, y], axis=-1)
+
+
+def _rings(polygon):
+    """多边形统一为环的列表, 单个(k, 2)数组视为一个环"""
+    if isinstance(polygon, np.ndarray) and polygon.ndim == 2:
+        return [polygon]
+    return [np.asarray(ring, dtype=float) for ring in polygon]
+
+
+def polygon_windows(polygons, geotransform, width, height):
+    """计算每个多边形覆盖的像素窗口(N, 4): x0, y0, x1, y1, 已裁剪到栅格范围
+
+    与栅格不相交的多边形窗口为空(x1 <= x0 或 y1 <= y0)
+    """
+    if isinstance(polygons, np.ndarray):
+        # (N, k, 2)数组可整体计算
+        px = world_to_pixel(geotransform, polygons)
+        lo = np.floor(px.min(axis=1))
+        hi = np.ceil(px.max(axis=1))
+    else:
+        lo = np.empty((len(polygons), 2))
+        hi = np.empty((len(polygons), 2))
+        for i, polygon in enumerate(polygons):
+            px = world_to_pixel(geotransform, np.concatenate(_rings(polygon)))
+            lo[i] = np.floor(px.min(axis=0))
+            hi[i] = np.ceil(px.max(axis=0))
+
+    windows = np.empty((len(lo), 4), dtype=np.int64)
+    windows[:, 0] = np.clip(lo[:, 0], 0, width)
+    windows[:, 1] = np.clip(lo[:, 1], 0, height)
+    windows[:, 2] = np.clip(hi[:, 0], 0, width)
+    windows[:, 3] = np.clip(hi[:, 1], 0, height)
+    return windows
+
+
+def polygon_mask(polygon, window, geotransform):
+    """窗口内像素中心是否位于多边形内(奇偶规则, 支持多部件和洞), 返回(h, w)布尔数组"""
+    x0, y0, x1, y1 = window
+    cols = np.arange(x0, x1) + 0.5
+    rows = (np.arange(y0, y1) + 0.5)[:, None]
+
+    inside = np.zeros((y1 - y0, x1 - x0), dtype=bool)
+    for ring in _rings(polygon):
+        px = world_to_pixel(geotransform, ring)
+        nxt = np.roll(px, -1, axis=0)
+        for (ax, ay), (bx, by) in zip(px, nxt):
+            if ay == by:
+                continue
+            crosses = (ay > rows) != (by > rows)
+            x_cross = ax + (rows - ay) * (bx - ax) / (by - ay)
+            inside ^= crosses & (cols < x_cross)
+    return inside
+
+
+def plan_tiles(windows, block_size, width, height, tile_size=TILE_SIZE):
+    """按块对齐的瓦片分组多边形, 返回[(瓦片窗口, 多边形索引数组), ...]
+
+    每个多边形按窗口中心归入一个瓦片, 读取窗口扩展到包含其所有多边形,
+    因此每个多边形只在一个瓦片中完整处理(如导出影像块). 窗口超出瓦片向外半个瓦片
+    的多边形单独成为一个瓦片, 读取窗口不超过2倍瓦片大小或单个多边形的窗口.
+    需要逐像素累计的统计应使用tile_polygons()
+    """
+    bx, by = block_size
+    tile_w = max(bx, tile_size // bx * bx)
+    tile_h = max(by, tile_size // by * by)
+
+    valid = np.flatnonzero((windows[:, 2] > windows[:, 0]) & (windows[:, 3] > windows[:, 1]))
+    if len(valid) == 0:
+        return []
+
+    w = windows[valid]
+    tx = ((w[:, 0] + w[:, 2]) // 2) // tile_w
+    ty = ((w[:, 1] + w[:, 3]) // 2) // tile_h
+    stride = width // tile_w + 1
+    key = ty * stride + tx
+
+    # 按瓦片行优先排序, 使读取顺序与文件中块的顺序一致
+    order = np.argsort(key, kind="stable")
+    key = key[order]
+    splits = np.flatnonzero(np.diff(key)) + 1
+
+    def aligned(gw):
+        x0 = gw[:, 0].min() // bx * bx
+        y0 = gw[:, 1].min() // by * by
+        x1 = min(width, -(-gw[:, 2].max() // bx) * bx)
+        y1 = min(height, -(-gw[:, 3].max() // by) * by)
+        return int(x0), int(y0), int(x1), int(y1)
+
+    tiles = []
+    for group, k in zip(np.split(order, splits), key[np.r_[0, splits]]):
+        gw = w[group]
+        lx, ly = k % stride * tile_w - tile_w // 2, k // stride * tile_h - tile_h // 2
+        inside = ((gw[:, 0] >= lx) & (gw[:, 1] >= ly)
+                  & (gw[:, 2] <= lx + 2 * tile_w) & (gw[:, 3] <= ly + 2 * tile_h))
+        if inside.any():
+            tiles.append((aligned(gw[inside]), valid[group[inside]]))
+        for j in np.flatnonzero(~inside):
+            tiles.append((aligned(gw[j:j + 1]), valid[group[j:j + 1]]))
+    return tiles
+
+
+def tile_polygons(windows, width, height, block_size, tile_size=TILE_SIZE):
+    """将多边形分配到与其窗口相交的所有块对齐瓦片, 返回[(瓦片窗口, 多边形索引数组), ...]
+
+    与plan_tiles不同, 瓦片大小固定, 跨越瓦片的多边形在各瓦片中分别统计后合并
+    """
+    bx, by = block_size
+    tile_w = max(bx, tile_size // bx * bx)
+    tile_h = max(by, tile_size // by * by)
+
+    tiles = {}
+    for i, (x0, y0, x1, y1) in enumerate(windows):
+        if x1 <= x0 or y1 <= y0:
+            continue
+        for ty in range(y0 // tile_h, (y1 - 1) // tile_h + 1):
+            for tx in range(x0 // tile_w, (x1 - 1) // tile_w + 1):
+                tiles.setdefault((ty, tx), []).append(i)
+
+    # 按行优先排序, 使读取顺序与文件中块的顺序一致
+    return [((tx * tile_w, ty * tile_h, min((tx + 1) * tile_w, width),
+              min((ty + 1) * tile_h, height)), np.array(tiles[ty, tx]))
+            for ty, tx in sorted(tiles)]
+
+
+def tile_counts(tiles, n):
+    """每个多边形所在的瓦片数(n,), 用于判断其所有瓦片是否已合并"""
+    if not tiles:
+        return np.zeros(n, dtype=np.int64)
+    return np.bincount(np.concatenate([indices for _, indices in tiles]).astype(np.int64),
+                       minlength=n)
+
+
+def block_windows(width, height, block_size, tile_size=TILE_SIZE):
+    """将整个栅格划分为块对齐的瓦片窗口(x0, y0, x1, y1), 按行优先排列"""
+    bx, by = block_size
+    tile_w = max(bx, tile_size // bx * bx)
+    tile_h = max(by, tile_size // by * by)
+    return [(x0, y0, min(x0 + tile_w, width), min(y0 + tile_h, height))
+            for y0 in range(0, height, tile_h)
+            for x0 in range(0, width, tile_w)]
+
+
+def read_window(dataset, window, bands, dtype=np.float32):
+    """读取窗口内的指定波段, 返回数据(b, h, w)和有效像素掩膜(b, h, w)
+
+    数据由GDAL直接读入dtype(默认float32)的数组, 不经过其他类型的中间副本;
+    掩膜来自GDAL掩膜波段, 包括nodata值和alpha通道
+    """
+    x0, y0, x1, y1 = window
+    w, h = x1 - x0, y1 - y0
+    data = np.empty((len(bands), h, w), dtype=dtype)
+    valid = np.empty((len(bands), h, w), dtype=bool)
+    for i, b in enumerate(bands):
+        band = dataset.GetRasterBand(b)
+        band.ReadAsArray(x0, y0, w, h, buf_obj=data[i])
+        if band.GetMaskFlags() & gdal.GMF_ALL_VALID:
+            valid[i] = True
+        else:
+            valid[i] = band.GetMaskBand().ReadAsArray(x0, y0, w, h) > 0
+    return data, valid
+
+
+class _ThreadDatasets(threading.local):
+
+    """每个线程单独打开栅格, GDAL数据集不能在线程间共享"""
+
+    def __init__(self, path):
+        self.path = path
+        self.dataset = None
+
+    def get(self):
+        if self.dataset is None:
+            self.dataset = gdal.Open(self.path)
+        return self.dataset
+
+
+def map_tiles(path, tiles, func, max_workers=None):
+    """在线程池中处理各瓦片, 按输入顺序逐个返回func(dataset, window, indices)的结果
+
+    GDAL读取和NumPy计算期间会释放GIL, 因此线程池即可并行;
+    QGIS内嵌的解释器也无法可靠地使用进程池.
+    同时处理的瓦片数不超过线程数的2倍, 结果未被取走时不会继续读取, 内存占用有上限
+    """
+    datasets = _ThreadDatasets(path)
+    max_workers = max_workers or min(32, (os.cpu_count() or 1) + 4)
+
+    def work(tile):
+        window, indices = tile
+        return func(datasets.get(), window, indices)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        pending = deque()
+        for tile in tiles:
+            pending.append(pool.submit(work, tile))
+            if len(pending) >= 2 * max_workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
@@ -0,0 +1,211 @@
+# File: tasks
+# Author: Haozhou Wang
+# Organization: UTOkyo FieldPhenomics Lab
+# Description:
+#     Cancellable background tasks (QgsTask) for subplot division, zonal statistics,
+#     canopy cover and writing
+# Dependencies:
+#     - Python 3.x
+#     - QGIS 3.x
+# License: MIT
+# Usage:
+#     fields, blocks = api.prepare_blocks(layer, rows=10, cols=4)   # 主线程读取图层
+#     task = SubplotDivisionTask("Subplot division", blocks, fields, layer.crs(),
+#                                "subplots.gpkg", on_finished=callback)
+#     start_task(task)
+
+import os
+
+import numpy as np
+from qgis.core import QgsApplication, QgsCoordinateTransform, QgsProject, QgsTask
+
+from . import api
+from .batch import divide_block
+from .trace import RunTrace
+
+# 正在运行的任务, 保留Python引用以免任务对象在完成前被回收
+_running_tasks = set()
+
+
+def split_blocks(blocks, groups):
+    """将区块按顺序分为不超过groups组, 各组大小相近"""
+    groups = max(1, min(groups, len(blocks)))
+    bounds = np.linspace(0, len(blocks), groups + 1).round().astype(int)
+    return [blocks[bounds[i]:bounds[i + 1]] for i in range(groups)]
+
+
+class BlockGroupTask(QgsTask):
+
+    """一组区块的网格计算, 分区统计和植被覆盖度, 作为SubplotDivisionTask的子任务并行执行"""
+
+    def __init__(self, description, blocks, zonal=None, max_workers=None, cover=None,
+                 trace=None, label="group"):
+        super().__init__(description, QgsTask.CanCancel)
+        self.blocks = blocks
+        self.trace = trace or RunTrace(label, enabled=False)
+        self.label = label
+        self.zonal = zonal
+        self.cover = cover
+        self.max_workers = max_workers
+        self.results = []
+        self.stats = None
+        self.exception = None
+
+    def run(self):
+        try:
+            # 网格计算和每个栅格阶段平分进度
+            stages = [("zonal", api.results_zonal_statistics, self.zonal),
+                      ("cover", api.results_canopy_cover, self.cover)]
+            stages = [stage for stage in stages if stage[2] is not None]
+            share = 100 / (len(stages) + 1)
+            with self.trace.stage(f"grid {self.label}", parallel=True) as stage:
+                for i, block in enumerate(self.blocks):
+                    if self.isCanceled():
+                        return False
+                    self.results.append(divide_block(block))
+                    self.setProgress(share * (i + 1) / len(self.blocks))
+                count = stage.count = sum(len(r.grid) for r in self.results)
+
+            # 各阶段的结果按列拼接, 顺序与字段一致
+            columns = []
+            for k, (name, func, config) in enumerate(stages):
+                start = share * (k + 1)
+                with self.trace.stage(f"{name} {self.label}", count=count, parallel=True):
+                    columns.append(func(self.results, config, self.max_workers,
+                                        progress=lambda f, start=start: self._stats_progress(
+                                            start, share, f)))
+                if self.isCanceled():
+                    return False
+            if columns:
+                self.stats = np.hstack(columns)
+            return not self.isCanceled()
+        except Exception as e:
+            self.exception = e
+            return False
+
+    def _stats_progress(self, start, share, fraction):
+        self.setProgress(start + share * fraction)
+        return not self.isCanceled()
+
+
+class SubplotDivisionTask(QgsTask):
+
+    """后台分割子地块并写出, 完成后在主线程中将结果图层加入项目
+
+    各组区块作为子任务并行计算网格, 分区统计和植被覆盖度(cover, api.CoverConfig),
+    全部完成后本任务逐批写出要素;
+    transform为到输出坐标系crs的转换(可为None); output_path为空时写入临时图层.
+    fieldbook为api.FieldBookConfig, 记录本属性在写出时随要素一次写入;
+    trace为trace.RunTrace, 记录各阶段的耗时和内存, 在finished()中输出.
+    on_finished(task, layer, exception)在主线程中调用, 取消时layer和exception均为None
+    """
+
+    def __init__(self, description, blocks, fields, crs, output_path=None, zonal=None,
+                 transform=None, transform_context=None, on_finished=None,
+                 layer_name="subplots_temp", max_workers=None, cover=None, trace=None,
+                 fieldbook=None):
+        super().__init__(description, QgsTask.CanCancel)
+        self.trace = trace or RunTrace("subplot_division", enabled=False)
+        self.fields = fields
+        self.crs = crs
+        self.transform = transform
+        self.output_path = output_path
+        self.transform_context = transform_context
+        self.on_finished = on_finished
+        self.layer_name = layer_name
+        self.fieldbook = fieldbook
+        self.total = 0
+        self.layer = None
+        self.exception = None
+
+        if fieldbook is not None:
+            for field in api.fieldbook_fields(fieldbook):
+                self.fields.append(field)
+        for config in (zonal, cover):
+            if config is not None:
+                for field in api.zonal_fields(config.names):
+                    self.fields.append(field)
+
+        # 区块组数不超过CPU数, 各组内的瓦片读取共享剩余线程
+        cpus = os.cpu_count() or 1
+        groups = split_blocks(blocks, max_workers or cpus)
+        workers = max(1, (max_workers or cpus) // len(groups)) if groups else 1
+        self.subtasks = []
+        for i, group in enumerate(groups):
+            subtask = BlockGroupTask(f"{description} ({i + 1}/{len(groups)})", group,
+                                     zonal, workers, cover, self.trace,
+                                     label=f"{i + 1}/{len(groups)}")
+            self.subtasks.append(subtask)
+            self.addSubTask(subtask, [], QgsTask.ParentDependsOnSubTask)
+
+    def run(self):
+        try:
+            results = [r for subtask in self.subtasks for r in subtask.results]
+            stats = None
+            if any(subtask.stats is not None for subtask in self.subtasks):
+                stats = np.concatenate([subtask.stats for subtask in self.subtasks])
+            self.total = sum(len(r.grid) for r in results)
+            records = None
+            if self.fieldbook is not None:
+                with self.trace.stage("fieldbook", count=self.total):
+                    records = api.results_fieldbook(results, self.fieldbook)
+
+            # 转换在本线程中使用副本
+            transform = (QgsCoordinateTransform(self.transform)
+                         if self.transform is not None else None)
+            chunks = api.iter_subplot_features(self.fields, results, extra=stats,
+                                               transform=transform, records=records)
+            with self.trace.stage("write", count=self.total):
+                if self.output_path:
+                    api.write_subplots(self.fields, chunks, self.crs, self.output_path,
+                                       self.transform_context, feedback=self._write_progress)
+                else:
+                    self.layer = api.create_memory_layer(
+                        self.fields, self._track(chunks), self.crs, self.layer_name)
+                    # 图层在本线程中创建, 交给主线程后才能加入项目
+                    self.layer.moveToThread(QgsApplication.instance().thread())
+            return not self.isCanceled()
+        except Exception as e:
+            self.exception = e
+            return False
+
+    def _write_progress(self, written):
+        self.setProgress(100 * written / max(1, self.total))
+        return not self.isCanceled()
+
+    def _track(self, chunks):
+        """逐批传递要素并更新进度, 取消时停止生成"""
+        written = 0
+        for chunk in chunks:
+            yield chunk
+            written += len(chunk)
+            if self._write_progress(written) is False:
+                return
+
+    def finished(self, result):
+        """主线程: 加入结果图层并回调"""
+        _running_tasks.discard(self)
+        layer = None
+        exception = self.exception or next(
+            (s.exception for s in self.subtasks if s.exception is not None), None)
+
+        if result and exception is None:
+            try:
+                with self.trace.stage("reload", count=self.total):
+                    layer = self.layer or api.open_output(self.output_path)
+                    QgsProject.instance().addMapLayer(layer)
+            except Exception as e:
+                layer, exception = None, e
+        self.trace.info.update(subplots=self.total, output=self.output_path,
+                               result="error" if exception else ("ok" if result else "canceled"))
+        self.trace.finish()
+
+        if self.on_finished is not None:
+            self.on_finished(self, layer, exception)
+
+
+def start_task(task):
+    """提交到QGIS任务管理器, 并保留引用直到任务结束"""
+    _running_tasks.add(task)
+    QgsApplication.taskManager().addTask(task)
+    return task
@@ -0,0 +1,183 @@
+# File: trace
+# Author: Haozhou Wang
+# Organization: UTOkyo FieldPhenomics Lab
+# Description:
+#     Stage-level timing and memory instrumentation of a subplot division run:
+#     wall time, feature counts and tracemalloc peak per stage (no Qt / QGIS)
+# Dependencies:
+#     - Python 3.x
+# License: MIT
+# Usage:
+#     trace = RunTrace("subplot_division", log=print)   # FIELDIMAGEPY_TRACE=1时启用
+#     with trace.stage("grid") as stage:
+#         stage.count = len(cells)
+#     trace.finish()
+#
+#     FIELDIMAGEPY_TRACE=1                  记录并输出到日志
+#     FIELDIMAGEPY_TRACE_DIR=/path/to/dir   同时在该目录写出每次运行的JSON记录
+
+import json
+import os
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+ENV_TRACE = "FIELDIMAGEPY_TRACE"
+ENV_TRACE_DIR = "FIELDIMAGEPY_TRACE_DIR"
+
+
+def trace_enabled():
+    """环境变量FIELDIMAGEPY_TRACE是否启用记录(1, true, yes, on)"""
+    return os.environ.get(ENV_TRACE, "").strip().lower() in ("1", "true", "yes", "on")
+
+
+class _NullStage:
+
+    """未启用时的阶段, 不做任何事(共享同一个实例, 设置count被忽略)"""
+
+    count = None
+
+    def __setattr__(self, name, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class Stage:
+
+    """一个阶段的计时, 作为上下文管理器使用; count为该阶段处理的要素数(可在阶段内设置)
+
+    tracemalloc只有一个进程级的峰值. 串行阶段开始时重置峰值, 记录该阶段的峰值;
+    parallel为True的阶段与其他阶段同时运行, 不重置峰值(否则会清除其他阶段的峰值),
+    记录的是自上一个串行阶段以来整个进程的峰值(memory为"process")
+    """
+
+    def __init__(self, trace, name, count=None, parallel=False):
+        self.trace = trace
+        self.name = name
+        self.count = count
+        self.parallel = parallel
+
+    def __enter__(self):
+        if not self.parallel:
+            self.trace._reset_peak()
+        self._memory = 0 if self.parallel else tracemalloc.get_traced_memory()[0]
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self._start
+        current, peak = tracemalloc.get_traced_memory()
+        self.trace._record(dict(
+            stage=self.name,
+            thread=threading.current_thread().name,
+            start=self._start - self.trace.start,
+            seconds=seconds,
+            count=self.count,
+            memory="process" if self.parallel else "stage",
+            peak_mb=(peak - self._memory) / 2 ** 20,
+            delta_mb=None if self.parallel else (current - self._memory) / 2 ** 20,
+            error=None if exc_type is None else exc_type.__name__,
+        ))
+        return False
+
+
+class RunTrace:
+
+    """一次运行的各阶段记录, 结束时输出到日志并可写出JSON
+
+    enabled为None时由环境变量决定; 未启用时stage()返回空操作的上下文, 开销可忽略.
+    启用时开启tracemalloc(会使Python分配变慢), 结束时关闭.
+    log(文本)为日志输出函数, 如api.log_message;
+    trace_dir为JSON记录的目录(默认为环境变量FIELDIMAGEPY_TRACE_DIR, 为空时不写出).
+    各阶段可在不同线程中记录, 同时运行的阶段需以parallel=True记录;
+    整个运行的内存峰值在结束时记录为info["peak_mb"]
+    """
+
+    def __init__(self, name, enabled=None, log=None, trace_dir=None):
+        self.name = name
+        self.enabled = trace_enabled() if enabled is None else bool(enabled)
+        self.log = log
+        self.trace_dir = trace_dir or os.environ.get(ENV_TRACE_DIR) or None
+        self.stages = []
+        self.info = {}
+        self._lock = threading.Lock()
+        self._started_tracing = False
+        self._peak = 0
+        self.start = time.perf_counter()
+        if self.enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    def stage(self, name, count=None, parallel=False):
+        """阶段的上下文管理器, 如 with trace.stage("write", count=n): ...
+
+        parallel为True表示该阶段与其他阶段同时运行(如各区块组的子任务)
+        """
+        if not self.enabled:
+            return _NULL_STAGE
+        return Stage(self, name, count, parallel)
+
+    def _reset_peak(self):
+        """重置tracemalloc的峰值, 之前的峰值计入整个运行的峰值"""
+        with self._lock:
+            self._peak = max(self._peak, tracemalloc.get_traced_memory()[1])
+            if hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()
+
+    def _record(self, record):
+        with self._lock:
+            self.stages.append(record)
+
+    def summary(self):
+        """各阶段的文本摘要(按开始时间排序)"""
+        total = time.perf_counter() - self.start
+        lines = [f"{self.name}: {total:.3f} s"]
+        for r in sorted(self.stages, key=lambda r: r["start"]):
+            count = f"{r['count']:>10,}" if r["count"] is not None else " " * 10
+            error = f"  [{r['error']}]" if r["error"] else ""
+            scope = "process" if r["memory"] == "process" else "peak"
+            lines.append(f"  {r['stage']:<24} {r['seconds']:9.3f} s {count}  "
+                         f"{scope:>7} {r['peak_mb']:8.1f} MB  ({r['thread']}){error}")
+        if "peak_mb" in self.info:
+            lines.append(f"  {'run peak':<24} {self.info['peak_mb']:8.1f} MB")
+        return "\n".join(lines)
+
+    def finish(self):
+        """输出摘要到日志, 写出JSON记录并关闭tracemalloc; 返回JSON路径(未写出时为None)"""
+        if not self.enabled:
+            return None
+        if tracemalloc.is_tracing():
+            self._reset_peak()
+            self.info["peak_mb"] = self._peak / 2 ** 20
+        if self.log is not None:
+            self.log(self.summary())
+
+        path = None
+        if self.trace_dir:
+            stamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+            path = os.path.join(self.trace_dir, f"{self.name}_{stamp}.json")
+            report = dict(name=self.name, seconds=time.perf_counter() - self.start,
+                          info=self.info, stages=self.stages)
+            try:
+                os.makedirs(self.trace_dir, exist_ok=True)
+                with open(path, "w", encoding="utf-8") as f:
+                    json.dump(report, f, indent=1)
+            except OSError as e:
+                path = None
+                if self.log is not None:
+                    self.log(f"Cannot write the trace file: {e}")
+
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        self.enabled = False
+        return path
@@ -0,0 +1,214 @@
+# File: zonal
+# Author: Haozhou Wang
+# Organization: UTOkyo FieldPhenomics Lab
+# Description:
+#     Per-subplot zonal statistics with windowed, tiled raster reads (no Qt / QGIS)
+# Dependencies:
+#     - Python 3.x
+#     - NumPy
+#     - GDAL (osgeo, shipped with QGIS)
+# License: MIT
+
+import numpy as np
+
+from .raster import (TILE_SIZE, RasterInfo, _ThreadDatasets, map_tiles, polygon_mask,
+                     polygon_windows, read_window, tile_counts, tile_polygons)
+
+STATISTICS = ("count", "mean", "median", "std", "min", "max")
+
+
+def stat_names(bands, statistics=STATISTICS, percentiles=()):
+    """统计结果的字段名, 如b1_mean, b1_p90 (不超过Shapefile的10个字符)"""
+    names = []
+    for b in bands:
+        names.extend(f"b{b}_{s}" for s in statistics)
+        names.extend(f"b{b}_p{p:g}" for p in percentiles)
+    return names
+
+
+def _values_stats(values, statistics, percentiles):
+    """一个波段内有效像素值的统计"""
+    if len(values) == 0:
+        return [0 if s == "count" else np.nan for s in statistics] + [np.nan] * len(percentiles)
+
+    values = values.astype(np.float64)
+    funcs = {
+        "count": len,
+        "mean": np.mean,
+        "median": np.median,
+        "std": np.std,
+        "min": np.min,
+        "max": np.max,
+        "sum": np.sum,
+    }
+    out = [funcs[s](values) for s in statistics]
+    if percentiles:
+        out.extend(np.percentile(values, percentiles))
+    return out
+
+
+def _bands_stats(values, statistics, percentiles):
+    """各波段有效像素值的统计, 按波段顺序拼接"""
+    return [v for band_values in values for v in _values_stats(band_values, statistics,
+                                                                percentiles)]
+
+
+class ZonalPlan:
+
+    """子地块在一个栅格网格上的像素窗口和瓦片分组
+
+    瓦片大小固定, 跨越瓦片的子地块在各瓦片中分别读取, spans为每个子地块所在的瓦片数.
+    只取决于地理变换, 栅格大小和块大小, 因此同一网格的多期栅格
+    (如配准后同一分辨率的多期正射影像)可共享同一个计划, 逐瓦片一起统计
+    """
+
+    def __init__(self, polygons, info, tile_size=TILE_SIZE):
+        self.polygons = polygons
+        self.geotransform = info.geotransform
+        self.windows = polygon_windows(polygons, info.geotransform, info.width, info.height)
+        self.tiles = tile_polygons(self.windows, info.width, info.height, info.block_size,
+                                   tile_size)
+        self.spans = tile_counts(self.tiles, len(self.windows))
+
+    @staticmethod
+    def key(info, tile_size=TILE_SIZE):
+        """计划的键, 网格相同的栅格键相同"""
+        return (tuple(info.geotransform), info.width, info.height, info.block_size, tile_size)
+
+    def mask(self, i, window=None):
+        """第i个子地块在window(默认为其整个窗口)内的掩膜"""
+        window = self.windows[i] if window is None else window
+        return polygon_mask(self.polygons[i], window, self.geotransform)
+
+
+def _plan_statistics(paths, plan, date_bands, statistics, percentiles, max_workers=None,
+                     progress=None):
+    """在同一网格的多期栅格上逐瓦片统计, 返回每期的统计数组(N, 字段数)列表
+
+    每个瓦片中子地块的掩膜只计算一次, 应用于各期同一窗口的读取结果;
+    各期依次读取, 同时只保留一期的瓦片数据
+    """
+    n_stats = len(statistics) + len(percentiles)
+    windows = plan.windows
+    datasets = [_ThreadDatasets(path) for path in paths]
+
+    # 不与栅格相交的子地块保持为空值
+    results = []
+    for bands in date_bands:
+        result = np.full((len(windows), len(bands) * n_stats), np.nan)
+        if "count" in statistics:
+            for k in range(len(bands)):
+                result[:, k * n_stats + statistics.index("count")] = 0
+        results.append(result)
+
+    def tile_stats(dataset, window, indices):
+        # 子地块窗口与瓦片的交集及其掩膜
+        parts = []
+        for i in indices:
+            x0, y0 = max(windows[i][0], window[0]), max(windows[i][1], window[1])
+            x1, y1 = min(windows[i][2], window[2]), min(windows[i][3], window[3])
+            local = np.s_[y0 - window[1]:y1 - window[1], x0 - window[0]:x1 - window[0]]
+            parts.append((i, local, plan.mask(i, (x0, y0, x1, y1))))
+
+        dates = []
+        for d, bands in enumerate(date_bands):
+            data, valid = read_window(dataset if d == 0 else datasets[d].get(), window, bands)
+            done, out, pieces = [], [], []
+            for i, local, mask in parts:
+                values = [data[k][local][mask & valid[k][local]] for k in range(len(bands))]
+                if plan.spans[i] == 1:
+                    done.append(i)
+                    out.append(_bands_stats(values, statistics, percentiles))
+                else:
+                    pieces.append((i, values))
+            dates.append((done, out, pieces))
+        return dates
+
+    # 跨越瓦片的子地块: 各瓦片中的像素值, 所有瓦片读取后统计并释放
+    remaining = plan.spans.copy()
+    pending = {}
+    tiles = plan.tiles
+    for n, dates in enumerate(map_tiles(paths[0], tiles, tile_stats, max_workers)):
+        for d, (done, out, pieces) in enumerate(dates):
+            if done:
+                results[d][done] = out
+            for i, values in pieces:
+                pending.setdefault((d, i), []).append(values)
+        for i, _ in dates[0][2]:
+            remaining[i] -= 1
+            if remaining[i] > 0:
+                continue
+            for d in range(len(paths)):
+                values = [np.concatenate(p) for p in zip(*pending.pop((d, i)))]
+                results[d][i] = _bands_stats(values, statistics, percentiles)
+        if progress is not None and progress((n + 1) / len(tiles)) is False:
+            break
+
+    return results
+
+
+def zonal_statistics(path, polygons, bands=None, statistics=STATISTICS, percentiles=(),
+                     tile_size=TILE_SIZE, max_workers=None, progress=None, plan=None):
+    """计算每个多边形内各波段的统计值, 返回(N, 字段数)数组, 与stat_names()的顺序一致
+
+    polygons为与栅格同一坐标系的子地块角点(N, 4, 2), 或环的列表;
+    只读取与子地块相交的块对齐瓦片, 读取窗口不超过瓦片大小; 跨越瓦片的子地块
+    保留各瓦片中的像素值, 其所有瓦片读取后再统计, 因此统计值是精确的.
+    plan为同一网格上已有的ZonalPlan, 可复用窗口; 未给出时新建.
+    progress(已完成比例)返回False时取消, 未处理的子地块保持初始值
+    """
+    info = RasterInfo(path)
+    bands = list(bands or info.data_bands)
+    if plan is None:
+        plan = ZonalPlan(polygons, info, tile_size)
+    return _plan_statistics([path], plan, [bands], statistics, list(percentiles), max_workers,
+                            progress)[0]
+
+
+def zonal_time_series(paths, polygons, bands=None, statistics=STATISTICS, percentiles=(),
+                      tile_size=TILE_SIZE, max_workers=None, progress=None):
+    """对多期栅格计算同一组子地块的统计, 返回每期的(波段列表, 统计数组)列表
+
+    polygons为所有栅格共用的子地块角点数组(N, 4, 2), 或与paths等长的列表(每期一组子地块,
+    同一对象的各期视为同一组);
+    地理变换和大小相同的栅格共享ZonalPlan, 各期逐瓦片一起统计, 窗口和掩膜只计算一次.
+    各组网格依次计算, 组内瓦片并行; progress(已完成比例)返回False时取消,
+    未开始的组的结果为None
+    """
+    paths = list(paths)
+    polygon_sets = list(polygons) if isinstance(polygons, list) else [polygons] * len(paths)
+    infos = [RasterInfo(path) for path in paths]
+
+    groups = {}
+    for d, (info, polygon_set) in enumerate(zip(infos, polygon_sets)):
+        key = (id(polygon_set),) + ZonalPlan.key(info, tile_size)
+        groups.setdefault(key, []).append(d)
+
+    results = [None] * len(paths)
+    for g, dates in enumerate(groups.values()):
+        plan = ZonalPlan(polygon_sets[dates[0]], infos[dates[0]], tile_size)
+        date_bands = [list(bands or infos[d].data_bands) for d in dates]
+        canceled = False
+
+        def group_progress(fraction, g=g):
+            nonlocal canceled
+            canceled = (progress is not None
+                        and progress((g + fraction) / len(groups)) is False)
+            return not canceled
+
+        values = _plan_statistics([paths[d] for d in dates], plan, date_bands, statistics,
+                                  list(percentiles), max_workers, group_progress)
+        for d, date_band, value in zip(dates, date_bands, values):
+            results[d] = (date_band, value)
+        if canceled:
+            break
+    return results
+
+
+def long_format(values, bands, statistics=STATISTICS, percentiles=()):
+    """将一期的统计数组(N, 波段数×统计数)转换为长表, 逐行返回(子地块序号, 波段, 统计值列表)"""
+    n_stats = len(statistics) + len(percentiles)
+    table = np.asarray(values).reshape(len(values), len(bands), n_stats)
+    for i in range(len(table)):
+        for k, band in enumerate(bands):
+            yield i, band, table[i, k]
@@ -0,0 +1,14 @@
+# File: conftest
+# Author: Haozhou Wang
+# Organization: UTOkyo FieldPhenomics Lab
+# Description:
+#     pytest setup: make the fieldimagepy package (../pyscripts) importable
+# License: MIT
+
+import os
+import sys
+
+_pyscripts_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                              "pyscripts")
+if _pyscripts_dir not in sys.path:
+    sys.path.insert(0, _pyscripts_dir)
@@ -0,0 +1,69 @@
+# File: test_autofit
+# Author: Haozhou Wang
+# Organization: UTOkyo FieldPhenomics Lab
+# Description:
+#     Plot counts detected from synthetic vegetation profiles (fit_axis)
+# License: MIT
+
+import numpy as np
+import pytest
+
+pytest.importorskip("osgeo")
+
+from fieldimagepy.autofit import fit_axis, loose_margins, GridFit
+
+
+def synthetic_profile(n_plots, plot=1.5, gap=0.5, samples=1024, crop=None, supersample=16,
+                      margin=0.0):
+    """植被指数剖面(采样点平均, 与降采样读取一致), 返回(剖面, 总长)
+
+    crop为子地块内作物行的周期(米), None时子地块内均匀; margin为两端的空白(米)
+    """
+    period = plot + gap
+    length = n_plots * period - gap + 2 * margin
+    x = (np.arange(samples * supersample) + 0.5) / (samples * supersample) * length
+    phase = np.where(x < margin, plot, np.mod(x - margin, period))
+    profile = (phase < plot).astype(float)
+    if crop:
+        profile *= 0.5 + 0.5 * np.cos(2 * np.pi * phase / crop)
+    return profile.reshape(samples, supersample).mean(axis=1), length
+
+
+@pytest.mark.parametrize("samples", [1024, 700, 333])
+def test_non_integer_period(samples):
+    # 周期不是整数个采样点时, 整数倍处的峰值可能略高于基频
+    profile, length = synthetic_profile(30, samples=samples)
+    fit = fit_axis(profile, length)
+    assert fit.count == 30
+    assert fit.period == pytest.approx(2.0, rel=0.01)
+
+
+@pytest.mark.parametrize("n_plots", [10, 20, 30, 40, 55])
+@pytest.mark.parametrize("crop", [0.3, 0.25])
+def test_crop_rows(n_plots, crop):
+    # 子地块内的作物行(短于MIN_PERIOD)不影响子地块数
+    profile, length = synthetic_profile(n_plots, samples=1024, crop=crop)
+    assert fit_axis(profile, length).count == n_plots
+
+
+@pytest.mark.parametrize("plot, gap, n_plots", [(1.2, 0.3, 47), (3.0, 0.6, 60), (5.0, 1.0, 25),
+                                                (0.9, 0.25, 90)])
+def test_plot_sizes(plot, gap, n_plots):
+    rng = np.random.default_rng(0)
+    profile, length = synthetic_profile(n_plots, plot, gap, samples=1024, crop=0.3)
+    profile += rng.normal(0, 0.15, len(profile))
+    fit = fit_axis(profile, length)
+    assert fit.count == n_plots
+    assert fit.period == pytest.approx(plot + gap, rel=0.01)
+
+
+@pytest.mark.parametrize("margin", [0.0, 0.3, 0.45])
+def test_margin(margin):
+    # 边界与子地块之间的空白由相位和end给出, 不影响子地块数
+    profile, length = synthetic_profile(40, margin=margin)
+    fit = fit_axis(profile, length)
+    assert fit.count == 40
+    assert fit.phase == pytest.approx(margin, abs=0.03)
+    assert fit.end == pytest.approx(margin, abs=0.03)
+    loose = loose_margins(GridFit(1, 40, fit.buffer, 0.0, fit, fit))
+    assert (loose is None) == (margin < 0.2)
@@ -0,0 +1,68 @@
+# File: test_fieldbook
+# Author: Haozhou Wang
+# Organization: UTOkyo FieldPhenomics Lab
+# Description:
+#     Field-book planting orders (row / column major, serpentine, start corner)
+#     and the record count check
+# License: MIT
+
+import numpy as np
+import pytest
+
+from fieldimagepy.errors import FieldShapeError
+from fieldimagepy.fieldbook import (FieldBook, START_CORNERS, check_count, fieldbook_positions,
+                                    plot_order)
+
+
+def test_row_major():
+    np.testing.assert_array_equal(plot_order(2, 3), [[0, 1, 2], [3, 4, 5]])
+    np.testing.assert_array_equal(plot_order(2, 3, serpentine=True), [[0, 1, 2], [5, 4, 3]])
+
+
+def test_column_major():
+    np.testing.assert_array_equal(plot_order(2, 3, by="column"), [[0, 2, 4], [1, 3, 5]])
+    np.testing.assert_array_equal(plot_order(2, 3, by="column", serpentine=True),
+                                  [[0, 3, 4], [1, 2, 5]])
+
+
+@pytest.mark.parametrize("start, first", [("row1_col1", (0, 0)), ("row1_colN", (0, 3)),
+                                          ("rowN_col1", (2, 0)), ("rowN_colN", (2, 3))])
+@pytest.mark.parametrize("by", ["row", "column"])
+@pytest.mark.parametrize("serpentine", [False, True])
+def test_start_corners(start, first, by, serpentine):
+    order = plot_order(3, 4, by, serpentine, start)
+    # 每个子地块一个顺序号, 第一个位于起始角
+    np.testing.assert_array_equal(np.sort(order.ravel()), np.arange(12))
+    assert order[first] == 0
+
+    # 相邻顺序号的子地块: 蛇形时总是相邻, 否则只在换行(列)时跳跃
+    r, c = np.unravel_index(np.argsort(order.ravel()), order.shape)
+    steps = np.abs(np.diff(r)) + np.abs(np.diff(c))
+    jumps = np.count_nonzero(steps != 1)
+    assert jumps == (0 if serpentine else (2 if by == "row" else 3))
+
+
+def test_unknown_order():
+    with pytest.raises(ValueError):
+        plot_order(2, 2, by="diagonal")
+    with pytest.raises(ValueError):
+        plot_order(2, 2, start="center")
+    assert len(START_CORNERS) == 4
+
+
+def test_blocks_positions():
+    # 多个区块按顺序接续编号
+    positions = fieldbook_positions([(2, 2), (1, 3)], serpentine=True)
+    np.testing.assert_array_equal(positions, [0, 1, 3, 2, 4, 5, 6])
+    assert len(fieldbook_positions([])) == 0
+
+
+def test_count_mismatch():
+    book = FieldBook(["plot", "variety"], [(1, "a"), (2, "b"), (3, "c")])
+    check_count(book, 3)
+    with pytest.raises(FieldShapeError) as e:
+        check_count(book, 4)
+    assert e.value.key == "errFieldBookCount"
+    assert e.value.detail == "3 / 4"
+    # 超出记录本范围的行号为全空记录
+    assert book.take([2, 0, 5]) == [(3, "c"), (1, "a"), (None, None)]
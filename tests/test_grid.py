@@ -0,0 +1,146 @@
+# File: test_grid
+# Author: Haozhou Wang
+# Organization: UTOkyo FieldPhenomics Lab
+# Description:
+#     Even division of a rotated rectangle (SubplotGrid.from_rectangle), the shared
+#     lattice, the WKB encoding of the cells, point location and the alley cells
+# License: MIT
+
+import struct
+
+import numpy as np
+import pytest
+
+from fieldimagepy.errors import FieldShapeError
+from fieldimagepy.grid import SubplotGrid, cells_to_wkb
+
+
+def rotated_rect(width, height, angle, origin=(100.0, 200.0)):
+    """以origin为第0个顶点, 旋转angle(度)的矩形(4, 2), 顶点顺序与min_area_rectangle一致"""
+    a = np.radians(angle)
+    x_axis = np.array([np.cos(a), np.sin(a)])
+    y_axis = np.array([-np.sin(a), np.cos(a)])
+    o = np.asarray(origin, dtype=float)
+    return np.array([o, o + width * x_axis, o + width * x_axis + height * y_axis,
+                     o + height * y_axis])
+
+
+@pytest.mark.parametrize("x_buffer, y_buffer", [(0.0, 0.0), (0.5, 0.25)])
+def test_from_rectangle(x_buffer, y_buffer):
+    rect = rotated_rect(20.0, 9.0, 30.0)
+    grid = SubplotGrid.from_rectangle(rect, 3, 4, x_buffer, y_buffer)
+    cells = grid.cells()
+    assert grid.shape == (3, 4)
+    assert cells.shape == (12, 4, 2)
+
+    # 子地块尺寸均分, 相邻子地块之间为间距
+    width = (20.0 - 3 * x_buffer) / 4
+    height = (9.0 - 2 * y_buffer) / 3
+    np.testing.assert_allclose(np.linalg.norm(cells[:, 1] - cells[:, 0], axis=1), width)
+    np.testing.assert_allclose(np.linalg.norm(cells[:, 3] - cells[:, 0], axis=1), height)
+    np.testing.assert_allclose(np.linalg.norm(cells[1, 0] - cells[0, 1]), x_buffer, atol=1e-9)
+    np.testing.assert_allclose(np.linalg.norm(cells[4, 0] - cells[0, 3]), y_buffer, atol=1e-9)
+
+    # 第一个和最后一个子地块与矩形的角点重合
+    np.testing.assert_allclose(cells[0, 0], rect[0])
+    np.testing.assert_allclose(cells[-1, 2], rect[2])
+
+    row_idx, col_idx = grid.indices()
+    np.testing.assert_array_equal(row_idx, np.repeat(np.arange(3), 4))
+    np.testing.assert_array_equal(col_idx, np.tile(np.arange(4), 3))
+
+
+def test_from_rectangle_invalid():
+    rect = rotated_rect(10.0, 5.0, 0.0)
+    with pytest.raises(FieldShapeError) as e:
+        SubplotGrid.from_rectangle(rect, 0, 3)
+    assert e.value.key == "errNoZero"
+    with pytest.raises(FieldShapeError) as e:
+        SubplotGrid.from_rectangle(rect, 2, 3, x_buffer=5.0)
+    assert e.value.key == "errNegative"
+
+
+def test_lattice():
+    rect = rotated_rect(12.0, 6.0, -15.0)
+    # 没有间距时相邻子地块共享格网点
+    shared = SubplotGrid.from_rectangle(rect, 2, 3)
+    assert shared.lattice().shape == (3, 4, 2)
+    # 有间距时每个方向的格网坐标为2n个
+    spaced = SubplotGrid.from_rectangle(rect, 2, 3, 0.4, 0.2)
+    lattice = spaced.lattice()
+    assert lattice.shape == (4, 6, 2)
+    np.testing.assert_allclose(lattice[0, 0], rect[0])
+    np.testing.assert_allclose(lattice[-1, -1], rect[2])
+    np.testing.assert_allclose(spaced.lattice((1, 3)), lattice[1:3])
+
+    # 分批生成与一次生成的子地块相同
+    chunks = list(spaced.iter_cells(3))
+    assert len(chunks) == 2
+    np.testing.assert_allclose(np.concatenate([c for c, _, _ in chunks]), spaced.cells())
+
+
+def test_cells_to_wkb():
+    cells = SubplotGrid.from_rectangle(rotated_rect(8.0, 4.0, 45.0), 2, 2, 0.5, 0.5).cells()
+    wkbs = cells_to_wkb(cells)
+    assert len(wkbs) == len(cells)
+    for wkb, cell in zip(wkbs, cells):
+        assert len(wkb) == 1 + 4 + 4 + 4 + 5 * 16
+        order, geom_type, rings, points = struct.unpack("<BIII", wkb[:13])
+        assert (order, geom_type, rings, points) == (1, 3, 1, 5)
+        coords = np.frombuffer(wkb[13:], dtype="<f8").reshape(5, 2)
+        np.testing.assert_array_equal(coords[:4], cell)
+        np.testing.assert_array_equal(coords[4], cell[0])
+    assert cells_to_wkb(np.empty((0, 4, 2))) == []
+
+
+def test_locate_round_trip():
+    grid = SubplotGrid.from_rectangle(rotated_rect(20.0, 9.0, 30.0), 3, 4, 0.5, 0.25)
+    cells = grid.cells()
+    row_idx, col_idx = grid.indices()
+    row, col, fid = grid.locate(cells.mean(axis=1))
+    np.testing.assert_array_equal(row, row_idx)
+    np.testing.assert_array_equal(col, col_idx)
+    np.testing.assert_array_equal(fid, np.arange(len(cells)))
+
+    # 随机点与逐个子地块的点在多边形内判断一致
+    rng = np.random.default_rng(0)
+    u, v = rng.uniform(-1, 21, 5000), rng.uniform(-1, 10, 5000)
+    points = grid._to_world(u, v)
+    edges = np.roll(cells, -1, axis=1) - cells
+    rel = points[:, None, None, :] - cells[None]
+    cross = edges[None, ..., 0] * rel[..., 1] - edges[None, ..., 1] * rel[..., 0]
+    inside = (cross >= -1e-9).all(axis=2)
+    expected = np.where(inside.any(axis=1), inside.argmax(axis=1), -1)
+    np.testing.assert_array_equal(grid.locate(points)[2], expected)
+
+
+def test_locate_alleys():
+    grid = SubplotGrid.from_rectangle(rotated_rect(20.0, 9.0, 30.0), 3, 4, 0.5, 0.25)
+    width = (20.0 - 3 * 0.5) / 4
+    height = (9.0 - 2 * 0.25) / 3
+    # 列间距, 行间距和网格外的点
+    points = grid._to_world([width + 0.25, 1.0, -0.1, 20.1, 1.0],
+                            [1.0, height + 0.125, 1.0, 1.0, 9.1])
+    for values in grid.locate(points):
+        np.testing.assert_array_equal(values, -1)
+
+
+def test_alley_cells():
+    grid = SubplotGrid.from_rectangle(rotated_rect(20.0, 9.0, 30.0), 3, 4, 0.5, 0.25)
+    cells = grid.cells()
+    alleys = grid.alley_cells()
+    assert alleys.shape == cells.shape
+
+    # 每个子地块向两侧扩展半个间距, 相邻的扩展区域共享边
+    width = (20.0 - 3 * 0.5) / 4
+    height = (9.0 - 2 * 0.25) / 3
+    np.testing.assert_allclose(np.linalg.norm(alleys[:, 1] - alleys[:, 0], axis=1), width + 0.5)
+    np.testing.assert_allclose(np.linalg.norm(alleys[:, 3] - alleys[:, 0], axis=1), height + 0.25)
+    np.testing.assert_allclose(alleys[0, 1], alleys[1, 0])
+    np.testing.assert_allclose(alleys[0, 3], alleys[4, 0])
+    # 子地块位于扩展区域的中心
+    np.testing.assert_allclose(alleys.mean(axis=1), cells.mean(axis=1))
+
+    # 没有间距时与子地块相同
+    tight = SubplotGrid.from_rectangle(rotated_rect(20.0, 9.0, 30.0), 3, 4)
+    np.testing.assert_allclose(tight.alley_cells(), tight.cells())
@@ -0,0 +1,88 @@
+# File: test_layout
+# Author: Haozhou Wang
+# Organization: UTOkyo FieldPhenomics Lab
+# Description:
+#     Fixed plot size layouts (parse_lengths, plot_layout, SubplotGrid.from_plot_size)
+# License: MIT
+
+import numpy as np
+import pytest
+
+from fieldimagepy.batch import BlockSpec, block_count, divide_block
+from fieldimagepy.errors import FieldShapeError
+from fieldimagepy.grid import SubplotGrid, parse_lengths, plot_layout
+
+# 20 m × 11 m的轴对齐矩形, 顶点顺序与min_area_rectangle一致
+RECT = np.array([[0.0, 0.0], [20.0, 0.0], [20.0, 11.0], [0.0, 11.0]])
+
+
+def test_parse_lengths():
+    assert parse_lengths("1.5") == 1.5
+    np.testing.assert_array_equal(parse_lengths("2, 10*1.5, 2"), [2.0] + [1.5] * 10 + [2.0])
+    np.testing.assert_array_equal(parse_lengths("3*1.2"), [1.2] * 3)
+    # 重复次数可写在后面, 逗号和空格均可分隔
+    np.testing.assert_array_equal(parse_lengths("1.2*3 0.5"), [1.2] * 3 + [0.5])
+    with pytest.raises(ValueError):
+        parse_lengths(" , ")
+    with pytest.raises(ValueError):
+        parse_lengths("a, 1")
+
+
+def test_fit_as_many():
+    # rows / cols为空时尽量排满, 剩余边距居中
+    x_sizes, x_gaps, y_sizes, y_gaps, fit = plot_layout(RECT, 1.5, 2.0, 0.5, 0.25)
+    assert (fit.rows, fit.cols) == (5, 10)
+    assert len(x_sizes) == 10 and len(x_gaps) == 9
+    assert len(y_sizes) == 5 and len(y_gaps) == 4
+    assert fit.x_margin == pytest.approx(20.0 - 10 * 1.5 - 9 * 0.5)
+    # 恰好排满时没有剩余边距
+    assert fit.y_margin == pytest.approx(0.0, abs=1e-9)
+    assert fit.x.offset == pytest.approx(fit.x_margin / 2)
+
+
+def test_lengths_list():
+    # 两端较宽的12列: 2 + 10 × 1.5 + 2 = 19 m, 无间距时剩余1 m
+    widths = parse_lengths("2, 10*1.5, 2")
+    x_sizes, _, _, _, fit = plot_layout(RECT, widths, 2.0)
+    assert fit.cols == 12
+    np.testing.assert_array_equal(x_sizes, widths)
+    assert fit.x_margin == pytest.approx(1.0)
+    # 加上间距后放不下的列被舍去
+    _, _, _, _, fit = plot_layout(RECT, widths, 2.0, x_buffer=0.2)
+    assert fit.cols == 11 and fit.x.requested == 12
+
+    with pytest.raises(FieldShapeError) as e:
+        plot_layout(RECT, widths, 2.0, cols=5)
+    assert e.value.key == "errPlotSizes"
+
+
+def test_requested_count():
+    # 指定的行列数超出矩形时只保留能容纳的部分
+    _, _, _, _, fit = plot_layout(RECT, 1.5, 2.0, rows=3, cols=20)
+    assert (fit.rows, fit.cols) == (3, 13)
+    assert fit.x.requested == 20
+    with pytest.raises(FieldShapeError) as e:
+        plot_layout(RECT, 25.0, 2.0)
+    assert e.value.key == "errPlotFit"
+
+
+def test_from_plot_size():
+    grid = SubplotGrid.from_plot_size(RECT, 1.5, 2.0, 0.5, 0.25, align="start")
+    cells = grid.cells()
+    assert grid.shape == (grid.layout.rows, grid.layout.cols) == (5, 10)
+    np.testing.assert_allclose(cells[0, 0], RECT[0])
+    np.testing.assert_allclose(cells[1, 0] - cells[0, 0], [2.0, 0.0])
+    np.testing.assert_allclose(cells[10, 0] - cells[0, 0], [0.0, 2.25])
+
+    centered = SubplotGrid.from_plot_size(RECT, 1.5, 2.0, 0.5, 0.25)
+    np.testing.assert_allclose(centered.cells()[0, 0],
+                               [grid.layout.x_margin / 2, grid.layout.y_margin / 2])
+
+
+def test_block_rows_zero():
+    # 区块的行列数为0表示按尺寸尽量排满
+    block = BlockSpec("A", RECT, 0, 0, 0.5, 0.25, RECT, (parse_lengths("1.5"), 2.0))
+    result = divide_block(block)
+    assert result.grid.shape == (5, 10)
+    assert block_count(block) == 50
+    assert block_count(block._replace(rows=2)) == 20
@@ -0,0 +1,78 @@
+# File: test_minrect
+# Author: Haozhou Wang
+# Organization: UTOkyo FieldPhenomics Lab
+# Description:
+#     Minimum area bounding rectangle (rotating calipers) against a brute force search
+# License: MIT
+
+import numpy as np
+import pytest
+
+from fieldimagepy.minrect import convex_hull, min_area_rectangle
+
+
+def brute_force_area(points):
+    """以任意两点连线为矩形一边方向的最小外接矩形面积, O(n^3)"""
+    best = np.inf
+    for i in range(len(points)):
+        for j in range(i + 1, len(points)):
+            d = points[j] - points[i]
+            if not d.any():
+                continue
+            d = d / np.hypot(*d)
+            u = points @ d
+            v = points @ np.array([-d[1], d[0]])
+            best = min(best, np.ptp(u) * np.ptp(v))
+    return best
+
+
+def random_points(seed, n):
+    rng = np.random.default_rng(seed)
+    points = rng.normal(size=(n, 2)) * [30.0, 8.0]
+    angle = rng.uniform(0, np.pi)
+    rotation = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+    return points @ rotation.T + rng.uniform(-1e5, 1e5, 2)
+
+
+@pytest.mark.parametrize("seed, n", [(0, 5), (1, 12), (2, 40), (3, 80), (4, 150)])
+def test_matches_brute_force(seed, n):
+    points = random_points(seed, n)
+    rect = min_area_rectangle(points)
+    bottom = rect[1] - rect[0]
+    left = rect[3] - rect[0]
+    area = abs(bottom[0] * left[1] - bottom[1] * left[0])
+    assert area == pytest.approx(brute_force_area(points), rel=1e-9)
+
+    # 矩形: 对边相等, 邻边垂直
+    np.testing.assert_allclose(rect[2] - rect[3], bottom, atol=1e-6)
+    np.testing.assert_allclose(rect[2] - rect[1], left, atol=1e-6)
+    assert abs(bottom @ left) <= 1e-9 * np.hypot(*bottom) * np.hypot(*left)
+
+    # 所有点都在矩形内(边上)
+    u = (points - rect[0]) @ bottom / (bottom @ bottom)
+    v = (points - rect[0]) @ left / (left @ left)
+    assert (u >= -1e-9).all() and (u <= 1 + 1e-9).all()
+    assert (v >= -1e-9).all() and (v <= 1 + 1e-9).all()
+
+
+def test_hull_input():
+    points = random_points(5, 60)
+    hull = convex_hull(points)
+    np.testing.assert_allclose(min_area_rectangle(hull, is_hull=True), min_area_rectangle(points))
+    # 闭合的凸包(首尾重复)与不闭合的相同
+    closed = np.vstack([hull, hull[:1]])
+    np.testing.assert_allclose(min_area_rectangle(closed, is_hull=True),
+                               min_area_rectangle(hull, is_hull=True))
+
+
+def test_axis_aligned_square():
+    square = np.array([[0, 0], [4, 0], [4, 4], [0, 4], [2, 2], [1, 3]], dtype=float)
+    rect = min_area_rectangle(square)
+    assert sorted(map(tuple, np.round(rect, 9))) == [(0, 0), (0, 4), (4, 0), (4, 4)]
+
+
+def test_degenerate():
+    assert min_area_rectangle(np.array([[0.0, 0.0], [1.0, 1.0]])) is None
+    # 共线的点没有面积
+    line = np.column_stack([np.arange(5.0), 2 * np.arange(5.0)])
+    assert min_area_rectangle(line) is None
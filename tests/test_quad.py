@@ -0,0 +1,101 @@
+# File: test_quad
+# Author: Haozhou Wang
+# Organization: UTOkyo FieldPhenomics Lab
+# Description:
+#     Quadrilateral (bilinear) mode on closed polygon rings, from BlockSpec and from a layer
+# License: MIT
+
+import numpy as np
+import pytest
+
+from fieldimagepy import BlockSpec, FieldShapeError, QuadGrid, divide_block
+
+# 闭合环(最后一个点与起点相同), 与QgsGeometry的外环一致
+TRAPEZOID = [(0.0, 0.0), (10.0, 0.0), (8.0, 5.0), (1.0, 6.0), (0.0, 0.0)]
+CONCAVE = [(0.0, 0.0), (10.0, 0.0), (3.0, 3.0), (1.0, 6.0), (0.0, 0.0)]
+
+
+def ring_area(points):
+    x, y = np.asarray(points, dtype=float)[..., 0], np.asarray(points, dtype=float)[..., 1]
+    return 0.5 * np.abs(np.sum(x * np.roll(y, -1, -1) - np.roll(x, -1, -1) * y, axis=-1))
+
+
+def test_closed_ring():
+    result = divide_block(BlockSpec(1, TRAPEZOID, 3, 4, 0.0, 0.0, quad=True))
+    assert isinstance(result.grid, QuadGrid)
+    cells = result.grid.cells()
+    assert cells.shape == (12, 4, 2)
+    # 子地块填满四边形本身
+    assert ring_area(cells).sum() == pytest.approx(ring_area(TRAPEZOID[:4]))
+
+
+def test_open_ring_matches_closed():
+    closed = divide_block(BlockSpec(1, TRAPEZOID, 3, 4, 0.5, 0.5, quad=True)).grid.cells()
+    opened = divide_block(BlockSpec(1, TRAPEZOID[:4], 3, 4, 0.5, 0.5, quad=True)).grid.cells()
+    np.testing.assert_allclose(closed, opened)
+
+
+def test_concave_quad():
+    with pytest.raises(FieldShapeError) as info:
+        divide_block(BlockSpec(1, CONCAVE, 3, 4, 0.0, 0.0, quad=True))
+    assert info.value.key == "errQuadConvex"
+
+
+def test_locate_round_trip():
+    grid = divide_block(BlockSpec(1, TRAPEZOID, 3, 4, 0.2, 0.2, quad=True)).grid
+    row, col, index = grid.locate(grid.cells().mean(axis=1))
+    np.testing.assert_array_equal(index, np.arange(12))
+
+
+def inside_convex(points, polygon):
+    """点是否在凸多边形(含边界)内"""
+    edges = np.roll(polygon, -1, axis=0) - polygon
+    d = points[:, None, :] - polygon[None]
+    cross = edges[None, :, 0] * d[..., 1] - edges[None, :, 1] * d[..., 0]
+    return (cross >= 0).all(axis=1) | (cross <= 0).all(axis=1)
+
+
+def test_tagging_matches_cells():
+    # 点的标注(逆变换)与写出的子地块多边形一致, 行列间距内和四边形外的点为-1
+    grid = divide_block(BlockSpec(1, TRAPEZOID, 3, 4, 0.3, 0.4, quad=True)).grid
+    points = np.random.default_rng(0).uniform([-1, -1], [11, 7], (5000, 2))
+    truth = np.full(len(points), -1)
+    for k, cell in enumerate(grid.cells()):
+        truth[inside_convex(points, cell)] = k
+    row, col, index = grid.locate(points)
+    np.testing.assert_array_equal(index, truth)
+    np.testing.assert_array_equal(row[index >= 0] * 4 + col[index >= 0], index[index >= 0])
+
+
+@pytest.fixture(scope="module")
+def qgis_app():
+    core = pytest.importorskip("qgis.core")
+    app = core.QgsApplication.instance()
+    if app is None:
+        app = core.QgsApplication([], False)
+        app.initQgis()
+    return app
+
+
+def test_divide_source_closed_quad(qgis_app):
+    from qgis.core import QgsFeature, QgsGeometry, QgsPointXY, QgsVectorLayer
+    from fieldimagepy import api
+
+    layer = QgsVectorLayer("Polygon?crs=EPSG:32654", "block", "memory")
+    feature = QgsFeature()
+    feature.setGeometry(QgsGeometry.fromPolygonXY([[QgsPointXY(x, y) for x, y in TRAPEZOID]]))
+    layer.dataProvider().addFeatures([feature])
+
+    blocks = api.collect_blocks(layer, 3, 4, quad=True)
+    assert len(blocks[0].hull) == 5  # 外环自身的顶点, 闭合
+
+    fields, features = api.divide_source(layer, 3, 4, quad=True)
+    assert len(features) == 12
+    area = sum(f.geometry().area() for f in features)
+    assert area == pytest.approx(ring_area(TRAPEZOID[:4]))
+
+    # 标注使用同一网格: 每个子地块中心点的id与写出的id字段一致
+    _, results = api.prepare_subplots(layer, 3, 4, quad=True)
+    centers = [f.geometry().centroid().asPoint() for f in features]
+    fid = api.locate_points(results, [(p.x(), p.y()) for p in centers])[3]
+    assert list(fid) == [f["id"] for f in features]